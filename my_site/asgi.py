@@ -2,6 +2,10 @@
 ASGI config for my_site project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Production serves this (gunicorn with uvicorn workers) so the notification
+stream holds an idle coroutine per client rather than a worker thread.
+Streamed exports and downloads build their bodies with ``pages.streaming``;
+a plain iterator would be read into memory whole before it is sent.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -14,3 +18,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'my_site.settings')
 
 application = get_asgi_application()
+
+# Scheduled rental transitions run here so they update this process's caches;
+# every worker starts the thread, but only the one holding the lease runs them
+from pages.lifecycle import start_scheduler
+start_scheduler()
@@ -1,30 +1,251 @@
 """
 Custom middleware for serving media files in production
 """
+from collections import OrderedDict
 from django.conf import settings
-from django.http import FileResponse, Http404
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import Http404, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_http_date_safe
+import mimetypes
 import os
+import re
+import stat
+import threading
+import time
+
+from pages.streaming import file_response, streaming_response
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+class StatCache:
+    """
+    Small LRU of ``path -> os.stat_result`` (or None when missing) with a TTL,
+    so repeated hits on the same media file skip the filesystem calls
+    """
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(path)
+                return entry[1]
+
+        try:
+            result = os.stat(path)
+            if not stat.S_ISREG(result.st_mode):
+                result = None
+        except OSError:
+            result = None
+
+        with self._lock:
+            self._entries[path] = (now + self.ttl, result)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return result
+
+    def evict(self, path):
+        with self._lock:
+            self._entries.pop(path, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def _etag_matches(header, etag):
+    if header.strip() == '*':
+        return True
+    # Weak comparison: W/"x" matches "x"
+    candidates = [tag.strip() for tag in header.split(',')]
+    return any(tag.removeprefix('W/') == etag for tag in candidates)
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def _parse_range(header, size):
+    """
+    Return ``(start, end)`` (inclusive) for a single byte range, or None when
+    the header should be ignored (malformed, or several ranges) and the whole
+    file served. Raises RangeNotSatisfiable for a valid range outside the file
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if first and last and int(last) < int(first):
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable
+        return max(size - length, 0), size - 1
+    start = int(first)
+    if start >= size:
+        raise RangeNotSatisfiable
+    end = int(last) if last else size - 1
+    return start, min(end, size - 1)
+
+
+def _validators(stat):
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"', http_date(stat.st_mtime)
+
+
+def _read_range(fh, start, length):
+    with fh:
+        fh.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = fh.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
 
 
 class ServeMediaMiddleware:
     """
     Middleware to serve media files in production when Cloudinary is not configured
+
+    Answers conditional requests (If-None-Match / If-Modified-Since) with 304,
+    serves single byte ranges, and sets long-lived cache headers. Set
+    MEDIA_SENDFILE to 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache,
+    lighttpd) to let the front proxy copy the bytes instead.
     """
     def __init__(self, get_response):
         self.get_response = get_response
+        self.stat_cache = StatCache(
+            getattr(settings, 'MEDIA_STAT_CACHE_SIZE', 1024),
+            getattr(settings, 'MEDIA_STAT_CACHE_TTL', 60),
+        )
 
     def __call__(self, request):
         # Only serve media files if not in DEBUG mode and path starts with MEDIA_URL
         if not settings.DEBUG and request.path.startswith(settings.MEDIA_URL):
-            # Get the file path
-            media_path = request.path[len(settings.MEDIA_URL):]
-            file_path = os.path.join(settings.MEDIA_ROOT, media_path)
-            
-            # Check if file exists
-            if os.path.exists(file_path) and os.path.isfile(file_path):
-                return FileResponse(open(file_path, 'rb'))
-            else:
-                raise Http404("Media file not found")
-        
+            return self.serve(request, request.path[len(settings.MEDIA_URL):])
+
         response = self.get_response(request)
         return response
+
+    def serve(self, request, media_path):
+        # Get the file path, refusing anything that escapes MEDIA_ROOT
+        try:
+            file_path = safe_join(settings.MEDIA_ROOT, media_path)
+        except SuspiciousFileOperation:
+            raise Http404("Media file not found")
+        # Report artifacts may share the media disk but are staff-only
+        if file_path.startswith(os.path.join(os.path.abspath(settings.REPORT_ARTIFACT_ROOT), '')):
+            raise Http404("Media file not found")
+
+        stat = self.stat_cache.get(file_path)
+        if stat is None:
+            raise Http404("Media file not found")
+
+        etag, last_modified = _validators(stat)
+        if self.not_modified(request, etag, stat.st_mtime):
+            response = HttpResponseNotModified()
+            for header, value in self.cache_headers(etag, last_modified).items():
+                response[header] = value
+            return response
+
+        sendfile = getattr(settings, 'MEDIA_SENDFILE', None)
+        range_header = request.headers.get('Range')
+        fh = None
+        if not sendfile or range_header:
+            # The cached stat may be up to MEDIA_STAT_CACHE_TTL old: size and
+            # validators of the body come from the file actually opened
+            try:
+                fh = open(file_path, 'rb')
+            except OSError:
+                self.stat_cache.evict(file_path)
+                raise Http404("Media file not found")
+            opened = os.fstat(fh.fileno())
+            if (opened.st_size, opened.st_mtime_ns) != (stat.st_size, stat.st_mtime_ns):
+                self.stat_cache.evict(file_path)
+                stat = opened
+                etag, last_modified = _validators(stat)
+        headers = self.cache_headers(etag, last_modified)
+
+        content_type, encoding = mimetypes.guess_type(file_path)
+        content_type = content_type or 'application/octet-stream'
+
+        byte_range = None
+        if range_header and self.range_applies(request, etag, last_modified):
+            try:
+                byte_range = _parse_range(range_header, stat.st_size)
+            except RangeNotSatisfiable:
+                fh.close()
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{stat.st_size}'
+                response['Accept-Ranges'] = 'bytes'
+                return response
+
+        if sendfile and byte_range is None:
+            if fh is not None:
+                fh.close()
+            # The proxy handles ranges and the byte copy itself
+            response = HttpResponse(content_type=content_type)
+            if sendfile == 'x-accel-redirect':
+                prefix = getattr(settings, 'MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+                response['X-Accel-Redirect'] = prefix + media_path.lstrip('/')
+            else:
+                response['X-Sendfile'] = file_path
+        elif byte_range is not None:
+            start, end = byte_range
+            length = end - start + 1
+            response = streaming_response(
+                request, _read_range(fh, start, length), status=206, content_type=content_type
+            )
+            response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+            response['Content-Length'] = str(length)
+        else:
+            response = file_response(request, fh, content_type=content_type)
+            response['Content-Length'] = str(stat.st_size)
+
+        if encoding:
+            response['Content-Encoding'] = encoding
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+    @staticmethod
+    def cache_headers(etag, last_modified):
+        return {
+            'ETag': etag,
+            'Last-Modified': last_modified,
+            'Cache-Control': f"public, max-age={getattr(settings, 'MEDIA_CACHE_MAX_AGE', 60 * 60 * 24 * 30)}",
+            'Accept-Ranges': 'bytes',
+        }
+
+    @staticmethod
+    def not_modified(request, etag, mtime):
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match is not None:
+            return _etag_matches(if_none_match, etag)
+        if_modified_since = request.headers.get('If-Modified-Since')
+        if if_modified_since:
+            since = parse_http_date_safe(if_modified_since)
+            return since is not None and int(mtime) <= since
+        return False
+
+    @staticmethod
+    def range_applies(request, etag, last_modified):
+        # If-Range: only honour the range when the validator still matches
+        if_range = request.headers.get('If-Range')
+        if not if_range:
+            return True
+        return if_range.strip() in (etag, last_modified)
@@ -80,6 +80,7 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'pages.context_processors.unread_notifications_count',
+                'pages.context_processors.notification_stream',
             ],
         },
     },
@@ -95,10 +96,38 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Take the write lock when a transaction starts, so concurrent
+            # bookings queue up instead of failing with "database is locked"
+            'transaction_mode': 'IMMEDIATE',
+            # Seconds to wait for that lock
+            'timeout': 20,
+        },
     }
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Per-process memory cache; point this at Redis/Memcached when running several workers
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'brorent',
+    }
+}
+
+# Fan-out for the live notification stream; the in-process broker only
+# reaches clients connected to the same server process
+NOTIFICATION_BROKER = 'pages.events.InProcessBroker'
+
+# Seconds between runs of the rental scheduler (pages.lifecycle) on a thread
+# of the web process; 0 disables it, e.g. when run_scheduler runs elsewhere
+# against a shared cache and broker
+SCHEDULER_INTERVAL = float(os.environ.get('SCHEDULER_INTERVAL', 60))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -165,6 +194,31 @@ cloudinary.config(
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# ServeMediaMiddleware: browser cache lifetime, stat cache bounds, and optional
+# hand-off to a front proxy ('x-accel-redirect' for nginx, 'x-sendfile' for Apache)
+MEDIA_CACHE_MAX_AGE = 60 * 60 * 24 * 30
+MEDIA_STAT_CACHE_SIZE = 1024
+MEDIA_STAT_CACHE_TTL = 60
+MEDIA_SENDFILE = os.environ.get('MEDIA_SENDFILE') or None
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+
+# Background report jobs: worker processes started by the web process
+# (0 runs jobs inline after the request commits) and where finished
+# reports are kept. The directory is private: even on the media disk it
+# is never served under MEDIA_URL.
+REPORT_JOB_WORKERS = int(os.environ.get('REPORT_JOB_WORKERS', 2))
+REPORT_ARTIFACT_ROOT = os.environ.get('REPORT_ARTIFACT_ROOT', os.path.join(BASE_DIR, 'report_artifacts'))
+# Total size of rendered reports kept in the cache for repeat downloads
+REPORT_CACHE_MAX_BYTES = 50 * 1024 * 1024
+# Worker processes that build the six reports of an "export everything"
+# bundle side by side (0 builds them on threads of the web process)
+REPORT_BUNDLE_WORKERS = int(os.environ.get('REPORT_BUNDLE_WORKERS', 6))
+# Both worker pools start on first use and stop after this many idle seconds
+REPORT_POOL_IDLE_TIMEOUT = int(os.environ.get('REPORT_POOL_IDLE_TIMEOUT', 300))
+# Days deleted rows are remembered for delta exports; older watermarks
+# need a full export
+TOMBSTONE_RETENTION_DAYS = int(os.environ.get('TOMBSTONE_RETENTION_DAYS', 30))
+
 # Use Cloudinary in production if credentials are provided
 if not DEBUG and CLOUDINARY_STORAGE['CLOUD_NAME']:
     DEFAULT_FILE_STORAGE = 'cloudinary_storage.storage.MediaCloudinaryStorage'
@@ -14,6 +14,11 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'my_site.settings')
 
 application = get_wsgi_application()
 
+# Scheduled rental transitions run here so they update this process's caches;
+# every worker starts the thread, but only the one holding the lease runs them
+from pages.lifecycle import start_scheduler
+start_scheduler()
+
 # Wrap with WhiteNoise for static files in production
 from whitenoise import WhiteNoise
 application = WhiteNoise(application)
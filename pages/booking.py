@@ -0,0 +1,225 @@
+# pages/booking.py
+"""
+Booking engine: rental requests and the lender's accept/reject decisions.
+
+Each operation runs in one transaction that first locks the item's row
+with ``select_for_update()``. Bookings of the same item are therefore
+decided one at a time, while bookings of other items go ahead in
+parallel. SQLite has no row locks; its connections open transactions with
+``BEGIN IMMEDIATE`` (see DATABASES), so the first write lock has the same
+effect there. Under that lock the overlap check is a single query on the
+``(item, status, start_date, end_date)`` index. No two approved or
+borrowed rentals of an item can cover the same day.
+
+``accept_rentals`` and ``reject_rentals`` decide many requests at once:
+one conditional UPDATE for the rentals and one bulk_create for the
+notifications, with the work of the skipped signals done by hand.
+
+The unread counters, search cache and live notification pushes these
+operations update belong to the calling process with the default
+per-process CACHES and NOTIFICATION_BROKER, so call them from the web
+process (as the views do) unless both are shared.
+"""
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import notifications, rollups, search
+from .models import Item, Notification, Rental
+
+
+class BookingError(Exception):
+    """A booking that cannot go ahead; the message is shown to the user."""
+
+
+def _lock_item(item_id):
+    return Item.objects.select_for_update().get(pk=item_id)
+
+
+def _conflicts(item_id, start, end, exclude=None):
+    bookings = Rental.objects.filter(item_id=item_id).bookings().overlapping(start, end)
+    if exclude is not None:
+        bookings = bookings.exclude(pk=exclude)
+    return bookings.exists()
+
+
+def request_rental(item_id, borrower, start_date, end_date, notes=''):
+    """Create a pending rental of the item for ``start_date``..``end_date`` and notify the owner."""
+    with transaction.atomic():
+        item = _lock_item(item_id)
+        if borrower.pk == item.owner_id:
+            raise BookingError("You cannot rent your own item.")
+        if not item.is_available:
+            raise BookingError("This item is not available for rent.")
+        if Rental.objects.filter(item=item, borrower=borrower, status__in=Rental.OPEN_STATUSES).exists():
+            raise BookingError("You already have an active or pending rental request for this item.")
+        if _conflicts(item.pk, start_date, end_date):
+            raise BookingError("This item is already booked for some of those dates.")
+
+        rental = Rental(
+            item=item,
+            borrower=borrower,
+            lender_id=item.owner_id,
+            start_date=start_date,
+            end_date=end_date,
+            notes=notes,
+            status='pending',
+        )
+        rental.save()
+        Notification.objects.create(
+            user_id=item.owner_id,
+            rental=rental,
+            type='rental_request',
+            message=f"{borrower.username} wants to rent your {item.name}."
+        )
+    return rental
+
+
+def _decide(rental_id, lender, action):
+    # Lock the item first, then re-read the rental, so two decisions on the
+    # same item never interleave
+    item_id = Rental.objects.filter(pk=rental_id).values_list('item_id', flat=True).first()
+    if item_id is None:
+        raise Rental.DoesNotExist
+    item = _lock_item(item_id)
+    rental = Rental.objects.get(pk=rental_id)
+    rental.item = item
+    if lender.pk != rental.lender_id:
+        raise BookingError(f"You don't have permission to {action} this request.")
+    if rental.status != 'pending':
+        raise BookingError("This rental request has already been processed.")
+    return rental
+
+
+def accept_rental(rental_id, lender):
+    """Approve a pending rental unless its dates clash with another booking of the item."""
+    with transaction.atomic():
+        rental = _decide(rental_id, lender, 'accept')
+        if _conflicts(rental.item_id, rental.start_date, rental.end_date, exclude=rental.pk):
+            raise BookingError("Those dates overlap a rental you have already approved.")
+        rental.status = 'approved'
+        rental.approved_date = timezone.now()
+        rental.save()
+        Notification.objects.create(
+            user_id=rental.borrower_id,
+            rental=rental,
+            type='request_approved',
+            message=f"Your rental request for {rental.item.name} has been approved!"
+        )
+    return rental
+
+
+def reject_rental(rental_id, lender):
+    """Reject a pending rental."""
+    with transaction.atomic():
+        rental = _decide(rental_id, lender, 'reject')
+        rental.status = 'rejected'
+        rental.save()
+        Notification.objects.create(
+            user_id=rental.borrower_id,
+            rental=rental,
+            type='request_rejected',
+            message=f"Your rental request for {rental.item.name} has been rejected."
+        )
+    return rental
+
+
+def _lock_pending(rental_ids, lender):
+    # Same lock order as _decide: the items first (by pk, so two bulk
+    # decisions cannot deadlock), then the rentals are re-read under it
+    pending = Rental.objects.filter(pk__in=rental_ids, lender=lender, status='pending')
+    item_ids = sorted(set(pending.values_list('item_id', flat=True)))
+    list(Item.objects.select_for_update().filter(pk__in=item_ids).order_by('pk').values_list('pk'))
+    return list(pending.select_related('item').order_by('request_date', 'pk'))
+
+
+def _apply(rentals, status, notification_type, message, **fields):
+    """Move ``rentals`` from pending to ``status`` and notify their borrowers.
+
+    Returns the rentals that were still pending and so were moved.
+    """
+    if not rentals:
+        return rentals
+    now = timezone.now()
+    updated = Rental.objects.filter(pk__in=[r.pk for r in rentals], status='pending').update(
+        status=status, updated_at=now, **fields
+    )
+    if updated != len(rentals):
+        # Some were decided elsewhere meanwhile: record only the rows moved here
+        moved = set(
+            Rental.objects.filter(pk__in=[r.pk for r in rentals], status=status, updated_at=now)
+            .values_list('pk', flat=True)
+        )
+        rentals = [rental for rental in rentals if rental.pk in moved]
+    # QuerySet.update() sends no post_save
+    for day, count in Counter(rollups.rollup_day(r) for r in rentals).items():
+        rollups.record_status_change(day, 'pending', status, count)
+    search.bump_rental_version()
+
+    for rental in rentals:
+        rental.status = status
+        rental.updated_at = now
+        for name, value in fields.items():
+            setattr(rental, name, value)
+        rental._rollup_status = status
+    notifications.create_many([
+        Notification(
+            user_id=rental.borrower_id,
+            rental=rental,
+            type=notification_type,
+            message=message.format(item=rental.item.name),
+        )
+        for rental in rentals
+    ])
+    return rentals
+
+
+def accept_rentals(rental_ids, lender):
+    """Approve many of the lender's pending rentals in one transaction.
+
+    Requests are taken oldest first; one whose dates clash with a booking,
+    or with a request approved earlier in the same batch, stays pending.
+    Ids that are not the lender's pending requests are ignored. Returns
+    ``(approved, clashing)`` lists of rentals.
+    """
+    with transaction.atomic():
+        pending = _lock_pending(rental_ids, lender)
+        if not pending:
+            return [], []
+        booked = defaultdict(list)
+        existing = Rental.objects.filter(item_id__in={r.item_id for r in pending}).bookings().overlapping(
+            min(r.start_date for r in pending), max(r.end_date for r in pending)
+        )
+        for item_id, start, end in existing.values_list('item_id', 'start_date', 'end_date'):
+            booked[item_id].append((start, end))
+
+        approved, clashing = [], []
+        for rental in pending:
+            ranges = booked[rental.item_id]
+            if any(start <= rental.end_date and end >= rental.start_date for start, end in ranges):
+                clashing.append(rental)
+                continue
+            ranges.append((rental.start_date, rental.end_date))
+            approved.append(rental)
+
+        approved = _apply(
+            approved, 'approved', 'request_approved',
+            "Your rental request for {item} has been approved!",
+            approved_date=timezone.now(),
+        )
+    return approved, clashing
+
+
+def reject_rentals(rental_ids, lender):
+    """Reject many of the lender's pending rentals in one transaction.
+
+    Ids that are not the lender's pending requests are ignored. Returns the
+    rejected rentals.
+    """
+    with transaction.atomic():
+        pending = _lock_pending(rental_ids, lender)
+        return _apply(
+            pending, 'rejected', 'request_rejected',
+            "Your rental request for {item} has been rejected.",
+        )
@@ -0,0 +1,175 @@
+# pages/bundle.py
+"""
+"Export everything": all six reports in one ZIP.
+
+The reports are written concurrently by a pool of worker processes
+(started on demand, see ``pools``), or by one thread per report in this
+process when REPORT_BUNDLE_WORKERS is 0. All of them must describe the same
+moment, so the database is first copied with SQLite's online backup API.
+That copy is taken under a single read lock, and the reports are read
+from it instead of the live database, so no transaction holds the write
+lock while they are built. Each finished report is added to the ZIP as
+soon as it is ready, and the ZIP is streamed out as it is written. With
+a pool the download takes about as long as the slowest report, not the
+sum of all six; threads share the GIL, so they only overlap the database
+reads, but they still send each report as soon as it is done.
+"""
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.db import connection
+from django.db.transaction import TransactionManagementError
+
+from . import reports
+from .pools import IdleProcessPool
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_NAME = 'snapshot.sqlite3'
+
+_pool = IdleProcessPool('REPORT_BUNDLE_WORKERS')
+
+
+def snapshot_database(path):
+    """Copy the database to ``path`` as it is at this instant."""
+    if connection.vendor != 'sqlite':
+        raise NotImplementedError('Report bundles snapshot the database with the SQLite backup API')
+    if connection.in_atomic_block:
+        # The backup would wait forever on this connection's own write lock
+        raise TransactionManagementError('A database snapshot cannot be taken inside a transaction.')
+    connection.ensure_connection()
+    target = sqlite3.connect(path)
+    try:
+        connection.connection.backup(target)
+    finally:
+        target.close()
+
+
+def _write_report(kind, path):
+    _, _, writer = reports.REPORTS[kind]
+    with open(path, 'wb') as output:
+        writer(output)
+
+
+def _write_report_from_snapshot(snapshot, kind, path):
+    """Pool task: write one report, reading from ``snapshot`` instead of the live database."""
+    name = connection.settings_dict['NAME']
+    connection.close()
+    connection.settings_dict['NAME'] = snapshot
+    try:
+        _write_report(kind, path)
+    finally:
+        # Workers are reused, so point them back at the live database
+        connection.close()
+        connection.settings_dict['NAME'] = name
+
+
+def _report_paths(directory):
+    return {kind: os.path.join(directory, filename) for kind, (filename, _, _) in reports.REPORTS.items()}
+
+
+def _write_report_on_thread(snapshot, kind, path):
+    """Thread task: write one report through this thread's own connection to ``snapshot``.
+
+    Connections are per thread, so the request's connection is untouched.
+    """
+    connection.settings_dict = {**connection.settings_dict, 'NAME': snapshot}
+    try:
+        _write_report(kind, path)
+    finally:
+        connection.close()
+
+
+def _as_completed(futures):
+    for future in as_completed(futures):
+        kind, path = futures[future]
+        try:
+            future.result()
+        except Exception as exc:
+            logger.error('Bundled report %s failed: %s', kind, exc)
+            yield kind, None, exc
+        else:
+            yield kind, path, None
+
+
+def build_reports(directory):
+    """Start writing every report into ``directory``.
+
+    Returns an iterator of ``(kind, path, error)`` in the order the reports
+    finish. With REPORT_BUNDLE_WORKERS set to 0 they are written on threads
+    of this process instead, one per report, from the same snapshot.
+    """
+    paths = _report_paths(directory)
+    snapshot = os.path.join(directory, SNAPSHOT_NAME)
+    snapshot_database(snapshot)
+    if settings.REPORT_BUNDLE_WORKERS <= 0:
+        executor = ThreadPoolExecutor(max_workers=len(paths), thread_name_prefix='report-bundle')
+        task = _write_report_on_thread
+    else:
+        executor = _pool
+        task = _write_report_from_snapshot
+
+    futures = {executor.submit(task, snapshot, kind, path): (kind, path) for kind, path in paths.items()}
+    if executor is not _pool:
+        # Lets the threads exit once the submitted reports are done
+        executor.shutdown(wait=False)
+    return _as_completed(futures)
+
+
+class _ZipSink:
+    """Write-only file object that buffers what ZipFile writes until it is taken."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def stream_zip(directory, results):
+    """Yield a ZIP of the finished reports, then remove ``directory``."""
+    sink = _ZipSink()
+    errors = []
+    try:
+        # PDF and xlsx files are compressed already; deflating them again gains little
+        with zipfile.ZipFile(sink, 'w', zipfile.ZIP_STORED) as archive:
+            for kind, path, error in results:
+                filename = reports.REPORTS[kind][0]
+                if error is not None:
+                    errors.append(f'{filename}: {type(error).__name__}: {error}')
+                    continue
+                with open(path, 'rb') as source, archive.open(filename, 'w') as target:
+                    while chunk := source.read(reports.STREAM_CHUNK_SIZE):
+                        target.write(chunk)
+                        yield sink.take()
+            if errors:
+                archive.writestr('errors.txt', '\n'.join(errors) + '\n')
+        yield sink.take()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def export_bundle():
+    """Start building every report and return the stream of the ZIP."""
+    directory = tempfile.mkdtemp(prefix='report_bundle_')
+    try:
+        results = build_reports(directory)
+    except Exception:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+    return stream_zip(directory, results)
@@ -1,19 +1,46 @@
-from typing import Dict
+from typing import Callable, Dict
 
+from django.core.handlers.asgi import ASGIRequest
 
-def unread_notifications_count(request) -> Dict[str, int]:
+
+class LazyUnreadCount:
+    """Unread count resolved on first use.
+
+    Django templates call callables when they resolve a variable, so pages
+    that never show the badge never touch the session, user or counter.
+    """
+    def __init__(self, request):
+        self.request = request
+        self._value = None
+
+    def __call__(self) -> int:
+        if self._value is None:
+            self._value = self._resolve()
+        return self._value
+
+    def _resolve(self) -> int:
+        user = getattr(self.request, 'user', None)
+        if not user or not user.is_authenticated or not user.pk:
+            return 0
+
+        # Lazy import to avoid circulars during app loading
+        from .notifications import get_unread_count
+
+        return get_unread_count(user.pk)
+
+
+def unread_notifications_count(request) -> Dict[str, Callable[[], int]]:
     """Provide unread notifications count globally in templates.
 
     Returns 0 for anonymous users.
     """
-    user = getattr(request, 'user', None)
-    if not user or not user.is_authenticated or not user.pk:
-        return {"unread_notifications_count": 0}
+    return {"unread_notifications_count": LazyUnreadCount(request)}
 
-    # Lazy import to avoid circulars during app loading
-    from .models import Notification
-
-    count = Notification.objects.filter(user=user, read=False).count()
-    return {"unread_notifications_count": count}
 
+def notification_stream(request) -> Dict[str, bool]:
+    """Live notification stream settings for the badge script.
 
+    The stream holds its connection open, so it is only offered when the
+    request came through ASGI; under WSGI it would pin a worker thread.
+    """
+    return {"notification_stream_enabled": isinstance(request, ASGIRequest)}
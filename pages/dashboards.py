@@ -0,0 +1,62 @@
+# pages/dashboards.py
+"""
+"My rentals" and "My lendings" dashboards.
+
+A dashboard costs a fixed number of queries, however long the user's
+history is. One conditional aggregate counts the rentals in every status.
+One query loads the open ones (pending, approved, borrowed), which are
+grouped by status in Python. Returned and rejected history is shown
+HISTORY_PAGE_SIZE rentals at a time, newest first, with keyset pagination
+on the (user, status, -request_date) indexes.
+"""
+from django.db.models import Count, Q
+
+from .models import Rental
+from .pagination import InvalidCursor, paginate
+
+HISTORY_PAGE_SIZE = 20
+# Closed statuses shown as paginated history, each with its own cursor
+HISTORY_STATUSES = ['returned', 'rejected']
+
+
+def status_counts(rentals):
+    """Number of ``rentals`` in each status, in one query."""
+    return rentals.aggregate(**{
+        status: Count('pk', filter=Q(status=status)) for status, _ in Rental.STATUS_CHOICES
+    })
+
+
+def open_by_status(rentals):
+    """Open ``rentals`` grouped by status, newest first, from one query."""
+    grouped = {status: [] for status in Rental.OPEN_STATUSES}
+    for rental in rentals.filter(status__in=Rental.OPEN_STATUSES).order_by('-request_date', '-pk'):
+        grouped[rental.status].append(rental)
+    return grouped
+
+
+def history_page(rentals, status, cursor=None):
+    """Return ``(page, next_cursor)`` of ``rentals`` in ``status``; a bad cursor restarts at the newest."""
+    rentals = rentals.filter(status=status)
+    try:
+        return paginate(rentals, 'request_date', True, cursor, HISTORY_PAGE_SIZE)
+    except InvalidCursor:
+        return paginate(rentals, 'request_date', True, None, HISTORY_PAGE_SIZE)
+
+
+def dashboard(rentals, related, cursors):
+    """Everything a dashboard shows for ``rentals``.
+
+    ``related`` are the select_related() fields its cards need, and
+    ``cursors`` maps history statuses to the cursor of the page to show.
+    """
+    listed = rentals.select_related(*related)
+    history = {
+        status: history_page(listed, status, cursors.get(status))
+        for status in HISTORY_STATUSES
+    }
+    return {
+        'counts': status_counts(rentals),
+        'open': open_by_status(listed),
+        'history': {status: page for status, (page, _) in history.items()},
+        'next_cursors': {status: next_cursor for status, (_, next_cursor) in history.items()},
+    }
@@ -0,0 +1,143 @@
+# pages/events.py
+"""
+Live notification fan-out for the server-sent events stream.
+
+A broker delivers events for a user to every open stream of that user.
+The default ``InProcessBroker`` keeps one asyncio queue per connection in
+this process; set NOTIFICATION_BROKER to the dotted path of another class
+with the same ``subscribe``/``unsubscribe``/``publish`` methods (e.g. one
+backed by Redis pub/sub) when running several server processes.
+"""
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# Events buffered per connection before the oldest are dropped
+MAX_QUEUED_EVENTS = 100
+# Comment frames keep idle connections open through proxies
+HEARTBEAT_SECONDS = 25
+# Notifications replayed after a reconnect with Last-Event-ID
+MAX_REPLAYED_EVENTS = 50
+
+
+class InProcessBroker:
+    """Fan-out to asyncio queues of streams connected to this process."""
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        """Register a stream; must be called from the event loop that will read it."""
+        queue = asyncio.Queue(maxsize=MAX_QUEUED_EVENTS)
+        subscription = (asyncio.get_running_loop(), queue)
+        with self._lock:
+            self._subscribers[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, user_id, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[user_id]
+
+    def publish(self, user_id, event):
+        """Deliver ``event`` to every stream of ``user_id``. Safe to call from any thread."""
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for subscription in subscribers:
+            loop, queue = subscription
+            try:
+                loop.call_soon_threadsafe(_put_dropping_oldest, queue, event)
+            except RuntimeError:
+                # The stream's event loop has shut down
+                self.unsubscribe(user_id, subscription)
+
+    def connection_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+
+def _put_dropping_oldest(queue, event):
+    # A stalled client must not grow memory without bound
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(event)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                path = getattr(settings, 'NOTIFICATION_BROKER', 'pages.events.InProcessBroker')
+                _broker = import_string(path)()
+    return _broker
+
+
+def set_broker(broker):
+    """Swap the active broker (used by tests and alternative deployments)."""
+    global _broker
+    _broker = broker
+
+
+def notification_event(notification):
+    return {
+        'id': notification.pk,
+        'type': notification.type,
+        'type_display': notification.get_type_display(),
+        'message': notification.message,
+        'rental_id': notification.rental_id,
+        'created_at': notification.created_at.isoformat(),
+    }
+
+
+def format_sse(event):
+    """Encode one notification as an SSE frame."""
+    return f"id: {event['id']}\nevent: notification\ndata: {json.dumps(event)}\n\n"
+
+
+async def stream_notifications(user_id, last_event_id=None, heartbeat=HEARTBEAT_SECONDS):
+    """Async generator of SSE frames for ``user_id``.
+
+    Subscribes before replaying anything newer than ``last_event_id``, so
+    no notification created during a reconnect is lost.
+    """
+    from .models import Notification
+
+    broker = get_broker()
+    subscription = broker.subscribe(user_id)
+    _, queue = subscription
+    try:
+        yield 'retry: 5000\n\n'
+
+        replayed = set()
+        if last_event_id is not None:
+            missed = Notification.objects.filter(user_id=user_id, pk__gt=last_event_id).order_by('pk')
+            async for notification in missed[:MAX_REPLAYED_EVENTS]:
+                replayed.add(notification.pk)
+                yield format_sse(notification_event(notification))
+
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            # Skip anything the replay already delivered
+            if event['id'] in replayed:
+                replayed.discard(event['id'])
+                continue
+            yield format_sse(event)
+    finally:
+        broker.unsubscribe(user_id, subscription)
@@ -0,0 +1,238 @@
+# pages/exports.py
+"""
+Streaming rental export for analytics (CSV or NDJSON).
+
+Rows are read with ``QuerySet.iterator()``, which uses a server-side cursor
+where the database has one. They are encoded a batch at a time and yielded
+straight into a streaming response, optionally through a gzip
+compressor. The first bytes go out before the query has finished, and the
+full result is never held in memory. Under ASGI the views wrap the
+generator with ``streaming.streaming_response``, which advances it one
+chunk at a time.
+
+Delta exports serve incremental syncs. They carry only rows whose
+``updated_at`` falls after a watermark, followed by tombstones for
+deleted rows and a final line holding the next watermark. A stream that
+ends without that line was cut short, and the consumer should retry from
+its old watermark. Tombstones are kept for TOMBSTONE_RETENTION_DAYS; a
+watermark older than that could miss deletes, so it is refused and the
+consumer must start over with a full export.
+"""
+import csv
+import io
+import zlib
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Item, Notification, Rental, Tombstone
+
+# Rows fetched per database round trip
+ITERATOR_CHUNK_SIZE = 2000
+# Encoded bytes collected before a chunk is sent
+FLUSH_BYTES = 64 * 1024
+# Delta exports stop this far behind the clock, so rows whose transaction
+# is still committing when the export starts are picked up by the next run
+DELTA_SAFETY_LAG = timedelta(seconds=5)
+
+EXPORT_FIELDS = [
+    ('id', 'pk'),
+    ('item_id', 'item_id'),
+    ('item', 'item__name'),
+    ('borrower_id', 'borrower_id'),
+    ('borrower', 'borrower__username'),
+    ('lender_id', 'lender_id'),
+    ('lender', 'lender__username'),
+    ('status', 'status'),
+    ('start_date', 'start_date'),
+    ('end_date', 'end_date'),
+    ('total_price', 'total_price'),
+    ('request_date', 'request_date'),
+    ('approved_date', 'approved_date'),
+    ('borrowed_date', 'borrowed_date'),
+    ('returned_date', 'returned_date'),
+]
+COLUMNS = [column for column, _ in EXPORT_FIELDS]
+
+# Delta export name -> (model, exported fields)
+DELTA_MODELS = {
+    'rentals': (Rental, EXPORT_FIELDS + [('updated_at', 'updated_at')]),
+    'items': (Item, [
+        ('id', 'pk'),
+        ('name', 'name'),
+        ('description', 'description'),
+        ('owner_id', 'owner_id'),
+        ('category', 'category'),
+        ('price', 'price'),
+        ('per_day', 'per_day'),
+        ('is_available', 'is_available'),
+        ('date_posted', 'date_posted'),
+        ('updated_at', 'updated_at'),
+    ]),
+    'notifications': (Notification, [
+        ('id', 'pk'),
+        ('user_id', 'user_id'),
+        ('rental_id', 'rental_id'),
+        ('type', 'type'),
+        ('message', 'message'),
+        ('read', 'read'),
+        ('created_at', 'created_at'),
+        ('updated_at', 'updated_at'),
+    ]),
+}
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def export_rentals(start=None, end=None, statuses=None, lender=None):
+    """Rentals requested between ``start`` and ``end`` (inclusive dates), oldest first."""
+    rentals = Rental.objects.all()
+    # Whole-day bounds keep the request_date index usable
+    if start:
+        rentals = rentals.filter(request_date__gte=_day_start(start))
+    if end:
+        rentals = rentals.filter(request_date__lt=_day_start(end + timedelta(days=1)))
+    if statuses:
+        rentals = rentals.filter(status__in=statuses)
+    if lender:
+        rentals = rentals.filter(lender_id=lender)
+    return rentals.order_by('request_date', 'pk').values_list(*(lookup for _, lookup in EXPORT_FIELDS))
+
+
+def _csv_lines(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    yield buffer.getvalue()
+    for row in rows:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(row)
+        yield buffer.getvalue()
+
+
+def _ndjson_lines(rows):
+    encoder = DjangoJSONEncoder()
+    for row in rows:
+        yield encoder.encode(dict(zip(COLUMNS, row))) + '\n'
+
+
+def _batched(lines):
+    """Join small encoded lines into chunks of about FLUSH_BYTES.
+
+    The first line goes out on its own, so the client gets the CSV header
+    before the query has even run.
+    """
+    batch, size = [], 0
+    for index, line in enumerate(lines):
+        data = line.encode()
+        batch.append(data)
+        size += len(data)
+        if size >= FLUSH_BYTES or index == 0:
+            yield b''.join(batch)
+            batch, size = [], 0
+    if batch:
+        yield b''.join(batch)
+
+
+def _gzipped(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def stream_rentals(rentals, fmt='csv', gzip=False):
+    """Encode the ``export_rentals()`` queryset as a stream of byte chunks."""
+    rows = rentals.iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+    lines = _csv_lines(rows) if fmt == 'csv' else _ndjson_lines(rows)
+    chunks = _batched(lines)
+    if gzip:
+        chunks = _gzipped(chunks)
+    return chunks
+
+
+class WatermarkExpired(ValueError):
+    """A watermark older than the tombstone retention: a full export is required."""
+
+
+def tombstone_cutoff(now=None):
+    """Tombstones older than this are purged, and watermarks before it refused."""
+    return (now or timezone.now()) - timedelta(days=settings.TOMBSTONE_RETENTION_DAYS)
+
+
+def check_watermark(since):
+    """Raise WatermarkExpired if deletes since ``since`` may already be purged."""
+    if since < tombstone_cutoff():
+        raise WatermarkExpired(
+            f'Watermark {since.isoformat()} is older than the {settings.TOMBSTONE_RETENTION_DAYS}-day '
+            'tombstone retention; a full export is required.'
+        )
+
+
+def purge_tombstones(now=None):
+    """Delete tombstones past the retention period. Returns how many."""
+    cutoff = tombstone_cutoff(now)
+    purged = 0
+    # One range delete per model on the (model, deleted_at) index
+    for model, _ in DELTA_MODELS.values():
+        purged += Tombstone.objects.filter(model=model._meta.model_name, deleted_at__lt=cutoff).delete()[0]
+    return purged
+
+
+def parse_watermark(value):
+    """Timezone-aware datetime of a watermark string. Raises ValueError."""
+    moment = parse_datetime(value)
+    if moment is None or timezone.is_naive(moment):
+        raise ValueError(f'Invalid watermark: {value!r}')
+    return moment
+
+
+def delta_until(since=None):
+    """Upper bound (exclusive) and next watermark of a delta export starting now."""
+    until = timezone.now() - DELTA_SAFETY_LAG
+    # Never hand out a watermark older than the one we were given
+    return max(until, since) if since else until
+
+
+def _delta_lines(name, since, until):
+    model, fields = DELTA_MODELS[name]
+    columns = [column for column, _ in fields]
+    encoder = DjangoJSONEncoder()
+
+    changed = model.objects.filter(updated_at__lt=until)
+    if since:
+        changed = changed.filter(updated_at__gte=since)
+    changed = changed.order_by('updated_at', 'pk').values_list(*(lookup for _, lookup in fields))
+    for row in changed.iterator(chunk_size=ITERATOR_CHUNK_SIZE):
+        yield encoder.encode({'op': 'upsert', 'data': dict(zip(columns, row))}) + '\n'
+
+    # A full export (no watermark) has nothing to delete
+    if since:
+        deleted = Tombstone.objects.filter(
+            model=model._meta.model_name, deleted_at__gte=since, deleted_at__lt=until
+        ).order_by('deleted_at', 'pk').values_list('object_id', 'deleted_at')
+        for object_id, deleted_at in deleted.iterator(chunk_size=ITERATOR_CHUNK_SIZE):
+            yield encoder.encode({'op': 'delete', 'id': object_id, 'deleted_at': deleted_at}) + '\n'
+
+    yield encoder.encode({'op': 'watermark', 'watermark': until.isoformat()}) + '\n'
+
+
+def stream_delta(name, since, until, gzip=False):
+    """NDJSON byte chunks of ``name`` rows changed in ``[since, until)``, as described above."""
+    chunks = _batched(_delta_lines(name, since, until))
+    if gzip:
+        chunks = _gzipped(chunks)
+    return chunks
@@ -2,6 +2,7 @@
 from django import forms
 from django.utils import timezone
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
+from . import exports, pricing
 from .models import CustomUser, Item, Rental
 
 class CustomUserCreationForm(UserCreationForm):
@@ -71,6 +72,7 @@ class ItemSearchForm(forms.Form):
         ('price_desc', 'Price (High to Low)'),
         ('date_desc', 'Newest First'),
         ('date_asc', 'Oldest First'),
+        ('relevance', 'Best Match'),
     ]
     
     search = forms.CharField(required=False, label='Search',
@@ -80,6 +82,25 @@ class ItemSearchForm(forms.Form):
     availability = forms.BooleanField(required=False, initial=True)
     sort_by = forms.ChoiceField(choices=SORT_CHOICES, required=False,
                               initial='date_desc')
+    start = forms.DateField(required=False, label='Available from',
+                            widget=forms.DateInput(attrs={'type': 'date'}))
+    end = forms.DateField(required=False, label='Available until',
+                          widget=forms.DateInput(attrs={'type': 'date'}))
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start = cleaned_data.get('start')
+        end = cleaned_data.get('end')
+
+        # A single date means "free on that day"
+        if start and not end:
+            cleaned_data['end'] = start
+        elif end and not start:
+            cleaned_data['start'] = end
+        elif start and end and end < start:
+            raise forms.ValidationError("End date must be after start date.")
+
+        return cleaned_data
 
 class RentalRequestForm(forms.ModelForm):
     class Meta:
@@ -150,4 +171,79 @@ class ItemForm(forms.ModelForm):
                 'class': 'rounded-md border-gray-300 shadow-sm focus:border-blue-300 focus:ring focus:ring-blue-200 focus:ring-opacity-50',
                 'placeholder': 'Enter price'
             })
-        }
\ No newline at end of file
+        }
+
+
+class RentalExportForm(forms.Form):
+    """Query parameters of the streaming rental export"""
+    FORMAT_CHOICES = [
+        ('csv', 'CSV'),
+        ('ndjson', 'NDJSON'),
+    ]
+
+    format = forms.ChoiceField(choices=FORMAT_CHOICES, required=False)
+    start = forms.DateField(required=False, help_text='First request date to include')
+    end = forms.DateField(required=False, help_text='Last request date to include')
+    status = forms.MultipleChoiceField(choices=Rental.STATUS_CHOICES, required=False)
+    lender = forms.IntegerField(required=False, min_value=1, help_text='Lender user ID')
+    gzip = forms.BooleanField(required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start = cleaned_data.get('start')
+        end = cleaned_data.get('end')
+        if start and end and end < start:
+            raise forms.ValidationError("End date must be after start date.")
+        cleaned_data['format'] = cleaned_data.get('format') or 'csv'
+        return cleaned_data
+
+
+class DeltaExportForm(forms.Form):
+    """Query parameters of the delta exports"""
+    since = forms.CharField(required=False, help_text='Watermark returned by the previous export')
+    gzip = forms.BooleanField(required=False)
+
+    def clean_since(self):
+        since = self.cleaned_data.get('since')
+        if not since:
+            return None
+        try:
+            since = exports.parse_watermark(since)
+        except ValueError:
+            raise forms.ValidationError("Enter a watermark returned by a previous export.")
+        try:
+            exports.check_watermark(since)
+        except exports.WatermarkExpired as exc:
+            raise forms.ValidationError(str(exc), code='full_export_required')
+        return since
+
+
+class RentalQuoteForm(forms.Form):
+    """Query parameters of the quote API: ``item``, ``start`` and ``end``, once per quote.
+
+    A single ``item`` applies to every ``start``/``end`` pair, so a calendar
+    can price many windows of one item.
+    """
+    item = forms.IntegerField(min_value=1)
+    start = forms.DateField()
+    end = forms.DateField()
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start = cleaned_data.get('start')
+        end = cleaned_data.get('end')
+        if start and end and end < start:
+            raise forms.ValidationError("End date must be after start date.")
+        return cleaned_data
+
+    @classmethod
+    def for_query(cls, query):
+        """One bound form per quote in ``query``; raises ValueError if the lists do not line up."""
+        items, starts, ends = query.getlist('item'), query.getlist('start'), query.getlist('end')
+        if len(items) == 1:
+            items = items * len(starts)
+        if not starts or not len(items) == len(starts) == len(ends):
+            raise ValueError("Give start and end once per quote, with one item for all or one per quote.")
+        if len(starts) > pricing.MAX_BATCH_QUOTES:
+            raise ValueError(f"At most {pricing.MAX_BATCH_QUOTES} quotes per request.")
+        return [cls({'item': item, 'start': start, 'end': end}) for item, start, end in zip(items, starts, ends)]
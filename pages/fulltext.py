@@ -0,0 +1,151 @@
+# pages/fulltext.py
+"""
+SQLite FTS5 full-text index over Item name, description and category.
+
+The ``pages_item_fts`` virtual table is keyed by the item's rowid and kept
+in sync from the Item save/delete signals. Queries reach it through the
+unmanaged ``ItemSearchEntry`` model, joined to Item on that rowid. When the
+database is not SQLite or was built without FTS5, searches fall back to
+``icontains`` lookups.
+"""
+import re
+
+from django.db import OperationalError, connection
+from django.db.models import F, Lookup, Q, TextField
+
+FTS_TABLE = 'pages_item_fts'
+
+# Column weights for bm25(): a hit in the name counts most, then category
+RANK_CONFIG = 'bm25(10.0, 1.0, 2.0)'
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# None until the first probe; create_index()/drop_index() keep it current
+_available = None
+
+
+def fts_available():
+    """Return True if the FTS5 table exists on the default database."""
+    global _available
+    if _available is None:
+        if connection.vendor != 'sqlite':
+            _available = False
+        else:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+                    [FTS_TABLE]
+                )
+                _available = cursor.fetchone() is not None
+    return _available
+
+
+def _forget_availability():
+    global _available
+    _available = None
+
+
+def create_index(schema_editor=None):
+    """Create the FTS5 table. Returns False if FTS5 is not supported."""
+    conn = schema_editor.connection if schema_editor else connection
+    if conn.vendor != 'sqlite':
+        return False
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+                "name, description, category, "
+                "tokenize = 'unicode61 remove_diacritics 2')"
+            )
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rank) VALUES ('rank', %s)",
+                [RANK_CONFIG]
+            )
+    except OperationalError:
+        # SQLite compiled without FTS5
+        _forget_availability()
+        return False
+    _forget_availability()
+    return True
+
+
+def drop_index(schema_editor=None):
+    conn = schema_editor.connection if schema_editor else connection
+    if conn.vendor != 'sqlite':
+        return
+    with conn.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+    _forget_availability()
+
+
+def rebuild_index(schema_editor=None):
+    """Repopulate the index from pages_item. Returns the number of rows indexed."""
+    conn = schema_editor.connection if schema_editor else connection
+    if not create_index(schema_editor):
+        return 0
+    with conn.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}(rowid, name, description, category) "
+            "SELECT id, name, description, category FROM pages_item"
+        )
+        cursor.execute(f"SELECT COUNT(*) FROM {FTS_TABLE}")
+        return cursor.fetchone()[0]
+
+
+def index_item(item):
+    """Insert or replace the index row for ``item``."""
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [item.pk])
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}(rowid, name, description, category) VALUES (%s, %s, %s, %s)",
+            [item.pk, item.name, item.description, item.category]
+        )
+
+
+def unindex_item(pk):
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [pk])
+
+
+class MatchField(TextField):
+    """FTS5's hidden column named after the table, searched with ``__match``."""
+
+
+@MatchField.register_lookup
+class Match(Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', (*lhs_params, *rhs_params)
+
+
+def build_match_query(text):
+    """Turn free text into an FTS5 query where every word is a quoted prefix term."""
+    return ' '.join(f'"{token}"*' for token in _TOKEN_RE.findall(text))
+
+
+def search_items(items, text):
+    """Filter an Item queryset by ``text``.
+
+    Returns ``(items, ranked)``. When the FTS5 index is used, each item is
+    annotated with ``search_rank`` (lower is more relevant) and ``ranked``
+    is True; otherwise the LIKE fallback is applied and ``ranked`` is False.
+    """
+    match = build_match_query(text)
+    if not match or not fts_available():
+        return items.filter(
+            Q(name__icontains=text) |
+            Q(description__icontains=text)
+        ), False
+
+    # One join on the FTS rowid both filters the items and ranks them
+    return items.filter(search_entry__document__match=match).annotate(
+        search_rank=F('search_entry__rank')
+    ), True
@@ -0,0 +1,160 @@
+# pages/images.py
+"""
+Resized WebP/JPEG derivatives for item and profile images.
+
+Uploads are stored as-is; ``schedule_derivatives`` renders the smaller
+variants on a background thread after the upload request commits, and the
+``responsive_image`` template tag points browsers at them via ``srcset``.
+
+Once every variant is written, the image's name is copied into the row's
+``image_derivatives`` column. Replacing the image makes the two differ
+again, so the tag needs no storage or cache lookups. Derivatives of a
+replaced or deleted image are removed after the change commits. Run
+``generate_image_derivatives`` to render and record derivatives for
+images uploaded before this column existed.
+"""
+import logging
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+# Display slot -> (pixel widths to render, default ``sizes`` attribute)
+DERIVATIVE_SIZES = {
+    'card': ((320, 640), '(min-width: 1024px) 33vw, (min-width: 640px) 50vw, 100vw'),
+    'detail': ((640, 1280), '(min-width: 1024px) 50vw, 100vw'),
+    'avatar': ((80, 160), '80px'),
+}
+# Format -> (file extension, Pillow save options)
+DERIVATIVE_FORMATS = {
+    'webp': ('webp', {'format': 'WEBP', 'quality': 80, 'method': 4}),
+    'jpeg': ('jpg', {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='image-derivatives')
+
+
+def all_widths():
+    return sorted({width for widths, _ in DERIVATIVE_SIZES.values() for width in widths})
+
+
+def derivative_name(name, width, fmt):
+    """Storage name of one derivative, e.g. item_images/derivatives/photo.png-320w.webp
+
+    The whole original filename is kept, extension included, so photo.jpg
+    and photo.png in the same directory never share derivatives.
+    """
+    directory, filename = posixpath.split(name)
+    ext = DERIVATIVE_FORMATS[fmt][0]
+    return posixpath.join(directory, 'derivatives', f'{filename}-{width}w.{ext}')
+
+
+def derivative_names(name):
+    return [derivative_name(name, width, fmt) for width in all_widths() for fmt in DERIVATIVE_FORMATS]
+
+
+def derivatives_ready(field_file):
+    """True once every derivative of the image in ``field_file`` exists."""
+    field_name = f'{field_file.field.name}_derivatives'
+    return bool(field_file.name) and getattr(field_file.instance, field_name, None) == field_file.name
+
+
+def _record_ready(name):
+    from .models import CustomUser, Item
+
+    # Only a rendering hint, not a change the delta exports carry, so
+    # updated_at is left alone
+    for model in (Item, CustomUser):
+        model.objects.filter(image=name).update(image_derivatives=name)
+
+
+def generate_derivatives(name, storage=default_storage, force=False):
+    """Render every width/format of ``name``. Returns the number of files written."""
+    try:
+        with storage.open(name, 'rb') as source:
+            image = Image.open(source)
+            image.load()
+    except (OSError, UnidentifiedImageError):
+        logger.warning('Cannot read image %s for derivatives', name)
+        return 0
+
+    # Phone photos carry their rotation in EXIF
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[-1])
+        image = background
+    elif image.mode == 'L':
+        image = image.convert('RGB')
+
+    written = 0
+    for width in all_widths():
+        resized = image
+        if image.width > width:
+            height = round(image.height * width / image.width)
+            resized = image.resize((width, height), Image.LANCZOS)
+        for fmt, (_, options) in DERIVATIVE_FORMATS.items():
+            target = derivative_name(name, width, fmt)
+            if storage.exists(target):
+                if not force:
+                    continue
+                storage.delete(target)
+            buffer = BytesIO()
+            resized.save(buffer, **options)
+            storage.save(target, ContentFile(buffer.getvalue()))
+            written += 1
+
+    _record_ready(name)
+    return written
+
+
+def _generate_in_background(name):
+    try:
+        generate_derivatives(name)
+    except Exception:
+        logger.exception('Failed to generate derivatives for %s', name)
+
+
+def schedule_derivatives(field_file):
+    """Queue derivative generation for an ImageField value once the save commits."""
+    if not field_file or not field_file.name or derivatives_ready(field_file):
+        return
+    name = field_file.name
+    transaction.on_commit(lambda: _executor.submit(_generate_in_background, name))
+
+
+def delete_derivatives(name, storage=default_storage):
+    """Remove every derivative of ``name``. Returns the number of files deleted."""
+    deleted = 0
+    for target in derivative_names(name):
+        if storage.exists(target):
+            storage.delete(target)
+            deleted += 1
+    return deleted
+
+
+def _still_used(name):
+    from .models import CustomUser, Item
+
+    return any(model.objects.filter(image=name).exists() for model in (Item, CustomUser))
+
+
+def _delete_in_background(name):
+    try:
+        if not _still_used(name):
+            delete_derivatives(name)
+    except Exception:
+        logger.exception('Failed to delete derivatives of %s', name)
+
+
+def discard_derivatives(name):
+    """Delete the derivatives of a replaced or deleted image once the change commits."""
+    if name:
+        transaction.on_commit(lambda: _executor.submit(_delete_in_background, name))
@@ -0,0 +1,127 @@
+# pages/jobs.py
+"""
+Background report generation.
+
+The ReportJob table is the queue: a request for a report only inserts a
+row. Once that insert commits the job is handed to a local process pool,
+which is started on demand (see ``pools``). The worker claims the row
+with a conditional UPDATE, writes the report to a temporary file and
+stores it as the job's artifact. The
+``process_report_jobs`` command drains the same table, so jobs left queued
+by a restart are still picked up without any external broker.
+
+Each claim bumps the job's ``attempt``, and a worker only records progress
+and results while the row still carries its attempt. A worker that was
+presumed lost and requeued therefore cannot overwrite the run that
+replaced it; its artifact is deleted instead. Finished jobs are deleted
+with their artifacts ARTIFACT_RETENTION after they finish.
+"""
+import logging
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from . import reports
+from .models import ReportJob
+from .pools import IdleProcessPool
+
+logger = logging.getLogger(__name__)
+
+# A job still running after this long is assumed lost with its worker
+STALE_AFTER = timedelta(minutes=30)
+# Finished jobs and their artifacts are deleted after this long
+ARTIFACT_RETENTION = timedelta(days=7)
+# Progress recorded as a job moves through its stages
+PROGRESS_CLAIMED = 10
+PROGRESS_WRITTEN = 80
+
+_pool = IdleProcessPool('REPORT_JOB_WORKERS')
+
+
+def enqueue(kind, user=None):
+    """Queue a report of ``kind`` (a key of ``reports.REPORTS``) and return the job."""
+    if kind not in reports.REPORTS:
+        raise ValueError(f'Unknown report kind: {kind}')
+    job = ReportJob.objects.create(kind=kind, requested_by=user)
+    transaction.on_commit(lambda: dispatch(job.pk))
+    return job
+
+
+def dispatch(job_id):
+    if settings.REPORT_JOB_WORKERS <= 0:
+        run_job(job_id)
+    else:
+        _pool.submit(run_job, job_id)
+
+
+def claim(job_id):
+    """Mark a queued job as running and return its attempt number, or None if
+    another caller won the claim."""
+    attempt = ReportJob.objects.filter(pk=job_id, status='queued').values_list('attempt', flat=True).first()
+    if attempt is None:
+        return None
+    # Conditional on the attempt read above, so only one caller can win
+    claimed = ReportJob.objects.filter(pk=job_id, status='queued', attempt=attempt).update(
+        status='running', progress=PROGRESS_CLAIMED, started_at=timezone.now(), attempt=attempt + 1
+    )
+    return attempt + 1 if claimed else None
+
+
+def run_job(job_id):
+    """Claim and build one job. Returns False if another worker already took it."""
+    attempt = claim(job_id)
+    if attempt is None:
+        return False
+    job = ReportJob.objects.get(pk=job_id)
+    # Only the current attempt of a running job may record anything
+    current = ReportJob.objects.filter(pk=job_id, status='running', attempt=attempt)
+    filename, _, writer = reports.REPORTS[job.kind]
+    try:
+        with tempfile.TemporaryFile() as output:
+            writer(output)
+            current.update(progress=PROGRESS_WRITTEN)
+            output.seek(0)
+            job.artifact.save(f'{job.pk}/{filename}', File(output), save=False)
+    except Exception as exc:
+        logger.exception('Report job %s failed', job_id)
+        current.update(status='failed', error=f'{type(exc).__name__}: {exc}', finished_at=timezone.now())
+        return True
+
+    finished = current.update(
+        status='done', progress=100, artifact=job.artifact.name, finished_at=timezone.now()
+    )
+    if not finished:
+        logger.warning('Report job %s attempt %s was superseded; discarding its artifact', job_id, attempt)
+        job.artifact.delete(save=False)
+    return True
+
+
+def requeue_stale(now=None):
+    """Put jobs whose worker died mid-run back in the queue. Returns how many."""
+    cutoff = (now or timezone.now()) - STALE_AFTER
+    return ReportJob.objects.filter(status='running', started_at__lt=cutoff).update(
+        status='queued', progress=0, started_at=None
+    )
+
+
+def purge_expired(now=None):
+    """Delete jobs finished more than ARTIFACT_RETENTION ago, with their artifacts. Returns how many."""
+    cutoff = (now or timezone.now()) - ARTIFACT_RETENTION
+    expired = list(ReportJob.objects.filter(status__in=['done', 'failed'], finished_at__lt=cutoff))
+    for job in expired:
+        if job.artifact:
+            job.artifact.delete(save=False)
+    ReportJob.objects.filter(pk__in=[job.pk for job in expired]).delete()
+    return len(expired)
+
+
+def process_queued(limit=None):
+    """Run queued jobs in this process, oldest first. Returns how many ran."""
+    job_ids = ReportJob.objects.filter(status='queued').order_by('created_at').values_list('pk', flat=True)
+    if limit:
+        job_ids = job_ids[:limit]
+    return sum(run_job(job_id) for job_id in list(job_ids))
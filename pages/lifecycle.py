@@ -0,0 +1,224 @@
+# pages/lifecycle.py
+"""
+Scheduled rental transitions and return reminders.
+
+``run_due()`` does every job that is due now. It moves approved rentals to
+borrowed once their start date arrives, and reminds borrowers of rentals
+due back within REMINDER_DAYS_BEFORE days, including overdue ones. It
+also purges tombstones past their retention (see ``exports``). Each
+step reads due rentals with a range query on a (status, date) index, in
+batches of BATCH_SIZE. Each batch is one transaction: a conditional UPDATE
+for the rentals and one bulk_create for the notifications.
+
+Reruns are harmless. A started rental is no longer approved, and a rental
+with a reminder is skipped. A batch interrupted part way rolls back as a
+whole, so the next run picks it up again.
+
+The steps update the unread counters and search cache and push live
+notifications, all of which live in the process that runs them with the
+default LocMemCache and InProcessBroker. The web entry points therefore
+call ``start_scheduler()``, which wakes every SCHEDULER_INTERVAL seconds
+on a thread of the web process. Every server worker, ``runserver`` and
+anything else importing the entry point gets such a thread, so a thread
+only calls ``run_due()`` while it holds the scheduler lease: a database
+row that one process at a time takes and renews, and that expires when
+its holder stops renewing it. The ``run_scheduler`` command takes the
+same lease and runs in a process of its own, and refuses to unless
+CACHES and NOTIFICATION_BROKER are shared between processes.
+"""
+import logging
+import os
+import socket
+import threading
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Exists, F, OuterRef, Q
+from django.utils import timezone
+
+from . import exports, notifications, rollups, search
+from .models import Notification, Rental, SchedulerLease
+
+logger = logging.getLogger(__name__)
+
+# Rentals moved or reminded per transaction
+BATCH_SIZE = 2000
+# Borrowers are reminded this many days before the end date
+REMINDER_DAYS_BEFORE = 1
+LEASE_NAME = 'rental-scheduler'
+# A lease not renewed for this many scheduler intervals can be taken over
+LEASE_INTERVALS = 3
+
+
+def _in_batches(queryset, field, handle):
+    """Call ``handle(batch)`` on the rows of ``queryset``, one transaction per batch.
+
+    Rows are taken in ``(field, pk)`` order, which the (status, field)
+    index returns without sorting. Each batch continues after the last row
+    of the previous one, so handled rows are never read again. Rows locked
+    by another scheduler are left to it. ``handle`` returns how many rows
+    of the batch it acted on; the total is returned.
+    """
+    queryset = queryset.order_by(field, 'pk')
+    remaining = queryset
+    handled = 0
+    while True:
+        with transaction.atomic():
+            batch = list(remaining.select_for_update(skip_locked=True, of=('self',))[:BATCH_SIZE])
+            if not batch:
+                return handled
+            handled += handle(batch)
+        last = batch[-1]
+        value = getattr(last, field)
+        # The plain >= lets the index seek to the cursor; the OR alone cannot
+        remaining = queryset.filter(
+            Q(**{f'{field}__gte': value}),
+            Q(**{f'{field}__gt': value}) | Q(pk__gt=last.pk),
+        )
+
+
+def start_due_rentals(today=None):
+    """Mark approved rentals whose start date has arrived as borrowed; returns how many."""
+    today = today or timezone.localdate()
+    due = (
+        Rental.objects.filter(status='approved', start_date__lte=today)
+        .annotate(item_name=F('item__name'))
+        .values_list('pk', 'borrower_id', 'request_date', 'start_date', 'item_name', named=True)
+    )
+
+    def start(batch):
+        now = timezone.now()
+        updated = Rental.objects.filter(pk__in=[r.pk for r in batch], status='approved').update(
+            status='borrowed', borrowed_date=now, updated_at=now
+        )
+        if updated != len(batch):
+            # Some were cancelled or declined since they were read: record
+            # and notify only the rows started here
+            started = set(
+                Rental.objects.filter(pk__in=[r.pk for r in batch], status='borrowed', borrowed_date=now)
+                .values_list('pk', flat=True)
+            )
+            batch = [rental for rental in batch if rental.pk in started]
+        # QuerySet.update() sends no post_save
+        for day, count in Counter(rollups.rollup_day(r) for r in batch).items():
+            rollups.record_status_change(day, 'approved', 'borrowed', count)
+        search.bump_rental_version()
+        notifications.create_many([
+            Notification(
+                user_id=rental.borrower_id,
+                rental_id=rental.pk,
+                type='item_borrowed',
+                message=f"Your rental of {rental.item_name} has started.",
+            )
+            for rental in batch
+        ])
+        return len(batch)
+    return _in_batches(due, 'start_date', start)
+
+
+def send_return_reminders(today=None):
+    """Remind borrowers of rentals due back soon or overdue, once per rental; returns how many."""
+    today = today or timezone.localdate()
+    reminded = Notification.objects.filter(rental=OuterRef('pk'), type='reminder')
+    due = (
+        Rental.objects.filter(status='borrowed', end_date__lte=today + timedelta(days=REMINDER_DAYS_BEFORE))
+        .filter(~Exists(reminded))
+        .annotate(item_name=F('item__name'))
+        .values_list('pk', 'borrower_id', 'end_date', 'item_name', named=True)
+    )
+
+    def remind(batch):
+        notifications.create_many([
+            Notification(
+                user_id=rental.borrower_id,
+                rental_id=rental.pk,
+                type='reminder',
+                message=(
+                    f"{rental.item_name} was due back on {rental.end_date:%b %d, %Y}. Please return it."
+                    if rental.end_date < today else
+                    f"Please return {rental.item_name} by {rental.end_date:%b %d, %Y}."
+                ),
+            )
+            for rental in batch
+        ])
+        return len(batch)
+    return _in_batches(due, 'end_date', remind)
+
+
+def run_due(today=None):
+    """Run every scheduled step; returns ``{'started': n, 'reminded': n, 'purged': n}``."""
+    today = today or timezone.localdate()
+    return {
+        'started': start_due_rentals(today),
+        # After starting, so rentals that start and end today are reminded too
+        'reminded': send_return_reminders(today),
+        'purged': exports.purge_tombstones(),
+    }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def lease_holder():
+    """Name of this process in the scheduler lease."""
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def hold_lease(holder, ttl, now=None):
+    """Take or renew the scheduler lease for ``holder``; True while it holds it.
+
+    One conditional UPDATE, so of several processes asking at once only
+    one gets it. A lease its holder stopped renewing expires after ``ttl``.
+    """
+    now = now or timezone.now()
+    SchedulerLease.objects.get_or_create(name=LEASE_NAME, defaults={'expires_at': now})
+    return bool(
+        SchedulerLease.objects.filter(name=LEASE_NAME)
+        .filter(Q(holder=holder) | Q(expires_at__lte=now))
+        .update(holder=holder, expires_at=now + ttl)
+    )
+
+
+def release_lease(holder):
+    """Give up the scheduler lease if ``holder`` has it."""
+    SchedulerLease.objects.filter(name=LEASE_NAME, holder=holder).update(holder='', expires_at=timezone.now())
+
+
+def _run_forever(interval, stop):
+    holder = lease_holder()
+    ttl = timedelta(seconds=interval * LEASE_INTERVALS)
+    while not stop.wait(interval):
+        try:
+            if hold_lease(holder, ttl):
+                run_due()
+        except Exception:
+            logger.exception('Scheduled rental jobs failed')
+        finally:
+            close_old_connections()
+    release_lease(holder)
+    close_old_connections()
+
+
+def start_scheduler(interval=None):
+    """Call ``run_due()`` every ``interval`` seconds on a daemon thread of this process.
+
+    Defaults to SCHEDULER_INTERVAL; 0 disables it. Only the first call
+    starts a thread, and it skips its turn while another process holds
+    the scheduler lease. Returns the event that stops it, or None.
+    """
+    global _scheduler
+    if interval is None:
+        interval = getattr(settings, 'SCHEDULER_INTERVAL', 60)
+    if interval <= 0:
+        return None
+    with _scheduler_lock:
+        if _scheduler is None:
+            stop = threading.Event()
+            threading.Thread(
+                target=_run_forever, args=(interval, stop), name='rental-scheduler', daemon=True
+            ).start()
+            _scheduler = stop
+    return _scheduler
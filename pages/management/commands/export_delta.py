@@ -0,0 +1,50 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pages.exports import DELTA_MODELS, check_watermark, delta_until, parse_watermark, stream_delta
+
+
+class Command(BaseCommand):
+    help = 'Write rows changed since a watermark as NDJSON, ending with the next watermark'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=sorted(DELTA_MODELS))
+        parser.add_argument('--since', help='Watermark of the previous export (default: read from --state-file)')
+        parser.add_argument(
+            '--state-file',
+            help='File holding the last watermark; updated once the export has been written in full',
+        )
+        parser.add_argument('--output', help='File to write to instead of stdout')
+
+    def handle(self, *args, **options):
+        since = options['since']
+        state_file = options['state_file']
+        if since is None and state_file and os.path.exists(state_file):
+            with open(state_file) as f:
+                since = f.read().strip() or None
+        try:
+            since = parse_watermark(since) if since else None
+            if since:
+                check_watermark(since)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        until = delta_until(since)
+        chunks = stream_delta(options['name'], since, until)
+        if options['output']:
+            with open(options['output'], 'wb') as output:
+                for chunk in chunks:
+                    output.write(chunk)
+        else:
+            # Chunks hold whole lines, so each decodes on its own
+            for chunk in chunks:
+                self.stdout.write(chunk.decode(), ending='')
+
+        if state_file:
+            # Written last, so a failed export is retried from the old watermark
+            tmp = f'{state_file}.tmp'
+            with open(tmp, 'w') as f:
+                f.write(until.isoformat() + '\n')
+            os.replace(tmp, state_file)
+        self.stderr.write(f'Exported {options["name"]} changed since {since or "the beginning"}; next watermark {until.isoformat()}')
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from pages.images import generate_derivatives
+from pages.models import CustomUser, Item
+
+
+class Command(BaseCommand):
+    help = 'Generate resized WebP/JPEG derivatives for existing item and profile images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Re-render derivatives that already exist')
+
+    def handle(self, *args, **options):
+        names = set()
+        for model in (Item, CustomUser):
+            names.update(
+                model.objects.exclude(image='').exclude(image__isnull=True).values_list('image', flat=True)
+            )
+
+        written = 0
+        for name in sorted(names):
+            count = generate_derivatives(name, force=options['force'])
+            written += count
+            self.stdout.write(f'{name}: {count} files')
+
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} derivatives for {len(names)} images.'))
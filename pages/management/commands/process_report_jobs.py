@@ -0,0 +1,36 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+
+from pages.jobs import process_queued, purge_expired, requeue_stale
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Run queued report jobs, requeueing any whose worker died mid-run and purging expired ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep polling the queue instead of exiting')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds between polls with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                requeued = requeue_stale()
+                ran = process_queued()
+                purged = purge_expired()
+            except Exception:
+                if not options['loop']:
+                    raise
+                # Nothing restarts the loop on the deployment; try again next poll
+                logger.exception('Report job pass failed')
+            else:
+                if ran or requeued or purged or not options['loop']:
+                    self.stdout.write(self.style.SUCCESS(
+                        f'Ran {ran} report jobs ({requeued} requeued, {purged} expired jobs purged).'
+                    ))
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from pages.models import ItemDailyRollup, StatusDailyRollup, UserDailyRollup
+from pages.rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily rental rollups from the Rental table'
+
+    def handle(self, *args, **options):
+        rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt rollups ({ItemDailyRollup.objects.count()} item days, '
+            f'{UserDailyRollup.objects.count()} user days, {StatusDailyRollup.objects.count()} status days).'
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from pages.fulltext import fts_available, rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the SQLite FTS5 full-text index for items'
+
+    def handle(self, *args, **options):
+        count = rebuild_index()
+        if not fts_available():
+            self.stdout.write(self.style.WARNING('FTS5 is not available; searches fall back to LIKE.'))
+            return
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} items.'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from pages.notifications import reconcile_unread_counts
+
+
+class Command(BaseCommand):
+    help = 'Recompute cached unread notification counters from the database'
+
+    def handle(self, *args, **options):
+        counts = reconcile_unread_counts()
+        self.stdout.write(self.style.SUCCESS(f'Reconciled unread counts ({len(counts)} users with unread notifications).'))
@@ -0,0 +1,42 @@
+import time
+from datetime import timedelta
+
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+
+from pages import events
+from pages.lifecycle import LEASE_INTERVALS, hold_lease, lease_holder, release_lease, run_due
+
+
+class Command(BaseCommand):
+    help = 'Start rentals whose start date has arrived, send return reminders and purge old tombstones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep running on an interval instead of exiting')
+        parser.add_argument('--interval', type=float, default=60.0, help='Seconds between runs with --loop')
+
+    def handle(self, *args, **options):
+        # Counters, search results and live pushes updated here must reach
+        # the web processes; the web process runs the scheduler itself otherwise
+        if isinstance(caches['default'], LocMemCache) or isinstance(events.get_broker(), events.InProcessBroker):
+            raise CommandError(
+                'run_scheduler needs a cache and NOTIFICATION_BROKER shared with the web processes; '
+                'with the per-process defaults the web process runs the scheduler (SCHEDULER_INTERVAL).'
+            )
+        holder = lease_holder()
+        ttl = timedelta(seconds=options['interval'] * LEASE_INTERVALS)
+        while True:
+            if hold_lease(holder, ttl):
+                done = run_due()
+                if any(done.values()) or not options['loop']:
+                    self.stdout.write(self.style.SUCCESS(
+                        f"Started {done['started']} rentals, sent {done['reminded']} return reminders "
+                        f"and purged {done['purged']} tombstones."
+                    ))
+            elif not options['loop']:
+                self.stdout.write('Another process holds the scheduler lease; nothing was run.')
+            if not options['loop']:
+                release_lease(holder)
+                return
+            time.sleep(options['interval'])
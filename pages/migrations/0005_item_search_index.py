@@ -0,0 +1,23 @@
+from django.db import migrations
+
+from pages.fulltext import drop_index, rebuild_index
+
+
+def create_search_index(apps, schema_editor):
+    # No-op on databases without FTS5; searches fall back to LIKE
+    rebuild_index(schema_editor)
+
+
+def remove_search_index(apps, schema_editor):
+    drop_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pages', '0004_rental_notification'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, remove_search_index),
+    ]
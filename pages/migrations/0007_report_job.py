@@ -0,0 +1,35 @@
+# Generated by Django 5.2.5 on 2026-10-18 14:05
+
+import django.db.models.deletion
+import pages.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pages', '0006_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('items_pdf', 'Items Report (PDF)'), ('items_excel', 'Items Report (Excel)'), ('rentals_pdf', 'Rental Activity Report (PDF)'), ('rentals_excel', 'Rental Activity Report (Excel)'), ('users_pdf', 'User Activity Report (PDF)'), ('users_excel', 'User Activity Report (Excel)')], max_length=20)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=10)),
+                ('progress', models.PositiveSmallIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('artifact', models.FileField(blank=True, storage=pages.models.report_artifact_storage, upload_to='reports/')),
+                ('error', models.TextField(blank=True)),
+                ('requested_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='report_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='reportjob_status_created_idx')],
+            },
+        ),
+    ]
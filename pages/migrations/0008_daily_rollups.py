@@ -0,0 +1,80 @@
+# Generated by Django 5.2.5 on 2026-10-18 14:15
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+def build_rollups(apps, schema_editor):
+    ItemDailyRollup = apps.get_model('pages', 'ItemDailyRollup')
+    UserDailyRollup = apps.get_model('pages', 'UserDailyRollup')
+    StatusDailyRollup = apps.get_model('pages', 'StatusDailyRollup')
+    rentals = apps.get_model('pages', 'Rental').objects.annotate(day=TruncDate('request_date'))
+
+    ItemDailyRollup.objects.bulk_create(
+        ItemDailyRollup(day=row['day'], item_id=row['item'], rentals=row['n'])
+        for row in rentals.values('day', 'item').annotate(n=Count('pk')).order_by()
+    )
+
+    users = {}
+    for field, column in (('borrowed', 'borrower'), ('lent', 'lender')):
+        for row in rentals.values('day', column).annotate(n=Count('pk')).order_by():
+            key = (row['day'], row[column])
+            users.setdefault(key, UserDailyRollup(day=key[0], user_id=key[1]))
+            setattr(users[key], field, row['n'])
+    UserDailyRollup.objects.bulk_create(users.values())
+
+    StatusDailyRollup.objects.bulk_create(
+        StatusDailyRollup(day=row['day'], status=row['status'], rentals=row['n'])
+        for row in rentals.values('day', 'status').annotate(n=Count('pk')).order_by()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pages', '0007_report_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatusDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('approved', 'Approved'), ('borrowed', 'Borrowed'), ('returned', 'Returned'), ('rejected', 'Rejected'), ('cancelled', 'Cancelled')], max_length=20)),
+                ('rentals', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('status', 'day'), name='status_rollup_status_day_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ItemDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('rentals', models.PositiveIntegerField(default=0)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='pages.item')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('item', 'day'), name='item_rollup_item_day_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='UserDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('borrowed', models.PositiveIntegerField(default=0)),
+                ('lent', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'day'), name='user_rollup_user_day_uniq')],
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-18 14:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pages', '0008_daily_rollups'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='rental',
+            index=models.Index(fields=['request_date'], name='rental_request_date_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-18 15:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pages', '0010_updated_at_and_tombstones'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='rental',
+            index=models.Index(fields=['status', 'start_date'], name='rental_status_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rental',
+            index=models.Index(fields=['status', 'end_date'], name='rental_status_end_idx'),
+        ),
+    ]
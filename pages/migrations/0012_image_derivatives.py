@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-18 15:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pages', '0011_rental_scheduler_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='image_derivatives',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='image_derivatives',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+    ]
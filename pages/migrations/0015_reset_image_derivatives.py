@@ -0,0 +1,22 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:05
+
+from django.db import migrations
+
+
+def forget_derivatives(apps, schema_editor):
+    # Derivative names now include the original's extension, so none of the
+    # recorded ones exist under the new names; generate_image_derivatives
+    # renders them again
+    for model_name in ('Item', 'CustomUser'):
+        apps.get_model('pages', model_name).objects.exclude(image_derivatives='').update(image_derivatives='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pages', '0014_customuser_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(forget_derivatives, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.5 on 2026-10-18 17:20
+
+import django.db.models.deletion
+import pages.fulltext
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pages', '0016_scheduler_lease'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemSearchEntry',
+            fields=[
+                ('item', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_entry', serialize=False, to='pages.item')),
+                ('document', pages.fulltext.MatchField(db_column='pages_item_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'pages_item_fts',
+                'managed': False,
+            },
+        ),
+    ]
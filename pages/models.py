@@ -1,17 +1,49 @@
 
-from django.db import models
+from datetime import date
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import models, transaction
+from django.db.models import Exists, OuterRef
 from django.contrib.auth.models import AbstractUser
 
+from . import fulltext, pricing
+
 # Custom user model
 class CustomUser(AbstractUser):
     image = models.ImageField(upload_to='user_images/', blank=True, null=True)
+    # Name of the image whose resized derivatives exist (see pages.images)
+    image_derivatives = models.CharField(max_length=100, blank=True, editable=False)
     hostel_name = models.CharField(max_length=100)
     room_number = models.CharField(max_length=20)
     phone_number = models.CharField(max_length=15)
+    # Not set by QuerySet.update(); pass updated_at explicitly there
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.username
 
+class ItemQuerySet(models.QuerySet):
+    def with_rental_status(self, today=None):
+        """Annotate each item with ``rented_today`` using a single EXISTS subquery.
+
+        Mirrors ``Item.is_currently_rented`` so grids can resolve availability
+        without one query per card.
+        """
+        today = today or date.today()
+        active_rentals = Rental.objects.bookings().overlapping(today, today).filter(item=OuterRef('pk'))
+        return self.annotate(rented_today=Exists(active_rentals))
+
+    def free_between(self, start, end):
+        """Items listed as available with no booking overlapping ``start``..``end``.
+
+        Runs as one NOT EXISTS anti-join against the rental
+        (item, status, start_date, end_date) index.
+        """
+        bookings = Rental.objects.bookings().overlapping(start, end).filter(item=OuterRef('pk'))
+        return self.filter(~Exists(bookings), is_available=True)
+
+
 # Make sure this whole class is in your pages/models.py file
 class Item(models.Model):
     CATEGORY_CHOICES = [
@@ -28,22 +60,42 @@ class Item(models.Model):
     price = models.DecimalField(max_digits=7, decimal_places=2)
     owner = models.ForeignKey('CustomUser', on_delete=models.CASCADE)
     image = models.ImageField(upload_to='item_images/', blank=True, null=True)
+    # Name of the image whose resized derivatives exist (see pages.images)
+    image_derivatives = models.CharField(max_length=100, blank=True, editable=False)
     is_available = models.BooleanField(default=True)
     per_day = models.BooleanField(default=False, help_text='Is this price per day?')
     date_posted = models.DateTimeField(auto_now_add=True)
     category = models.CharField(max_length=20, choices=CATEGORY_CHOICES, default='others')
+    # Not set by QuerySet.update(); pass updated_at explicitly there
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ItemQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Filtered home/list feeds, newest first
+            models.Index(fields=['category', 'is_available', '-date_posted'], name='item_cat_avail_posted_idx'),
+            # Unfiltered feeds sorted by date or price
+            models.Index(fields=['-date_posted'], name='item_posted_idx'),
+            models.Index(fields=['price'], name='item_price_idx'),
+            # Delta exports
+            models.Index(fields=['updated_at'], name='item_updated_idx'),
+        ]
 
     def __str__(self):
         return self.name
     
     def is_currently_rented(self):
         """Check if item is currently rented based on active rental dates"""
-        from datetime import date
+        # Querysets built with ``with_rental_status()`` already carry the answer
+        if hasattr(self, 'rented_today'):
+            return self.rented_today
+
         today = date.today()
         
         # Check for active rentals (approved or borrowed status) that overlap with today
         active_rentals = self.rentals.filter(
-            status__in=['approved', 'borrowed'],
+            status__in=Rental.ACTIVE_STATUSES,
             start_date__lte=today,
             end_date__gte=today
         )
@@ -56,6 +108,31 @@ class Item(models.Model):
             return False
         return not self.is_currently_rented()
 
+# A row of the FTS5 index; the table is created and kept in sync by
+# pages.fulltext, never by migrations. Only query it with a MATCH.
+class ItemSearchEntry(models.Model):
+    item = models.OneToOneField(
+        Item, on_delete=models.DO_NOTHING, primary_key=True, db_column='rowid',
+        db_constraint=False, related_name='search_entry'
+    )
+    document = fulltext.MatchField(db_column=fulltext.FTS_TABLE)
+    # bm25() under fulltext.RANK_CONFIG; lower is more relevant
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = fulltext.FTS_TABLE
+
+class RentalQuerySet(models.QuerySet):
+    def bookings(self):
+        """Rentals that hold the item for their date range"""
+        return self.filter(status__in=Rental.ACTIVE_STATUSES)
+
+    def overlapping(self, start, end):
+        """Rentals whose inclusive date range intersects ``start``..``end``"""
+        return self.filter(start_date__lte=end, end_date__gte=start)
+
+
 class Rental(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -65,6 +142,10 @@ class Rental(models.Model):
         ('rejected', 'Rejected'),
         ('cancelled', 'Cancelled'),
     ]
+    # Statuses that occupy the item for the rental's date range
+    ACTIVE_STATUSES = ['approved', 'borrowed']
+    # Statuses of a request that is still in progress
+    OPEN_STATUSES = ['pending', 'approved', 'borrowed']
 
     item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='rentals')
     borrower = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='borrowed_items')
@@ -76,20 +157,53 @@ class Rental(models.Model):
     approved_date = models.DateTimeField(null=True, blank=True)
     borrowed_date = models.DateTimeField(null=True, blank=True)
     returned_date = models.DateTimeField(null=True, blank=True)
+    # Not set by QuerySet.update(); pass updated_at explicitly there
+    updated_at = models.DateTimeField(auto_now=True)
     total_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     notes = models.TextField(blank=True, help_text='Any special requests or notes?')
 
+    objects = RentalQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Availability and overlap checks for one item
+            models.Index(fields=['item', 'status', 'start_date', 'end_date'], name='rental_item_status_dates_idx'),
+            # "My rentals" / "My lendings" dashboards
+            models.Index(fields=['borrower', 'status', '-request_date'], name='rental_borrower_status_idx'),
+            models.Index(fields=['lender', 'status', '-request_date'], name='rental_lender_status_idx'),
+            # Date-range exports
+            models.Index(fields=['request_date'], name='rental_request_date_idx'),
+            # Delta exports
+            models.Index(fields=['updated_at'], name='rental_updated_idx'),
+            # Scheduler: approved rentals starting and borrowed rentals due back
+            models.Index(fields=['status', 'start_date'], name='rental_status_start_idx'),
+            models.Index(fields=['status', 'end_date'], name='rental_status_end_idx'),
+        ]
+
     def __str__(self):
         return f"{self.borrower.username} - {self.item.name} ({self.status})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        rental = super().from_db(db, field_names, values)
+        # Read from __dict__ so deferred dates are not fetched
+        rental._quoted_dates = (rental.__dict__.get('start_date'), rental.__dict__.get('end_date'))
+        return rental
+
     def save(self, *args, **kwargs):
-        # Calculate total price if per_day is True
-        if self.item.per_day and self.start_date and self.end_date:
-            days = (self.end_date - self.start_date).days + 1
-            self.total_price = self.item.price * days
-        else:
-            self.total_price = self.item.price
-        super().save(*args, **kwargs)
+        # Quote once, when requested or rescheduled; status changes keep
+        # the total and do not load the item
+        dates = (self.start_date, self.end_date)
+        if self.total_price is None or dates != getattr(self, '_quoted_dates', None):
+            self.total_price = pricing.quote_item(self.item, *dates)
+            self._quoted_dates = dates
+        # The rollup signal handlers run inside the same transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
 
 class Notification(models.Model):
     TYPE_CHOICES = [
@@ -107,10 +221,135 @@ class Notification(models.Model):
     message = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     read = models.BooleanField(default=False)
+    # Not set by QuerySet.update(); pass updated_at explicitly there
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Unread badge count and unread-first lookups
+            models.Index(fields=['user', 'read', '-created_at'], name='notification_user_read_idx'),
+            # Notification list, newest first
+            models.Index(fields=['user', '-created_at'], name='notification_user_created_idx'),
+            # Delta exports
+            models.Index(fields=['updated_at'], name='notification_updated_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.type} ({self.created_at})"
 
+
+# Daily rollups of rental activity, bucketed by the day a rental was
+# requested. Maintained by pages.rollups; rebuild with `rebuild_rollups`.
+class ItemDailyRollup(models.Model):
+    day = models.DateField()
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='daily_rollups')
+    rentals = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['item', 'day'], name='item_rollup_item_day_uniq'),
+        ]
+
+
+class UserDailyRollup(models.Model):
+    day = models.DateField()
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='daily_rollups')
+    borrowed = models.PositiveIntegerField(default=0)
+    lent = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day'], name='user_rollup_user_day_uniq'),
+        ]
+
+
+class StatusDailyRollup(models.Model):
+    day = models.DateField()
+    status = models.CharField(max_length=20, choices=Rental.STATUS_CHOICES)
+    rentals = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['status', 'day'], name='status_rollup_status_day_uniq'),
+        ]
+
+
+# Deleted rows, so delta exports can tell consumers what to remove.
+# Written by the post_delete signal handlers; rows older than
+# TOMBSTONE_RETENTION_DAYS are purged by lifecycle.run_due().
+class Tombstone(models.Model):
+    model = models.CharField(max_length=50)
+    object_id = models.PositiveBigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['model', 'deleted_at'], name='tombstone_model_deleted_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.model} #{self.object_id} (deleted {self.deleted_at})"
+
+
+def report_artifact_storage():
+    # Not served under MEDIA_URL, even when it sits on the media disk:
+    # reports hold contact details and are only downloaded by staff
+    # through the report job views
+    return FileSystemStorage(location=settings.REPORT_ARTIFACT_ROOT)
+
+
+class ReportJob(models.Model):
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    KIND_CHOICES = [
+        ('items_pdf', 'Items Report (PDF)'),
+        ('items_excel', 'Items Report (Excel)'),
+        ('rentals_pdf', 'Rental Activity Report (PDF)'),
+        ('rentals_excel', 'Rental Activity Report (Excel)'),
+        ('users_pdf', 'User Activity Report (PDF)'),
+        ('users_excel', 'User Activity Report (Excel)'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    progress = models.PositiveSmallIntegerField(default=0)
+    # Bumped by every claim; a worker only records results for its own attempt
+    attempt = models.PositiveSmallIntegerField(default=0)
+    requested_by = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, related_name='report_jobs')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    artifact = models.FileField(upload_to='reports/', storage=report_artifact_storage, blank=True)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # Workers claim the oldest queued job
+            models.Index(fields=['status', 'created_at'], name='reportjob_status_created_idx'),
+            # Expired artifacts are purged by finish time
+            models.Index(fields=['status', 'finished_at'], name='reportjob_status_finished_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.pk} ({self.status})"
+
+    @property
+    def is_finished(self):
+        return self.status in ('done', 'failed')
+
+
+# Which process runs a periodic job; taken and renewed by
+# lifecycle.hold_lease() so only one scheduler thread does the work.
+class SchedulerLease(models.Model):
+    name = models.CharField(max_length=50, unique=True)
+    holder = models.CharField(max_length=100, blank=True)
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.name} held by {self.holder or 'nobody'} until {self.expires_at}"
@@ -0,0 +1,90 @@
+# pages/notifications.py
+"""
+Per-user unread notification counters kept in the cache.
+
+The count is computed from the database on a miss, incremented when the
+creation of a Notification commits and decremented when one is marked
+read. Entries expire after UNREAD_COUNT_TIMEOUT, so any drift is
+reconciled from the database at least that often;
+``reconcile_unread_counts`` does it eagerly.
+"""
+from collections import Counter
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+
+from . import events
+from .models import Notification
+
+UNREAD_COUNT_TIMEOUT = 60 * 10
+
+
+def _key(user_id):
+    return f'unread_notifications:{user_id}'
+
+
+def get_unread_count(user_id):
+    count = cache.get(_key(user_id))
+    if count is None:
+        count = Notification.objects.filter(user_id=user_id, read=False).count()
+        cache.set(_key(user_id), count, UNREAD_COUNT_TIMEOUT)
+    return count
+
+
+def _adjust(user_id, delta):
+    try:
+        count = cache.incr(_key(user_id), delta)
+    except ValueError:
+        # Not cached: the next read recomputes it
+        return
+    if count < 0:
+        cache.delete(_key(user_id))
+
+
+def increment_unread(user_id, amount=1):
+    _adjust(user_id, amount)
+
+
+def decrement_unread(user_id, amount=1):
+    _adjust(user_id, -amount)
+
+
+def invalidate_unread(*user_ids):
+    """Drop cached counts, e.g. after bulk writes that bypass signals."""
+    cache.delete_many([_key(user_id) for user_id in user_ids])
+
+
+def create_many(notifications):
+    """Insert notifications with one bulk_create.
+
+    bulk_create sends no post_save, so this does what the signal handlers
+    would once the transaction commits: count them as unread and push them
+    to the users' open event streams.
+    """
+    created = Notification.objects.bulk_create(notifications)
+    unread = Counter(n.user_id for n in created if not n.read)
+    pushed = [(n.user_id, events.notification_event(n)) for n in created]
+
+    def publish():
+        for user_id, amount in unread.items():
+            increment_unread(user_id, amount)
+        broker = events.get_broker()
+        for user_id, event in pushed:
+            broker.publish(user_id, event)
+    transaction.on_commit(publish)
+    return created
+
+
+def reconcile_unread_counts(user_ids=None):
+    """Recompute cached counts from the database in one grouped query."""
+    unread = Notification.objects.filter(read=False)
+    if user_ids is not None:
+        unread = unread.filter(user_id__in=user_ids)
+    counts = dict(unread.values_list('user_id').annotate(count=Count('id')).order_by())
+
+    if user_ids is None:
+        from .models import CustomUser
+        user_ids = CustomUser.objects.values_list('pk', flat=True)
+    cache.set_many({_key(user_id): counts.get(user_id, 0) for user_id in user_ids}, UNREAD_COUNT_TIMEOUT)
+    return counts
@@ -0,0 +1,127 @@
+# pages/pagination.py
+"""
+Keyset (cursor) pagination for item listings and rental history.
+
+Each page continues from the last row of the previous one using a
+``(sort value, pk)`` comparison instead of OFFSET, so deep pages cost the
+same as the first one.
+"""
+import base64
+import json
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Q
+
+# sort_by choice from ItemSearchForm -> (field, descending)
+SORT_KEYS = {
+    'date_desc': ('date_posted', True),
+    'date_asc': ('date_posted', False),
+    'price_asc': ('price', False),
+    'price_desc': ('price', True),
+    # Only valid on querysets annotated by fulltext.search_items()
+    'relevance': ('search_rank', False),
+}
+DEFAULT_SORT = 'date_desc'
+ITEMS_PAGE_SIZE = 24
+
+
+class InvalidCursor(ValueError):
+    """Raised when a cursor cannot be decoded for the requested ordering."""
+
+
+def sort_key(sort_by):
+    """Return ``(field, descending)`` for a sort_by choice, defaulting to newest first."""
+    return SORT_KEYS.get(sort_by or DEFAULT_SORT, SORT_KEYS[DEFAULT_SORT])
+
+
+def _dump_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _load_value(field, raw):
+    if field == 'date_posted':
+        return datetime.fromisoformat(raw)
+    if field == 'search_rank':
+        return float(raw)
+    return Decimal(raw)
+
+
+def resolve_sort(sort_by, ranked):
+    """Pick the effective ordering for a listing.
+
+    Full-text results default to relevance; relevance falls back to the
+    default ordering when there is no ranked search.
+    """
+    if ranked and not sort_by:
+        return 'relevance'
+    if sort_by == 'relevance' and not ranked:
+        return DEFAULT_SORT
+    return sort_by
+
+
+def encode_cursor(value, pk):
+    """Build an opaque cursor pointing just after the row ``(value, pk)``."""
+    payload = json.dumps([_dump_value(value), pk])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def _decode(cursor, load_value):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw_value, pk = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return load_value(raw_value), int(pk)
+    except (ValueError, TypeError, InvalidOperation) as exc:
+        raise InvalidCursor(str(exc)) from exc
+
+
+def decode_cursor(cursor, sort_by):
+    """Return ``(value, pk)`` for a cursor produced by ``encode_cursor``."""
+    field, _ = sort_key(sort_by)
+    return _decode(cursor, lambda raw: _load_value(field, raw))
+
+
+def order_items(items, sort_by):
+    """Apply the ordering for ``sort_by`` with ``pk`` as a tiebreaker."""
+    field, descending = sort_key(sort_by)
+    prefix = '-' if descending else ''
+    return items.order_by(f'{prefix}{field}', f'{prefix}pk')
+
+
+def paginate(queryset, field, descending=False, cursor=None, page_size=ITEMS_PAGE_SIZE, load_value=datetime.fromisoformat):
+    """Return ``(page, next_cursor)`` for one page of ``queryset`` ordered by ``(field, pk)``.
+
+    ``load_value`` turns a cursor's value back into a ``field`` value; the
+    default suits datetime fields. ``next_cursor`` is ``None`` on the last
+    page. Raises ``InvalidCursor`` for a malformed cursor.
+    """
+    prefix = '-' if descending else ''
+    queryset = queryset.order_by(f'{prefix}{field}', f'{prefix}pk')
+
+    if cursor:
+        value, pk = _decode(cursor, load_value)
+        op = 'lt' if descending else 'gt'
+        queryset = queryset.filter(
+            Q(**{f'{field}__{op}': value}) |
+            Q(**{field: value, f'pk__{op}': pk})
+        )
+
+    # Fetch one extra row to learn whether another page exists
+    page = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(page) > page_size:
+        page = page[:page_size]
+        next_cursor = encode_cursor(getattr(page[-1], field), page[-1].pk)
+    return page, next_cursor
+
+
+def paginate_items(items, sort_by, cursor=None, page_size=ITEMS_PAGE_SIZE):
+    """Return ``(page, next_cursor)`` for one page of ``items``.
+
+    ``next_cursor`` is ``None`` on the last page. Raises ``InvalidCursor``
+    for a malformed cursor.
+    """
+    field, descending = sort_key(sort_by)
+    return paginate(items, field, descending, cursor, page_size, lambda raw: _load_value(field, raw))
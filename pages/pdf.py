@@ -0,0 +1,144 @@
+# pages/pdf.py
+"""
+Shared PDF builder for the admin reports.
+
+Long tables are laid out as a run of ``LongTable`` segments of
+TABLE_CHUNK_ROWS rows each, every one with its own header row that repeats
+when the segment breaks across a page. Reportlab re-splits a table at each
+page break, so one table holding every row costs more per page the longer
+it gets. Bounded segments keep the cost per row flat and avoid layout
+errors on huge tables. Segments are created only when the layout reaches
+them (see ``_TableRun``), so rows are read from the database as pages are
+drawn rather than all held as table cells up front.
+
+Paragraph and table styles never change, so they are built once per
+process and shared by every report.
+"""
+from functools import lru_cache
+from itertools import islice
+
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import inch
+from reportlab.platypus import Flowable, LongTable, Paragraph, SimpleDocTemplate, Spacer, TableStyle
+
+# Rows per LongTable segment
+TABLE_CHUNK_ROWS = 500
+BRAND_COLOR = colors.HexColor('#4F46E5')
+
+
+@lru_cache(maxsize=None)
+def paragraph_styles():
+    styles = getSampleStyleSheet()
+    return {
+        'title': ParagraphStyle(
+            'CustomTitle',
+            parent=styles['Heading1'],
+            fontSize=24,
+            textColor=BRAND_COLOR,
+            spaceAfter=30,
+            alignment=TA_CENTER
+        ),
+        'heading': styles['Heading2'],
+        'normal': styles['Normal'],
+    }
+
+
+@lru_cache(maxsize=None)
+def table_style(header_font_size=11):
+    return TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), BRAND_COLOR),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), header_font_size),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 1), (-1, -1), 9),
+    ])
+
+
+def table_segments(headers, rows, col_widths, header_font_size=11, chunk_rows=TABLE_CHUNK_ROWS):
+    """Yield ``LongTable`` segments of at most ``chunk_rows`` rows from the ``rows`` iterable."""
+    rows = iter(rows)
+    style = table_style(header_font_size)
+    first = True
+    while True:
+        chunk = list(islice(rows, chunk_rows))
+        # An empty table still shows its header row
+        if not chunk and not first:
+            return
+        first = False
+        # Widths are fixed up front so reportlab never measures every cell
+        yield LongTable([headers] + chunk, colWidths=col_widths, repeatRows=1, style=style)
+
+
+class _TableRun(Flowable):
+    """The segments of a table still to be laid out, as one flowable.
+
+    It never fits where it stands, so the frame asks it to split. Each
+    split pulls the next segment, cut to the space left if need be, and
+    puts a new run for the remaining segments after it. Rows are thus read
+    as pages are laid out, using only the flowable wrap/split protocol.
+    """
+
+    def __init__(self, segments, segment=None):
+        super().__init__()
+        self._segments = segments
+        self._segment = segment
+
+    def wrap(self, availWidth, availHeight):
+        return availWidth, availHeight + 1
+
+    def split(self, availWidth, availHeight):
+        if self._segment is None:
+            # table_segments() always yields at least the header row
+            self._segment = next(self._segments)
+        segment = self._segment
+        _, height = segment.wrap(availWidth, availHeight)
+        parts = [segment] if height <= availHeight else segment.split(availWidth, availHeight)
+        if not parts:
+            # Not even the header and a row fit; the next frame is tried
+            return []
+        following = next(self._segments, None)
+        if following is not None:
+            parts.append(_TableRun(self._segments, following))
+        return parts
+
+    def draw(self):
+        pass
+
+
+class PdfReport:
+    """A titled report document: add paragraphs and tables, then ``build()``."""
+
+    def __init__(self, output, title):
+        self.doc = SimpleDocTemplate(output, pagesize=letter)
+        self.styles = paragraph_styles()
+        # Flowables, and generators of table segments
+        self.elements = [Paragraph(title, self.styles['title']), Spacer(1, 0.2*inch)]
+
+    def summary(self, text):
+        self.elements += [Paragraph(text, self.styles['normal']), Spacer(1, 0.3*inch)]
+
+    def heading(self, text):
+        self.elements += [Paragraph(text, self.styles['heading']), Spacer(1, 0.1*inch)]
+
+    def table(self, headers, rows, col_widths, header_font_size=11):
+        self.elements.append(table_segments(headers, rows, col_widths, header_font_size))
+
+    def spacer(self, height=0.3*inch):
+        self.elements.append(Spacer(1, height))
+
+    def flowables(self):
+        return [
+            element if isinstance(element, Flowable) else _TableRun(iter(element))
+            for element in self.elements
+        ]
+
+    def build(self):
+        self.doc.build(self.flowables())
@@ -0,0 +1,77 @@
+# pages/pools.py
+"""
+Worker process pools started on demand.
+
+Report jobs and report bundles hand work to a local process pool. A pool
+is only started when work is submitted, and it is shut down again once it
+has been idle for REPORT_POOL_IDLE_TIMEOUT seconds. A web process that is
+not building reports therefore keeps no worker processes around.
+"""
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+
+
+class IdleProcessPool:
+    """ProcessPoolExecutor that starts on first submit and stops when idle.
+
+    ``workers_setting`` names the setting that sizes the pool; it is read
+    each time the pool starts.
+    """
+
+    def __init__(self, workers_setting):
+        self.workers_setting = workers_setting
+        self._executor = None
+        self._pending = 0
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._executor is None:
+                # Spawned workers start clean instead of inheriting the
+                # parent's open database connections
+                self._executor = ProcessPoolExecutor(
+                    max_workers=getattr(settings, self.workers_setting),
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=django.setup,
+                )
+            self._pending += 1
+            future = self._executor.submit(fn, *args)
+        future.add_done_callback(self._task_done)
+        return future
+
+    def _task_done(self, future):
+        with self._lock:
+            self._pending -= 1
+            if self._pending == 0 and self._executor is not None:
+                self._timer = threading.Timer(
+                    getattr(settings, 'REPORT_POOL_IDLE_TIMEOUT', 300), self._shutdown_if_idle
+                )
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _shutdown_if_idle(self):
+        with self._lock:
+            if self._pending or self._executor is None:
+                return
+            executor, self._executor, self._timer = self._executor, None, None
+        executor.shutdown(wait=False)
+
+    @property
+    def running(self):
+        return self._executor is not None
+
+    def shutdown(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            executor, self._executor, self._timer = self._executor, None, None
+        if executor is not None:
+            executor.shutdown()
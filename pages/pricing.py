@@ -0,0 +1,62 @@
+# pages/pricing.py
+"""
+Rental price quotes.
+
+A rental's total is quoted once, when it is requested or when its dates
+change, and stored in ``Rental.total_price``. Status changes keep the
+stored total and never load the item. ``quote_many`` prices a list of
+``(item, start, end)`` requests with at most one query for the items, for
+the request form's running total and calendar views.
+"""
+# Most requests one quote_many call (and one quote API request) may price
+MAX_BATCH_QUOTES = 366
+
+
+def rental_days(start, end):
+    """Days charged for ``start``..``end``; both ends count."""
+    return (end - start).days + 1
+
+
+def quote(price, per_day, start, end):
+    """Total for renting at ``price`` from ``start`` to ``end``.
+
+    Per-day prices are multiplied by the number of days; flat prices, or
+    per-day prices without both dates, are charged once.
+    """
+    if per_day and start and end:
+        return price * rental_days(start, end)
+    return price
+
+
+def quote_item(item, start, end):
+    return quote(item.price, item.per_day, start, end)
+
+
+def quote_many(requests):
+    """Price ``(item, start, end)`` tuples, where ``item`` is an Item or its pk.
+
+    Items given by pk are loaded with one query. Returns the totals in
+    request order, with ``None`` for items that do not exist.
+    """
+    from .models import Item
+
+    requests = list(requests)
+    if len(requests) > MAX_BATCH_QUOTES:
+        raise ValueError(f'At most {MAX_BATCH_QUOTES} quotes per call')
+    pks = {item for item, _, _ in requests if not isinstance(item, Item)}
+    prices = {}
+    if pks:
+        prices = {
+            pk: (price, per_day)
+            for pk, price, per_day in Item.objects.filter(pk__in=pks).values_list('pk', 'price', 'per_day')
+        }
+
+    totals = []
+    for item, start, end in requests:
+        if isinstance(item, Item):
+            totals.append(quote_item(item, start, end))
+        elif item in prices:
+            totals.append(quote(*prices[item], start, end))
+        else:
+            totals.append(None)
+    return totals
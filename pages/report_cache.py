@@ -0,0 +1,127 @@
+# pages/report_cache.py
+"""
+Rendered report cache for the export views.
+
+A report is cached under its kind plus a fingerprint of the data it reads.
+The fingerprint is read from the database itself: the highest primary key
+and latest ``updated_at`` of each table and the newest tombstone. Primary
+keys catch bulk inserts, ``updated_at`` catches edits and tombstones catch
+deletes, whichever process made them, and each is one index lookup. Users
+have no tombstones, so their row count is included too. The fingerprint
+doubles as the ETag, so an unchanged report costs a 304 or a cache read
+instead of a rebuild.
+
+An index of cached entries is kept alongside them. Entries for an outdated
+fingerprint are dropped when the report is stored again, and the oldest
+entries are evicted once REPORT_CACHE_MAX_BYTES is exceeded.
+"""
+import hashlib
+import tempfile
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+
+from . import reports, streaming
+from .models import CustomUser, Item, Rental, Tombstone
+
+INDEX_KEY = 'report_cache:index'
+CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def _max_bytes():
+    return getattr(settings, 'REPORT_CACHE_MAX_BYTES', 50 * 1024 * 1024)
+
+
+def _max_entry_bytes():
+    # One report may not take more than a quarter of the budget
+    return _max_bytes() // 4
+
+
+def _table_stats():
+    # One round trip; everything but the user count is an index lookup
+    quote = connection.ops.quote_name
+    columns = [f'(SELECT COUNT(*) FROM {quote(CustomUser._meta.db_table)})']
+    for model in (Item, Rental, CustomUser):
+        table, pk = quote(model._meta.db_table), quote(model._meta.pk.column)
+        updated = quote(model._meta.get_field('updated_at').column)
+        columns += [f'(SELECT MAX({pk}) FROM {table})', f'(SELECT MAX({updated}) FROM {table})']
+    columns.append(f'(SELECT MAX({quote(Tombstone._meta.pk.column)}) FROM {quote(Tombstone._meta.db_table)})')
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT {', '.join(columns)}")
+        return cursor.fetchone()
+
+
+def data_fingerprint():
+    """Digest of the state of every table the reports read."""
+    return hashlib.sha1(repr(tuple(_table_stats())).encode()).hexdigest()[:20]
+
+
+def _entry_key(kind, fingerprint):
+    return f'report_cache:{kind}:{fingerprint}'
+
+
+def get(kind, fingerprint):
+    return cache.get(_entry_key(kind, fingerprint))
+
+
+def store(kind, fingerprint, content):
+    """Cache ``content`` and evict stale or excess entries. Returns False if it is too big."""
+    if len(content) > _max_entry_bytes():
+        return False
+    key = _entry_key(kind, fingerprint)
+    cache.set(key, content, CACHE_TIMEOUT)
+
+    # Index of (key, size), oldest first; older fingerprints of this kind are stale
+    prefix = f'report_cache:{kind}:'
+    index = cache.get(INDEX_KEY, [])
+    stale = [entry_key for entry_key, _ in index if entry_key.startswith(prefix) and entry_key != key]
+    index = [(entry_key, size) for entry_key, size in index if not entry_key.startswith(prefix)]
+    index.append((key, len(content)))
+
+    total = sum(size for _, size in index)
+    while total > _max_bytes() and len(index) > 1:
+        evicted_key, size = index.pop(0)
+        stale.append(evicted_key)
+        total -= size
+    cache.delete_many(stale)
+    cache.set(INDEX_KEY, index, timeout=None)
+    return True
+
+
+def report_response(request, kind):
+    """Serve report ``kind`` from the cache when its data is unchanged.
+
+    Answers If-None-Match with 304 Not Modified without rendering anything.
+    """
+    filename, content_type, writer = reports.REPORTS[kind]
+    fingerprint = data_fingerprint()
+    etag = f'"{kind}-{fingerprint}"'
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        content = get(kind, fingerprint)
+        if content is None:
+            output = tempfile.SpooledTemporaryFile(max_size=_max_entry_bytes())
+            writer(output)
+            if output.tell() <= _max_entry_bytes():
+                output.seek(0)
+                content = output.read()
+                output.close()
+                store(kind, fingerprint, content)
+
+        if content is None:
+            # Too big to cache: stream the rendered file
+            output.seek(0)
+            response = streaming.file_response(request, output, content_type=content_type)
+            response.block_size = reports.STREAM_CHUNK_SIZE
+        else:
+            response = HttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+
+    response['ETag'] = etag
+    # Browsers keep the file but revalidate it on every download
+    response['Cache-Control'] = 'private, no-cache'
+    return response
@@ -0,0 +1,303 @@
+# pages/reports.py
+"""
+Data, Excel and PDF writers for the admin report exports.
+
+Every report table comes from one query: related names are joined with
+``select_related`` and per-item figures are aggregated in SQL, so an
+export issues the same number of queries however much data there is.
+
+Workbooks use openpyxl's write-only mode: every appended row is serialised
+to a temporary file straight away, and rows are read with
+``QuerySet.iterator()``. Memory therefore stays flat however many rows a
+report has. PDFs are laid out by the shared builder in ``pdf``.
+``report_cache`` serves the finished files.
+"""
+from django.db.models import Count, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Font, PatternFill
+from openpyxl.utils import get_column_letter
+from reportlab.lib.units import inch
+
+from . import rollups
+from .pdf import PdfReport
+from .models import CustomUser, Item, Rental
+
+PDF_CONTENT_TYPE = 'application/pdf'
+EXCEL_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+# Rows fetched per database round trip while writing a sheet
+ITERATOR_CHUNK_SIZE = 2000
+# Bytes per chunk of the streamed response
+STREAM_CHUNK_SIZE = 64 * 1024
+# Rentals that earned money for the lender
+REVENUE_STATUSES = ['borrowed', 'returned']
+
+HEADER_FILL = PatternFill(start_color='4F46E5', end_color='4F46E5', fill_type='solid')
+HEADER_FONT = Font(bold=True, color='FFFFFF', size=12)
+HEADER_ALIGNMENT = Alignment(horizontal='center', vertical='center')
+
+ITEM_HEADERS = ['ID', 'Name', 'Description', 'Owner', 'Category', 'Price', 'Per Day', 'Status', 'Date Posted']
+RENTAL_HEADERS = ['ID', 'Item', 'Borrower', 'Lender', 'Status', 'Start Date', 'End Date', 'Total Price', 'Request Date']
+MOST_BORROWED_HEADERS = ['Rank', 'Item Name', 'Owner', 'Category', 'Times Borrowed', 'Total Revenue']
+ITEM_PDF_HEADERS = ['ID', 'Name', 'Owner', 'Category', 'Price', 'Status']
+USER_HEADERS = ['ID', 'Username', 'Hostel', 'Room', 'Phone', 'Items Listed', 'Times Borrowed', 'Times Lent', 'Date Joined']
+
+
+def _header_cell(worksheet, value):
+    cell = WriteOnlyCell(worksheet, value=value)
+    cell.fill = HEADER_FILL
+    cell.font = HEADER_FONT
+    cell.alignment = HEADER_ALIGNMENT
+    return cell
+
+
+def add_sheet(workbook, title, headers, rows, width=15):
+    """Append a sheet with a styled header row followed by ``rows``."""
+    worksheet = workbook.create_sheet(title=title)
+    # Column widths must be set before the first row is written
+    for col in range(1, len(headers) + 1):
+        worksheet.column_dimensions[get_column_letter(col)].width = width
+    worksheet.append([_header_cell(worksheet, header) for header in headers])
+    for row in rows:
+        worksheet.append(row)
+    return worksheet
+
+
+def item_summary():
+    return Item.objects.aggregate(
+        total=Count('pk'),
+        available=Count('pk', filter=Q(is_available=True)),
+    )
+
+
+def rental_summary():
+    totals = rollups.status_totals()
+    return {
+        'total': sum(totals.values()),
+        'active': totals['borrowed'],
+        'completed': totals['returned'],
+    }
+
+
+def user_summary():
+    summary = rollups.active_user_counts()
+    summary['total'] = CustomUser.objects.count()
+    return summary
+
+
+def report_items():
+    return Item.objects.select_related('owner').order_by('-date_posted')
+
+
+def report_rentals():
+    return Rental.objects.select_related('item', 'borrower', 'lender').order_by('-request_date')
+
+
+def most_borrowed_items(limit):
+    """Items by rental count, with their owner and revenue, in one query."""
+    return Item.objects.select_related('owner').annotate(
+        rental_count=Count('rentals'),
+        total_revenue=Sum('rentals__total_price', filter=Q(rentals__status__in=REVENUE_STATUSES)),
+    ).order_by('-rental_count')[:limit]
+
+
+def top_lenders(limit):
+    """Top lenders from the rollups, each with ``items_listed`` set."""
+    lenders = rollups.top_lenders(limit)
+    listed = dict(
+        Item.objects.filter(owner__in=lenders).values_list('owner').annotate(n=Count('pk')).order_by()
+    )
+    for user in lenders:
+        user.items_listed = listed.get(user.pk, 0)
+    return lenders
+
+
+def count_subquery(queryset, column):
+    """Correlated count of ``queryset`` rows whose ``column`` is the outer row's pk."""
+    counts = queryset.filter(**{column: OuterRef('pk')}).order_by().values(column).annotate(n=Count('pk')).values('n')
+    return Coalesce(Subquery(counts), 0)
+
+
+def user_activity():
+    """Every user with ``items_count``, ``borrow_count`` and ``lend_count`` set.
+
+    Each count is its own subquery on an indexed foreign key. Counting all
+    three over joins would multiply a user's items, borrowings and
+    lendings together.
+    """
+    return CustomUser.objects.annotate(
+        items_count=count_subquery(Item.objects.all(), 'owner'),
+        borrow_count=count_subquery(Rental.objects.all(), 'borrower'),
+        lend_count=count_subquery(Rental.objects.all(), 'lender'),
+    ).order_by('-borrow_count', '-lend_count', 'pk')
+
+
+def item_rows():
+    for item in report_items().iterator(chunk_size=ITERATOR_CHUNK_SIZE):
+        yield [
+            item.pk,
+            item.name,
+            item.description,
+            item.owner.username,
+            item.get_category_display(),
+            float(item.price),
+            'Yes' if item.per_day else 'No',
+            'Available' if item.is_available else 'Unavailable',
+            item.date_posted.strftime('%Y-%m-%d %H:%M'),
+        ]
+
+
+def rental_rows():
+    for rental in report_rentals().iterator(chunk_size=ITERATOR_CHUNK_SIZE):
+        yield [
+            rental.pk,
+            rental.item.name,
+            rental.borrower.username,
+            rental.lender.username,
+            rental.get_status_display(),
+            rental.start_date.strftime('%Y-%m-%d'),
+            rental.end_date.strftime('%Y-%m-%d'),
+            float(rental.total_price) if rental.total_price else 0,
+            rental.request_date.strftime('%Y-%m-%d %H:%M'),
+        ]
+
+
+def most_borrowed_rows(limit=20):
+    for rank, item in enumerate(most_borrowed_items(limit), 1):
+        yield [
+            rank,
+            item.name,
+            item.owner.username,
+            item.get_category_display(),
+            item.rental_count,
+            float(item.total_revenue or 0),
+        ]
+
+
+def user_rows():
+    for user in user_activity().iterator(chunk_size=ITERATOR_CHUNK_SIZE):
+        yield [
+            user.pk,
+            user.username,
+            user.hostel_name,
+            user.room_number,
+            user.phone_number,
+            user.items_count,
+            user.borrow_count,
+            user.lend_count,
+            user.date_joined.strftime('%Y-%m-%d'),
+        ]
+
+
+def items_workbook():
+    workbook = Workbook(write_only=True)
+    add_sheet(workbook, 'Items Report', ITEM_HEADERS, item_rows())
+    return workbook
+
+
+def rentals_workbook():
+    workbook = Workbook(write_only=True)
+    add_sheet(workbook, 'All Rentals', RENTAL_HEADERS, rental_rows())
+    add_sheet(workbook, 'Most Borrowed', MOST_BORROWED_HEADERS, most_borrowed_rows(), width=18)
+    return workbook
+
+
+def users_workbook():
+    workbook = Workbook(write_only=True)
+    add_sheet(workbook, 'User Activity', USER_HEADERS, user_rows())
+    return workbook
+
+
+def write_items_excel(output):
+    items_workbook().save(output)
+
+
+def write_rentals_excel(output):
+    rentals_workbook().save(output)
+
+
+def write_users_excel(output):
+    users_workbook().save(output)
+
+
+def item_pdf_rows():
+    for item in report_items().iterator(chunk_size=ITERATOR_CHUNK_SIZE):
+        yield [
+            str(item.pk),
+            item.name[:30],
+            item.owner.username,
+            item.get_category_display(),
+            f"${item.price}/day" if item.per_day else f"${item.price}",
+            'Available' if item.is_available else 'Unavailable',
+        ]
+
+
+def write_items_pdf(output):
+    """Items report: summary line and every item."""
+    report = PdfReport(output, "BroRent - Items Report")
+    stats = item_summary()
+    report.summary(f"Total Items: {stats['total']} | Available: {stats['available']} | Unavailable: {stats['total'] - stats['available']}")
+    report.table(
+        ITEM_PDF_HEADERS, item_pdf_rows(),
+        col_widths=[0.5*inch, 2*inch, 1.2*inch, 1.2*inch, 1*inch, 1*inch], header_font_size=12,
+    )
+    report.build()
+
+
+def write_rentals_pdf(output):
+    """Rental activity report: summary line and the most borrowed items."""
+    report = PdfReport(output, "BroRent - Rental Activity Report")
+    stats = rental_summary()
+    report.summary(f"Total Rentals: {stats['total']} | Active: {stats['active']} | Completed: {stats['completed']}")
+
+    report.heading("Most Borrowed Items")
+    rows = (
+        [str(rank), item.name[:30], item.owner.username, str(item.rental_count), item.get_category_display()]
+        for rank, item in enumerate(rollups.most_borrowed_items(15), 1)
+    )
+    report.table(
+        ['Rank', 'Item Name', 'Owner', 'Times Borrowed', 'Category'], rows,
+        col_widths=[0.6*inch, 2.5*inch, 1.2*inch, 1.2*inch, 1.3*inch],
+    )
+    report.build()
+
+
+def write_users_pdf(output):
+    """User activity report: summary line, top borrowers and top lenders."""
+    report = PdfReport(output, "BroRent - User Activity Report")
+    stats = user_summary()
+    report.summary(f"Total Users: {stats['total']} | Active Borrowers: {stats['active_borrowers']} | Active Lenders: {stats['active_lenders']}")
+
+    report.heading("Top Borrowers")
+    rows = (
+        [str(rank), user.username, user.hostel_name, str(user.borrow_count), user.phone_number]
+        for rank, user in enumerate(rollups.top_borrowers(10), 1)
+    )
+    report.table(
+        ['Rank', 'Username', 'Hostel', 'Items Borrowed', 'Phone'], rows,
+        col_widths=[0.6*inch, 1.5*inch, 1.5*inch, 1.2*inch, 1.5*inch],
+    )
+    report.spacer()
+
+    report.heading("Top Lenders")
+    rows = (
+        [str(rank), user.username, user.hostel_name, str(user.lend_count), str(user.items_listed)]
+        for rank, user in enumerate(top_lenders(10), 1)
+    )
+    report.table(
+        ['Rank', 'Username', 'Hostel', 'Times Lent', 'Items Listed'], rows,
+        col_widths=[0.6*inch, 1.5*inch, 1.5*inch, 1.2*inch, 1.2*inch],
+    )
+    report.build()
+
+
+# Report kind -> (download filename, content type, writer taking a binary file)
+REPORTS = {
+    'items_pdf': ('items_report.pdf', PDF_CONTENT_TYPE, write_items_pdf),
+    'items_excel': ('items_report.xlsx', EXCEL_CONTENT_TYPE, write_items_excel),
+    'rentals_pdf': ('rentals_report.pdf', PDF_CONTENT_TYPE, write_rentals_pdf),
+    'rentals_excel': ('rentals_report.xlsx', EXCEL_CONTENT_TYPE, write_rentals_excel),
+    'users_pdf': ('users_activity_report.pdf', PDF_CONTENT_TYPE, write_users_pdf),
+    'users_excel': ('users_activity_report.xlsx', EXCEL_CONTENT_TYPE, write_users_excel),
+}
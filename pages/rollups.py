@@ -0,0 +1,140 @@
+# pages/rollups.py
+"""
+Daily rental rollups behind the admin dashboard and the rentals/users PDFs.
+
+Each rental counts once towards its item, its borrower, its lender and its
+current status, on the day it was requested. The Rental signal handlers
+adjust the counters on create, status change and delete. They run inside
+the transaction of the save. Code that changes rentals with
+``QuerySet.update()`` must call ``record_status_change()`` itself. The
+``rebuild_rollups`` command recomputes everything from the Rental table.
+
+Readers sum the daily rows, so their cost follows the number of active
+item/user days rather than the full rental history.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import CustomUser, Item, ItemDailyRollup, Rental, StatusDailyRollup, UserDailyRollup
+
+
+def rollup_day(rental):
+    return timezone.localdate(rental.request_date)
+
+
+def _bump(model, field, delta, **key):
+    """Add ``delta`` to ``field`` of the rollup row for ``key``, creating it if needed."""
+    if model.objects.filter(**key).update(**{field: F(field) + delta}):
+        return
+    if delta < 0:
+        # Nothing to take away from (e.g. the rollup row went with a deleted item)
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**key, **{field: delta})
+    except IntegrityError:
+        # Created concurrently
+        model.objects.filter(**key).update(**{field: F(field) + delta})
+
+
+def record_rental(rental, delta=1):
+    """Count a new rental (``delta=1``) or remove a deleted one (``delta=-1``)."""
+    day = rollup_day(rental)
+    _bump(ItemDailyRollup, 'rentals', delta, day=day, item_id=rental.item_id)
+    _bump(UserDailyRollup, 'borrowed', delta, day=day, user_id=rental.borrower_id)
+    _bump(UserDailyRollup, 'lent', delta, day=day, user_id=rental.lender_id)
+    _bump(StatusDailyRollup, 'rentals', delta, day=day, status=rental.status)
+
+
+def record_status_change(day, old_status, new_status, count=1):
+    """Move ``count`` rentals requested on ``day`` from one status to another."""
+    if old_status == new_status:
+        return
+    _bump(StatusDailyRollup, 'rentals', -count, day=day, status=old_status)
+    _bump(StatusDailyRollup, 'rentals', count, day=day, status=new_status)
+
+
+def rebuild():
+    """Recompute every rollup from the Rental table."""
+    rentals = Rental.objects.annotate(day=TruncDate('request_date'))
+    with transaction.atomic():
+        ItemDailyRollup.objects.all().delete()
+        ItemDailyRollup.objects.bulk_create(
+            ItemDailyRollup(day=row['day'], item_id=row['item'], rentals=row['n'])
+            for row in rentals.values('day', 'item').annotate(n=Count('pk')).order_by()
+        )
+
+        UserDailyRollup.objects.all().delete()
+        users = {}
+        for field, column in (('borrowed', 'borrower'), ('lent', 'lender')):
+            for row in rentals.values('day', column).annotate(n=Count('pk')).order_by():
+                key = (row['day'], row[column])
+                users.setdefault(key, UserDailyRollup(day=key[0], user_id=key[1]))
+                setattr(users[key], field, row['n'])
+        UserDailyRollup.objects.bulk_create(users.values())
+
+        StatusDailyRollup.objects.all().delete()
+        StatusDailyRollup.objects.bulk_create(
+            StatusDailyRollup(day=row['day'], status=row['status'], rentals=row['n'])
+            for row in rentals.values('day', 'status').annotate(n=Count('pk')).order_by()
+        )
+
+
+def status_totals():
+    """``{status: rentals}`` over all days, including zero for unused statuses."""
+    totals = dict.fromkeys((choice for choice, _ in Rental.STATUS_CHOICES), 0)
+    rows = StatusDailyRollup.objects.values('status').annotate(total=Sum('rentals')).order_by()
+    totals.update((row['status'], row['total']) for row in rows)
+    return totals
+
+
+def most_borrowed_items(limit):
+    """Items with the most rentals, each with ``rental_count`` set."""
+    ranked = list(
+        ItemDailyRollup.objects.values('item').annotate(total=Sum('rentals'))
+        .filter(total__gt=0).order_by('-total', 'item')[:limit]
+    )
+    items = Item.objects.select_related('owner').in_bulk([row['item'] for row in ranked])
+    result = []
+    for row in ranked:
+        item = items[row['item']]
+        item.rental_count = row['total']
+        result.append(item)
+    return result
+
+
+def _top_users(field, attr, limit):
+    ranked = list(
+        UserDailyRollup.objects.values('user').annotate(total=Sum(field))
+        .filter(total__gt=0).order_by('-total', 'user')[:limit]
+    )
+    users = CustomUser.objects.in_bulk([row['user'] for row in ranked])
+    result = []
+    for row in ranked:
+        user = users[row['user']]
+        setattr(user, attr, row['total'])
+        result.append(user)
+    return result
+
+
+def top_borrowers(limit):
+    """Users with the most borrow requests, each with ``borrow_count`` set."""
+    return _top_users('borrowed', 'borrow_count', limit)
+
+
+def top_lenders(limit):
+    """Users with the most lend requests, each with ``lend_count`` set."""
+    return _top_users('lent', 'lend_count', limit)
+
+
+def active_user_counts():
+    """Number of users who have borrowed and who have lent at least once."""
+    per_user = UserDailyRollup.objects.values('user').annotate(
+        borrowed_total=Sum('borrowed'), lent_total=Sum('lent')
+    ).order_by()
+    return per_user.aggregate(
+        active_borrowers=Count('user', filter=Q(borrowed_total__gt=0)),
+        active_lenders=Count('user', filter=Q(lent_total__gt=0)),
+    )
@@ -0,0 +1,156 @@
+# pages/search.py
+"""
+Item search service shared by the home feed, the item list and the JSON feed.
+
+Search parameters are normalised into a cache key. The cache holds the
+ordered ``(sort value, pk)`` rows for that search, so repeat searches skip
+the filter query and only hydrate the items on the requested page. Cached
+rows are invalidated by bumping version counters from the Item and Rental
+save/delete signals.
+"""
+import hashlib
+import json
+import time
+
+from django.core.cache import cache
+
+from . import fulltext
+from .models import Item
+from .pagination import (
+    ITEMS_PAGE_SIZE,
+    decode_cursor,
+    encode_cursor,
+    order_items,
+    paginate_items,
+    resolve_sort,
+    sort_key,
+)
+
+SEARCH_CACHE_TIMEOUT = 300
+# Longer result sets keep their head in the cache and page the tail from the DB
+MAX_CACHED_ROWS = 1000
+
+ITEM_VERSION_KEY = 'item_search:item_version'
+RENTAL_VERSION_KEY = 'item_search:rental_version'
+
+
+def _get_version(key):
+    # Seeded from the clock so an evicted counter never reuses old versions
+    return cache.get_or_set(key, time.time_ns, timeout=None)
+
+
+def _bump_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
+
+
+def bump_item_version():
+    _bump_version(ITEM_VERSION_KEY)
+
+
+def bump_rental_version():
+    _bump_version(RENTAL_VERSION_KEY)
+
+
+def normalise_params(cleaned_data):
+    """Reduce ItemSearchForm data to a canonical dict used for filtering and caching."""
+    search = ' '.join((cleaned_data.get('search') or '').split()).lower()
+    start = cleaned_data.get('start')
+    end = cleaned_data.get('end')
+    return {
+        'search': search,
+        'category': cleaned_data.get('category') or '',
+        'availability': bool(cleaned_data.get('availability')),
+        'sort_by': cleaned_data.get('sort_by') or '',
+        'start': start.isoformat() if start and end else '',
+        'end': end.isoformat() if start and end else '',
+    }
+
+
+def cache_key(params):
+    version = str(_get_version(ITEM_VERSION_KEY))
+    # Only availability windows depend on rental rows
+    if params['start']:
+        version += f".{_get_version(RENTAL_VERSION_KEY)}"
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()
+    return f'item_search:{version}:{digest}'
+
+
+def filter_items(params):
+    """Build the filtered Item queryset for normalised params.
+
+    Returns the queryset and the effective ``sort_by`` key.
+    """
+    items = Item.objects.all()
+    ranked = False
+
+    # Search by keyword through the full-text index
+    if params['search']:
+        items, ranked = fulltext.search_items(items, params['search'])
+
+    # Filter by category
+    if params['category']:
+        items = items.filter(category=params['category'])
+
+    # Filter by availability
+    if params['availability']:
+        items = items.filter(is_available=True)
+
+    # Only items free for the whole requested rental window
+    if params['start']:
+        items = items.free_between(params['start'], params['end'])
+
+    return items, resolve_sort(params['sort_by'], ranked)
+
+
+def _cached_rows(params):
+    key = cache_key(params)
+    entry = cache.get(key)
+    if entry is None:
+        items, sort_by = filter_items(params)
+        field, _ = sort_key(sort_by)
+        rows = list(order_items(items, sort_by).values_list(field, 'pk')[:MAX_CACHED_ROWS + 1])
+        entry = {
+            'sort_by': sort_by,
+            'rows': rows[:MAX_CACHED_ROWS],
+            'truncated': len(rows) > MAX_CACHED_ROWS,
+        }
+        cache.set(key, entry, SEARCH_CACHE_TIMEOUT)
+    return entry
+
+
+def hydrate(pks):
+    """Load the cards for ``pks`` in one query, preserving their order."""
+    by_pk = Item.objects.with_rental_status().select_related('owner').in_bulk(pks)
+    return [by_pk[pk] for pk in pks if pk in by_pk]
+
+
+def search_page(cleaned_data, cursor=None, page_size=ITEMS_PAGE_SIZE):
+    """Return ``(page, next_cursor)`` for a search.
+
+    Raises ``pagination.InvalidCursor`` for a malformed cursor.
+    """
+    params = normalise_params(cleaned_data)
+    entry = _cached_rows(params)
+    sort_by, rows = entry['sort_by'], entry['rows']
+
+    start = 0
+    if cursor:
+        _, last_pk = decode_cursor(cursor, sort_by)
+        positions = [idx for idx, (_, pk) in enumerate(rows) if pk == last_pk]
+        start = positions[0] + 1 if positions else None
+
+    window = rows[start:start + page_size + 1] if start is not None else []
+    if start is None or (entry['truncated'] and len(window) <= page_size):
+        # Past the cached head: fall back to keyset pagination in the DB
+        items, sort_by = filter_items(params)
+        items = items.with_rental_status().select_related('owner')
+        return paginate_items(items, sort_by, cursor, page_size)
+
+    page = hydrate([pk for _, pk in window[:page_size]])
+    next_cursor = None
+    if len(window) > page_size:
+        next_cursor = encode_cursor(*window[page_size - 1])
+    return page, next_cursor
@@ -0,0 +1,116 @@
+# pages/signals.py
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from . import events, fulltext, images, notifications, rollups, search
+from .models import CustomUser, Item, Notification, Rental, Tombstone
+
+
+@receiver(post_save, sender=Item)
+def index_item_on_save(sender, instance, raw=False, **kwargs):
+    """Keep the full-text index row in step with the item"""
+    if raw:
+        return
+    fulltext.index_item(instance)
+
+
+@receiver(post_delete, sender=Item)
+def unindex_item_on_delete(sender, instance, **kwargs):
+    fulltext.unindex_item(instance.pk)
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_delete, sender=Item)
+def invalidate_item_searches(sender, **kwargs):
+    search.bump_item_version()
+
+
+@receiver(post_save, sender=Rental)
+@receiver(post_delete, sender=Rental)
+def invalidate_availability_searches(sender, **kwargs):
+    search.bump_rental_version()
+
+
+@receiver(post_init, sender=Rental)
+def remember_rental_status(sender, instance, **kwargs):
+    # Read from __dict__ so a deferred status is not fetched
+    instance._rollup_status = instance.__dict__.get('status')
+
+
+@receiver(post_save, sender=Rental)
+def update_rollups_on_save(sender, instance, created, raw=False, **kwargs):
+    """Count new rentals and status transitions; Rental.save() makes this atomic"""
+    if raw:
+        return
+    if created:
+        rollups.record_rental(instance)
+    elif instance._rollup_status is not None:
+        rollups.record_status_change(rollups.rollup_day(instance), instance._rollup_status, instance.status)
+    instance._rollup_status = instance.status
+
+
+@receiver(post_delete, sender=Rental)
+def update_rollups_on_delete(sender, instance, **kwargs):
+    rollups.record_rental(instance, delta=-1)
+
+
+@receiver(post_init, sender=Item)
+@receiver(post_init, sender=CustomUser)
+def remember_image_name(sender, instance, **kwargs):
+    # Read from __dict__ so a deferred image is not fetched. Loaded rows hold
+    # the stored name; a new upload is not in storage yet, so nothing to clean
+    image = instance.__dict__.get('image')
+    if not isinstance(image, str):
+        image = image.name if getattr(image, '_committed', False) else ''
+    instance._image_name = image or ''
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_save, sender=CustomUser)
+def queue_image_derivatives(sender, instance, raw=False, **kwargs):
+    """Resize new uploads off the request thread and drop those of a replaced image"""
+    if raw:
+        return
+    name = instance.image.name or ''
+    if instance._image_name and instance._image_name != name:
+        images.discard_derivatives(instance._image_name)
+    instance._image_name = name
+    images.schedule_derivatives(instance.image)
+
+
+@receiver(post_delete, sender=Item)
+@receiver(post_delete, sender=CustomUser)
+def delete_image_derivatives(sender, instance, **kwargs):
+    images.discard_derivatives(instance.image.name)
+
+
+@receiver(post_save, sender=Notification)
+def count_new_notification(sender, instance, created, raw=False, **kwargs):
+    if created and not raw and not instance.read:
+        # Counted once committed, so a rolled back insert leaves no trace
+        user_id = instance.user_id
+        transaction.on_commit(lambda: notifications.increment_unread(user_id))
+
+
+@receiver(post_save, sender=Notification)
+def push_new_notification(sender, instance, created, raw=False, **kwargs):
+    """Send the notification to the user's open event streams once it is committed"""
+    if not created or raw:
+        return
+    user_id, event = instance.user_id, events.notification_event(instance)
+    transaction.on_commit(lambda: events.get_broker().publish(user_id, event))
+
+
+@receiver(post_delete, sender=Notification)
+def forget_deleted_notification(sender, instance, **kwargs):
+    user_id = instance.user_id
+    transaction.on_commit(lambda: notifications.invalidate_unread(user_id))
+
+
+@receiver(post_delete, sender=Item)
+@receiver(post_delete, sender=Rental)
+@receiver(post_delete, sender=Notification)
+def record_tombstone(sender, instance, **kwargs):
+    """Remember deleted rows for the delta exports"""
+    Tombstone.objects.create(model=sender._meta.model_name, object_id=instance.pk)
@@ -0,0 +1,52 @@
+# pages/streaming.py
+"""
+Streamed response bodies that stay streamed under ASGI.
+
+Django's ASGI handler cannot iterate a synchronous body from the event
+loop, so it reads the whole iterator into a list before it sends the
+first byte. That undoes every streamed export and download. The helpers
+here hand the WSGI handler the iterator unchanged, and give the ASGI
+handler an async iterator that pulls one chunk at a time on the
+request's sync thread, where its database connection lives.
+"""
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, StreamingHttpResponse
+
+_DONE = object()
+
+
+def _next_chunk(iterator):
+    return next(iterator, _DONE)
+
+
+async def aiterate(iterable):
+    """Async iterator over ``iterable``, advanced with ``sync_to_async``."""
+    iterator = await sync_to_async(iter)(iterable)
+    try:
+        while (chunk := await sync_to_async(_next_chunk)(iterator)) is not _DONE:
+            yield chunk
+    finally:
+        # A client that disconnects mid-stream still releases the cursor or file
+        if hasattr(iterator, 'close'):
+            await sync_to_async(iterator.close)()
+
+
+def streaming_response(request, chunks, **kwargs):
+    """StreamingHttpResponse over ``chunks`` that is not buffered under ASGI."""
+    if isinstance(request, ASGIRequest):
+        chunks = aiterate(chunks)
+    return StreamingHttpResponse(chunks, **kwargs)
+
+
+def file_response(request, file, **kwargs):
+    """FileResponse for the open binary ``file`` that is not buffered under ASGI.
+
+    The headers FileResponse derives from the file are kept, it still
+    closes the file once the response is done, and ``block_size`` may be
+    changed afterwards as on any FileResponse.
+    """
+    response = FileResponse(file, **kwargs)
+    if isinstance(request, ASGIRequest):
+        response.streaming_content = aiterate(iter(lambda: file.read(response.block_size), b''))
+    return response
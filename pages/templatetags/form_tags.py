@@ -0,0 +1,13 @@
+from django import template
+
+register = template.Library()
+
+
+@register.filter
+def add_class(field, css_class):
+    """Render a bound form field with ``css_class`` added to its widget's classes.
+
+    Usage: {{ form.search|add_class:"w-full rounded-md" }}
+    """
+    existing = field.field.widget.attrs.get('class', '')
+    return field.as_widget(attrs={'class': f'{existing} {css_class}'.strip()})
@@ -0,0 +1,39 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html
+
+from pages.images import DERIVATIVE_SIZES, derivative_name, derivatives_ready
+
+register = template.Library()
+
+
+def _srcset(name, widths, fmt):
+    return ', '.join(
+        f'{default_storage.url(derivative_name(name, width, fmt))} {width}w'
+        for width in widths
+    )
+
+
+@register.simple_tag
+def responsive_image(image, size='card', alt='', css_class='', sizes=None):
+    """Render ``image`` as a <picture> with WebP and JPEG ``srcset`` variants.
+
+    Falls back to the original upload until its derivatives exist.
+    Usage: {% responsive_image item.image 'card' alt=item.name css_class="..." %}
+    """
+    if not image:
+        return ''
+    if not derivatives_ready(image):
+        return format_html('<img src="{}" alt="{}" class="{}" loading="lazy">', image.url, alt, css_class)
+
+    widths, default_sizes = DERIVATIVE_SIZES[size]
+    sizes = sizes or default_sizes
+    fallback = default_storage.url(derivative_name(image.name, widths[-1], 'jpeg'))
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}" loading="lazy" decoding="async">'
+        '</picture>',
+        _srcset(image.name, widths, 'webp'), sizes,
+        fallback, _srcset(image.name, widths, 'jpeg'), sizes, alt, css_class
+    )
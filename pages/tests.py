@@ -1,3 +1,2062 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import json
+import os
+import posixpath
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import date, timedelta
+from decimal import Decimal
+from functools import partial
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, connections, transaction
+from django.db.transaction import TransactionManagementError
+from django.http import Http404, HttpResponse
+from django.template import Context, Template
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.html import escape
+from openpyxl import load_workbook
+from PIL import Image
+from reportlab.lib.units import inch
+from reportlab.platypus import LongTable
+
+from my_site.middleware import ServeMediaMiddleware
+
+from . import booking, bundle, dashboards, events, exports, fulltext, images, jobs, lifecycle, notifications, pdf, pools, pricing, report_cache, reports, rollups, search
+from .context_processors import notification_stream, unread_notifications_count
+from .forms import ItemSearchForm
+from .models import (
+    CustomUser,
+    Item,
+    ItemDailyRollup,
+    Notification,
+    Rental,
+    ReportJob,
+    StatusDailyRollup,
+    Tombstone,
+    UserDailyRollup,
+)
+from .pagination import (
+    ITEMS_PAGE_SIZE,
+    SORT_KEYS,
+    InvalidCursor,
+    decode_cursor,
+    order_items,
+    paginate_items,
+)
+
+
+def make_user(username, **extra):
+    return CustomUser.objects.create_user(
+        username=username,
+        password='testpass123',
+        hostel_name='H',
+        room_number='101',
+        phone_number='000',
+        **extra
+    )
+
+
+def make_item(owner, name='Item', **extra):
+    extra.setdefault('description', 'A test item')
+    extra.setdefault('price', '10.00')
+    return Item.objects.create(owner=owner, name=name, **extra)
+
+
+def make_rental(item, borrower, start, end, status='pending'):
+    return Rental.objects.create(
+        item=item,
+        borrower=borrower,
+        lender=item.owner,
+        start_date=start,
+        end_date=end,
+        status=status
+    )
+
+
+def tracked(generator_function, finished):
+    """``generator_function`` whose generators append to ``finished`` once exhausted."""
+    def wrapper(*args, **kwargs):
+        yield from generator_function(*args, **kwargs)
+        finished.append(True)
+    return wrapper
+
+
+async def async_body(response):
+    return b''.join([chunk async for chunk in response.streaming_content])
+
+
+class RentalStatusAnnotationTests(TestCase):
+    def setUp(self):
+        self.owner = make_user('owner')
+        self.borrower = make_user('borrower')
+        self.client.force_login(self.borrower)
+
+    def test_annotation_matches_per_item_check(self):
+        today = date.today()
+        cases = [
+            ('approved', today, today),
+            ('borrowed', today - timedelta(days=2), today + timedelta(days=2)),
+            ('pending', today, today),
+            ('returned', today - timedelta(days=1), today),
+            ('approved', today + timedelta(days=1), today + timedelta(days=3)),
+            ('borrowed', today - timedelta(days=5), today - timedelta(days=1)),
+        ]
+        for idx, (status, start, end) in enumerate(cases):
+            item = make_item(self.owner, name=f'Item {idx}')
+            make_rental(item, self.borrower, start, end, status=status)
+        make_item(self.owner, name='Never rented')
+        make_item(self.owner, name='Unlisted', is_available=False)
+
+        annotated = {item.pk: item for item in Item.objects.with_rental_status()}
+        for item in Item.objects.all():
+            self.assertEqual(annotated[item.pk].is_currently_rented(), item.is_currently_rented())
+            self.assertEqual(annotated[item.pk].get_availability_status(), item.get_availability_status())
+
+    def test_annotated_item_does_not_query_rentals(self):
+        item = make_item(self.owner)
+        make_rental(item, self.borrower, date.today(), date.today(), status='approved')
+        annotated = Item.objects.with_rental_status().get(pk=item.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(annotated.is_currently_rented())
+            self.assertFalse(annotated.get_availability_status())
+
+    def test_home_page_query_count_does_not_grow_with_items(self):
+        def count_queries():
+            # Compare cold renders so cached counters/search rows don't skew the count
+            cache.clear()
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(reverse('home'))
+            self.assertEqual(response.status_code, 200)
+            return len(ctx.captured_queries)
+
+        make_item(self.owner, name='First')
+        baseline = count_queries()
+        for idx in range(10):
+            item = make_item(self.owner, name=f'Extra {idx}')
+            make_rental(item, self.borrower, date.today(), date.today(), status='borrowed')
+        self.assertEqual(count_queries(), baseline)
+
+    def test_item_detail_shows_rented_state(self):
+        item = make_item(self.owner)
+        make_rental(item, self.borrower, date.today(), date.today(), status='approved')
+        response = self.client.get(reverse('item_detail', args=[item.pk]))
+        self.assertContains(response, 'Currently Rented')
+        self.assertFalse(response.context['item'].get_availability_status())
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.owner = make_user('owner')
+        self.client.force_login(self.owner)
+        # Duplicate prices exercise the pk tiebreaker
+        for idx in range(7):
+            make_item(self.owner, name=f'Item {idx}', price=f'{idx % 3 + 1}.00')
+
+    def walk(self, sort_by, page_size=3):
+        seen, cursor = [], None
+        while True:
+            page, cursor = paginate_items(Item.objects.all(), sort_by, cursor, page_size=page_size)
+            seen.extend(item.pk for item in page)
+            if cursor is None:
+                return seen
+
+    def test_pages_cover_every_item_once_in_order(self):
+        for sort_by in set(SORT_KEYS) - {'relevance'}:
+            expected = list(order_items(Item.objects.all(), sort_by).values_list('pk', flat=True))
+            self.assertEqual(self.walk(sort_by), expected, sort_by)
+
+    def test_cursor_page_does_not_use_offset(self):
+        _, cursor = paginate_items(Item.objects.all(), 'price_desc', page_size=2)
+        with CaptureQueriesContext(connection) as ctx:
+            paginate_items(Item.objects.all(), 'price_desc', cursor, page_size=2)
+        self.assertNotIn('OFFSET', ctx.captured_queries[0]['sql'])
+
+    def test_invalid_cursor_is_rejected(self):
+        with self.assertRaises(InvalidCursor):
+            decode_cursor('not-a-cursor', 'price_asc')
+        response = self.client.get(reverse('item_feed'), {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_home_page_and_feed_continue_each_other(self):
+        response = self.client.get(reverse('home'), {'sort_by': 'price_asc'})
+        first_page = [item.pk for item in response.context['all_items']]
+        self.assertEqual(len(first_page), min(ITEMS_PAGE_SIZE, 7))
+
+        _, cursor = paginate_items(Item.objects.all(), 'price_asc', page_size=4)
+        response = self.client.get(reverse('item_feed'), {'sort_by': 'price_asc', 'cursor': cursor})
+        data = response.json()
+        self.assertEqual(data['count'], 3)
+        self.assertIsNone(data['next_cursor'])
+        self.assertIn('View Details', data['html'])
+
+    def test_item_list_links_to_next_page(self):
+        cache.clear()
+        Item.objects.bulk_create(
+            Item(owner=self.owner, name=f'Extra {idx}', description='A test item', price='5.00')
+            for idx in range(ITEMS_PAGE_SIZE)
+        )
+        response = self.client.get(reverse('item_list'), {'sort_by': 'price_asc'})
+        first_page = [item.pk for item in response.context['items']]
+        self.assertEqual(len(first_page), ITEMS_PAGE_SIZE)
+        next_query = response.context['next_page_query']
+        self.assertIn('sort_by=price_asc', next_query)
+        self.assertContains(response, f'href="?{escape(next_query)}"')
+
+        response = self.client.get(reverse('item_list') + '?' + next_query)
+        second_page = [item.pk for item in response.context['items']]
+        self.assertEqual(len(second_page), 7)
+        self.assertFalse(set(first_page) & set(second_page))
+        self.assertEqual(response.context['next_page_query'], '')
+        self.assertNotContains(response, 'Next page')
+
+        # A bad cursor starts again from the first page
+        response = self.client.get(reverse('item_list'), {'sort_by': 'price_asc', 'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item.pk for item in response.context['items']], first_page)
+
+
+class FullTextSearchTests(TestCase):
+    def setUp(self):
+        self.owner = make_user('owner')
+        self.client.force_login(self.owner)
+        self.bike = make_item(self.owner, name='Mountain bicycle', description='Good for trails', category='sports')
+        self.pump = make_item(self.owner, name='Tyre pump', description='Fits any bicycle', category='sports')
+        self.book = make_item(self.owner, name='Calculus textbook', description='Second edition', category='books')
+
+    def search(self, text):
+        items, ranked = fulltext.search_items(Item.objects.all(), text)
+        self.assertTrue(ranked)
+        return list(items.order_by('search_rank').values_list('pk', flat=True))
+
+    def test_prefix_match_ranks_name_hits_first(self):
+        self.assertEqual(self.search('bicyc'), [self.bike.pk, self.pump.pk])
+
+    def test_category_is_indexed(self):
+        self.assertEqual(self.search('books'), [self.book.pk])
+
+    def test_index_follows_save_and_delete(self):
+        self.book.name = 'Organic chemistry notes'
+        self.book.save()
+        self.assertEqual(self.search('calculus'), [])
+        self.assertEqual(self.search('chem'), [self.book.pk])
+
+        self.pump.delete()
+        self.assertEqual(self.search('bicycle'), [self.bike.pk])
+
+    def test_index_is_matched_once_per_search(self):
+        items, _ = fulltext.search_items(Item.objects.filter(owner=self.owner), 'bicycle')
+        with CaptureQueriesContext(connection) as ctx:
+            ranks = list(items.order_by('search_rank').values_list('search_rank', flat=True))
+        self.assertEqual(len(ranks), 2)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual(ctx.captured_queries[0]['sql'].count('MATCH'), 1)
+
+    def test_search_works_inside_an_aliased_subquery(self):
+        items, _ = fulltext.search_items(Item.objects.all(), 'bicycle')
+        outer = Item.objects.filter(pk__in=items.values('pk'))
+        self.assertEqual(set(outer.values_list('pk', flat=True)), {self.bike.pk, self.pump.pk})
+
+    def test_rebuild_restores_index(self):
+        fulltext.drop_index()
+        fulltext.rebuild_index()
+        self.assertEqual(self.search('trail'), [self.bike.pk])
+
+    def test_punctuation_only_query_falls_back_to_like(self):
+        items, ranked = fulltext.search_items(Item.objects.all(), '!!!')
+        self.assertFalse(ranked)
+        self.assertEqual(list(items), [])
+
+    def test_home_search_defaults_to_relevance(self):
+        response = self.client.get(reverse('home'), {'search': 'bicycle'})
+        self.assertEqual([item.pk for item in response.context['all_items']], [self.bike.pk, self.pump.pk])
+
+    def test_relevance_pages_follow_rank(self):
+        for idx in range(5):
+            make_item(self.owner, name=f'Bicycle helmet {idx}')
+        items, _ = fulltext.search_items(Item.objects.all(), 'bicycle')
+        expected = list(order_items(items, 'relevance').values_list('pk', flat=True))
+        seen, cursor = [], None
+        while True:
+            page, cursor = paginate_items(items, 'relevance', cursor, page_size=2)
+            seen.extend(item.pk for item in page)
+            if cursor is None:
+                break
+        self.assertEqual(seen, expected)
+
+    def test_missing_index_is_probed_once(self):
+        fulltext.drop_index()
+        self.addCleanup(fulltext.rebuild_index)
+        with CaptureQueriesContext(connection) as ctx:
+            for _ in range(3):
+                items, ranked = fulltext.search_items(Item.objects.all(), 'bicycle')
+                self.assertFalse(ranked)
+        self.assertEqual(len([q for q in ctx.captured_queries if 'sqlite_master' in q['sql']]), 1)
+        self.assertEqual(set(items.values_list('pk', flat=True)), {self.bike.pk, self.pump.pk})
+
+
+
+class QueryPlanTests(TestCase):
+    """Every SELECT issued by the main views must reach item, rental and
+    notification rows through an index."""
+
+    WATCHED_TABLES = ('pages_item', 'pages_rental', 'pages_notification')
+
+    def setUp(self):
+        self.owner = make_user('owner')
+        self.borrower = make_user('borrower')
+        self.item = make_item(self.owner, category='books')
+        rental = make_rental(self.item, self.borrower, date.today(), date.today())
+        Notification.objects.create(user=self.owner, rental=rental, type='rental_request', message='Hi')
+
+    def scans(self, sql, full_read=False):
+        """SCAN steps over watched tables in the plan of ``sql``.
+
+        Any SCAN counts, including a walk of a whole index. Only the
+        outermost loop may scan: through an index when the query ends in a
+        LIMIT (a feed page read in index order), or in any way when
+        ``full_read`` is set (a report that reads every row).
+        """
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            details = [row[3] for row in cursor.fetchall()]
+        # Subqueries name their tables by alias: "pages_rental" U0
+        tables = {alias: table for table, alias in re.findall(r'"(%s)" (\w+)' % '|'.join(self.WATCHED_TABLES), sql)}
+        steps = []
+        for position, detail in enumerate(details):
+            match = re.match(r'^(SCAN|SEARCH) (\w+)', detail)
+            if match and tables.get(match.group(2), match.group(2)) in self.WATCHED_TABLES:
+                steps.append((position, match.group(1), detail))
+        if steps and steps[0][0] == 0 and steps[0][1] == 'SCAN':
+            bounded = re.search(r'LIMIT \d+( OFFSET \d+)?$', sql) and 'INDEX' in steps[0][2]
+            if full_read or bounded:
+                steps = steps[1:]
+        return [detail for _, kind, detail in steps if kind == 'SCAN']
+
+    def assert_indexed(self, user, url, full_read=False):
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertLess(response.status_code, 400, url)
+        selects = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('SELECT')]
+        self.assertTrue(selects, url)
+        for sql in selects:
+            self.assertEqual(self.scans(sql, full_read), [], f'{url}: {sql}')
+
+    def test_borrower_views_use_indexes(self):
+        start, end = date.today(), date.today() + timedelta(days=3)
+        urls = [
+            reverse('home'),
+            reverse('home') + '?category=books&availability=on',
+            reverse('home') + '?sort_by=price_asc',
+            reverse('home') + '?sort_by=date_asc',
+            reverse('home') + '?search=item',
+            reverse('item_list'),
+            reverse('item_list') + f'?start={start}&end={end}',
+            reverse('item_list') + f'?start={start}&end={end}&category=books&sort_by=price_asc',
+            reverse('item_list') + f'?start={start}&end={end}&availability=on&search=item',
+            reverse('item_feed'),
+            reverse('item_detail', args=[self.item.pk]),
+            reverse('rental_request', args=[self.item.pk]),
+            reverse('user_items'),
+            reverse('notifications'),
+            reverse('profile'),
+        ]
+        for url in urls:
+            self.assert_indexed(self.borrower, url)
+
+    def test_lender_views_use_indexes(self):
+        for url in [reverse('user_lended_items'), reverse('notifications')]:
+            self.assert_indexed(self.owner, url)
+
+    def test_report_views_read_each_table_once(self):
+        staff = make_user('staff', is_staff=True)
+        names = [
+            'admin_reports', 'export_items_pdf', 'export_items_excel', 'export_rentals_pdf',
+            'export_rentals_excel', 'export_users_pdf', 'export_users_excel', 'export_rentals_stream',
+        ]
+        for name in names:
+            cache.clear()
+            self.assert_indexed(staff, reverse(name), full_read=True)
+
+    def test_delta_exports_use_indexes(self):
+        self.client.force_login(make_user('staff', is_staff=True))
+        since = (timezone.now() - timedelta(days=1)).isoformat()
+        for name in exports.DELTA_MODELS:
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(reverse('export_delta', args=[name]), {'since': since})
+                b''.join(response.streaming_content)
+            selects = [q['sql'] for q in ctx.captured_queries if '"updated_at" <' in q['sql'] or 'tombstone' in q['sql']]
+            self.assertEqual(len(selects), 2, name)
+            for sql in selects:
+                self.assertEqual(self.scans(sql), [], f'{name}: {sql}')
+
+    def test_scheduler_uses_indexes(self):
+        with CaptureQueriesContext(connection) as ctx:
+            lifecycle.run_due()
+        selects = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('SELECT')]
+        self.assertTrue(selects)
+        for sql in selects:
+            self.assertEqual(self.scans(sql), [], sql)
+
+    def test_whole_index_scans_are_caught(self):
+        sql = str(Rental.objects.order_by('request_date').query)
+        self.assertEqual(len(self.scans(sql)), 1)
+        self.assertEqual(self.scans(sql, full_read=True), [])
+        # Only the outermost loop may read everything
+        nested = Item.objects.filter(pk__in=Rental.objects.filter(total_price__gt=1).values('item'))
+        self.assertEqual(len(self.scans(str(nested.query), full_read=True)), 1)
+
+
+class AvailabilityWindowTests(TestCase):
+    def setUp(self):
+        self.owner = make_user('owner')
+        self.borrower = make_user('borrower')
+        self.start = date.today() + timedelta(days=12)
+        self.end = self.start + timedelta(days=3)
+
+    def free_items(self, start=None, end=None):
+        return set(Item.objects.free_between(start or self.start, end or self.end).values_list('pk', flat=True))
+
+    def test_only_items_free_for_whole_window(self):
+        free = make_item(self.owner, name='Free')
+        overlap_start = make_item(self.owner, name='Overlap start')
+        make_rental(overlap_start, self.borrower, self.start - timedelta(days=2), self.start, status='approved')
+        overlap_end = make_item(self.owner, name='Overlap end')
+        make_rental(overlap_end, self.borrower, self.end, self.end + timedelta(days=2), status='borrowed')
+        inside = make_item(self.owner, name='Inside')
+        make_rental(inside, self.borrower, self.start + timedelta(days=1), self.start + timedelta(days=1), status='approved')
+        adjacent = make_item(self.owner, name='Adjacent')
+        make_rental(adjacent, self.borrower, self.end + timedelta(days=1), self.end + timedelta(days=4), status='approved')
+        pending = make_item(self.owner, name='Pending only')
+        make_rental(pending, self.borrower, self.start, self.end, status='pending')
+        make_item(self.owner, name='Unlisted', is_available=False)
+
+        self.assertEqual(self.free_items(), {free.pk, adjacent.pk, pending.pk})
+
+    def test_window_query_is_a_single_indexed_anti_join(self):
+        sql, params = Item.objects.free_between(self.start, self.end).query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            details = [row[3] for row in cursor.fetchall()]
+        self.assertTrue(any('rental_item_status_dates_idx' in d for d in details), details)
+        with self.assertNumQueries(1):
+            list(Item.objects.free_between(self.start, self.end))
+
+    def test_search_form_normalises_window(self):
+        form = ItemSearchForm({'start': self.start.isoformat()})
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data['end'], self.start)
+
+        form = ItemSearchForm({'start': self.end.isoformat(), 'end': self.start.isoformat()})
+        self.assertFalse(form.is_valid())
+
+    def test_item_list_filters_by_window(self):
+        cache.clear()
+        free = make_item(self.owner, name='Free tent')
+        booked = make_item(self.owner, name='Booked tent')
+        make_rental(booked, self.borrower, self.start, self.start, status='approved')
+        self.client.force_login(self.borrower)
+
+        response = self.client.get(reverse('item_list'), {'start': self.start.isoformat(), 'end': self.end.isoformat()})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item.pk for item in response.context['items']], [free.pk])
+        self.assertContains(response, 'Free tent')
+        self.assertNotContains(response, 'Booked tent')
+        self.assertContains(response, 'name="start"')
+
+        response = self.client.get(reverse('item_list'), {'start': self.end.isoformat(), 'end': self.start.isoformat()})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'End date must be after start date.')
+
+
+class SearchServiceTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = make_user('owner')
+        self.borrower = make_user('borrower')
+        self.items = [make_item(self.owner, name=f'Lamp {idx}', category='gadgets') for idx in range(5)]
+        self.params = {'category': 'gadgets', 'availability': True, 'sort_by': 'date_desc'}
+
+    def test_equivalent_params_share_a_cache_key(self):
+        a = search.normalise_params({'search': '  Desk   LAMP ', 'category': 'gadgets'})
+        b = search.normalise_params({'search': 'desk lamp', 'category': 'gadgets', 'availability': False})
+        self.assertEqual(search.cache_key(a), search.cache_key(b))
+
+    def test_repeat_search_only_hydrates_the_page(self):
+        search.search_page(self.params, page_size=2)
+        with CaptureQueriesContext(connection) as ctx:
+            page, cursor = search.search_page(self.params, page_size=2)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual([item.pk for item in page], [self.items[4].pk, self.items[3].pk])
+
+        page, cursor = search.search_page(self.params, cursor, page_size=2)
+        self.assertEqual([item.pk for item in page], [self.items[2].pk, self.items[1].pk])
+
+    def test_item_changes_invalidate_cached_ids(self):
+        search.search_page(self.params)
+        new_item = make_item(self.owner, name='Lamp new', category='gadgets')
+        page, _ = search.search_page(self.params)
+        self.assertEqual(page[0].pk, new_item.pk)
+
+        new_item.delete()
+        page, _ = search.search_page(self.params)
+        self.assertNotIn(new_item.pk, [item.pk for item in page])
+
+    def test_rental_changes_invalidate_window_searches(self):
+        start = date.today() + timedelta(days=5)
+        params = dict(self.params, start=start, end=start)
+        page, _ = search.search_page(params)
+        self.assertEqual(len(page), 5)
+
+        make_rental(self.items[0], self.borrower, start, start, status='approved')
+        page, _ = search.search_page(params)
+        self.assertNotIn(self.items[0].pk, [item.pk for item in page])
+
+    def test_tail_beyond_cached_rows_comes_from_the_db(self):
+        with mock.patch.object(search, 'MAX_CACHED_ROWS', 3):
+            seen, cursor = [], None
+            while True:
+                page, cursor = search.search_page(self.params, cursor, page_size=2)
+                seen.extend(item.pk for item in page)
+                if cursor is None:
+                    break
+        self.assertEqual(seen, [item.pk for item in reversed(self.items)])
+
+
+class ImageDerivativeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        override = self.settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.owner = make_user('owner')
+
+    def upload(self, size=(1600, 1200), fmt='PNG'):
+        buffer = BytesIO()
+        Image.new('RGB', size, (200, 30, 30)).save(buffer, format=fmt)
+        return SimpleUploadedFile(f'photo.{fmt.lower()}', buffer.getvalue(), content_type=f'image/{fmt.lower()}')
+
+    def test_upload_queues_work_after_commit(self):
+        with mock.patch.object(images, '_executor') as executor:
+            with self.captureOnCommitCallbacks(execute=False) as callbacks:
+                item = make_item(self.owner, image=self.upload())
+            executor.submit.assert_not_called()
+            for callback in callbacks:
+                callback()
+        executor.submit.assert_called_once_with(images._generate_in_background, item.image.name)
+
+    def test_derivatives_are_resized_per_width_and_format(self):
+        with mock.patch.object(images, '_executor'):
+            item = make_item(self.owner, image=self.upload())
+        written = images.generate_derivatives(item.image.name)
+        self.assertEqual(written, len(images.all_widths()) * len(images.DERIVATIVE_FORMATS))
+
+        with default_storage.open(images.derivative_name(item.image.name, 320, 'webp')) as fh:
+            derivative = Image.open(fh)
+            self.assertEqual((derivative.format, derivative.size), ('WEBP', (320, 240)))
+        # Existing derivatives are skipped unless forced
+        self.assertEqual(images.generate_derivatives(item.image.name), 0)
+
+    def test_uploads_sharing_a_stem_keep_their_own_derivatives(self):
+        with mock.patch.object(images, '_executor'):
+            png = make_item(self.owner, image=self.upload(size=(1600, 1200)))
+            jpeg = make_item(self.owner, image=self.upload(size=(1600, 800), fmt='JPEG'))
+        self.assertEqual(posixpath.splitext(png.image.name)[0], posixpath.splitext(jpeg.image.name)[0])
+        self.assertTrue(set(images.derivative_names(png.image.name)).isdisjoint(images.derivative_names(jpeg.image.name)))
+
+        images.generate_derivatives(png.image.name)
+        self.assertEqual(images.generate_derivatives(jpeg.image.name), len(images.derivative_names(jpeg.image.name)))
+        with default_storage.open(images.derivative_name(jpeg.image.name, 320, 'webp')) as fh:
+            self.assertEqual(Image.open(fh).size, (320, 160))
+
+        images.delete_derivatives(png.image.name)
+        self.assertTrue(all(default_storage.exists(name) for name in images.derivative_names(jpeg.image.name)))
+
+    def test_tag_uses_original_until_derivatives_exist(self):
+        with mock.patch.object(images, '_executor'):
+            item = make_item(self.owner, image=self.upload())
+        tpl = Template("{% load image_tags %}{% responsive_image item.image 'card' alt=item.name %}")
+
+        html = tpl.render(Context({'item': item}))
+        self.assertIn(f'src="{item.image.url}"', html)
+        self.assertNotIn('srcset', html)
+
+        images.generate_derivatives(item.image.name)
+        item.refresh_from_db()
+        with mock.patch.object(default_storage, 'exists') as exists, self.assertNumQueries(0):
+            html = tpl.render(Context({'item': item}))
+        exists.assert_not_called()
+        self.assertIn('type="image/webp"', html)
+        self.assertIn('-320w.webp 320w', html)
+        self.assertIn('-640w.jpg 640w', html)
+
+    def test_replacing_an_image_deletes_its_derivatives(self):
+        with mock.patch.object(images, '_executor'):
+            item = make_item(self.owner, image=self.upload())
+        old_name = item.image.name
+        images.generate_derivatives(old_name)
+        item.refresh_from_db()
+
+        with mock.patch.object(images, '_executor') as executor:
+            with self.captureOnCommitCallbacks(execute=True):
+                item.image = self.upload(size=(800, 600))
+                item.save()
+        executor.submit.assert_any_call(images._delete_in_background, old_name)
+        images._delete_in_background(old_name)
+        self.assertFalse(any(default_storage.exists(name) for name in images.derivative_names(old_name)))
+
+        # The new image is not ready until its own derivatives exist
+        self.assertFalse(images.derivatives_ready(item.image))
+
+    def test_deleting_a_row_deletes_its_derivatives(self):
+        with mock.patch.object(images, '_executor'):
+            item = make_item(self.owner, image=self.upload())
+        name = item.image.name
+        images.generate_derivatives(name)
+
+        with mock.patch.object(images, '_executor') as executor:
+            with self.captureOnCommitCallbacks(execute=True):
+                Item.objects.get(pk=item.pk).delete()
+        executor.submit.assert_called_once_with(images._delete_in_background, name)
+        images._delete_in_background(name)
+        self.assertFalse(any(default_storage.exists(target) for target in images.derivative_names(name)))
+
+
+class ServeMediaMiddlewareTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        override = self.settings(MEDIA_ROOT=self.media_root, DEBUG=False)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.payload = bytes(range(256)) * 4
+        with open(os.path.join(self.media_root, 'photo.jpg'), 'wb') as fh:
+            fh.write(self.payload)
+        self.middleware = ServeMediaMiddleware(lambda request: HttpResponse('view'))
+        self.factory = RequestFactory()
+
+    def get(self, path='/media/photo.jpg', **headers):
+        return self.middleware(self.factory.get(path, **headers))
+
+    def body(self, response):
+        return b''.join(response.streaming_content) if response.streaming else response.content
+
+    def test_full_response_has_cache_validators(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.payload)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('max-age=', response['Cache-Control'])
+        self.assertTrue(response['ETag'])
+        self.assertTrue(response['Last-Modified'])
+
+    def test_conditional_requests_get_304(self):
+        first = self.get()
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+        self.assertEqual(self.get(HTTP_IF_MODIFIED_SINCE=first['Last-Modified']).status_code, 304)
+
+    def test_byte_ranges(self):
+        response = self.get(HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.payload)}')
+        self.assertEqual(self.body(response), self.payload[10:20])
+
+        response = self.get(HTTP_RANGE='bytes=-5')
+        self.assertEqual(self.body(response), self.payload[-5:])
+
+        self.assertEqual(self.get(HTTP_RANGE=f'bytes={len(self.payload)}-').status_code, 416)
+        # A stale If-Range validator gets the whole file
+        self.assertEqual(self.get(HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE='"stale"').status_code, 200)
+
+    def test_unusable_range_headers_get_the_whole_file(self):
+        for header in ('bytes=0-1,5-6', 'bytes=19-10', 'bytes=-', 'items=0-1', 'bytes=abc'):
+            with self.subTest(header=header):
+                response = self.get(HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(self.body(response), self.payload)
+
+    def test_directories_are_not_served(self):
+        os.mkdir(os.path.join(self.media_root, 'item_images'))
+        with self.assertRaises(Http404):
+            self.get('/media/item_images')
+
+    def test_repeat_hits_use_stat_cache(self):
+        self.get()
+        with mock.patch('my_site.middleware.os.stat') as stat:
+            self.assertEqual(self.get(HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+        stat.assert_not_called()
+
+    def test_file_deleted_within_stat_ttl_404s(self):
+        self.get()
+        os.remove(os.path.join(self.media_root, 'photo.jpg'))
+        for headers in ({}, {'HTTP_RANGE': 'bytes=0-1'}):
+            with self.subTest(headers=headers), self.assertRaises(Http404):
+                self.get(**headers)
+
+    def test_file_replaced_within_stat_ttl_is_served_whole(self):
+        etag = self.get()['ETag']
+        replacement = b'new' * 500
+        path = os.path.join(self.media_root, 'photo.jpg')
+        with open(path, 'wb') as fh:
+            fh.write(replacement)
+        os.utime(path, ns=(0, 10 ** 18))
+
+        response = self.get()
+        self.assertEqual(response['Content-Length'], str(len(replacement)))
+        self.assertEqual(self.body(response), replacement)
+        self.assertNotEqual(response['ETag'], etag)
+        response = self.get(HTTP_RANGE='bytes=1200-')
+        self.assertEqual(response['Content-Range'], f'bytes 1200-{len(replacement) - 1}/{len(replacement)}')
+        self.assertEqual(self.body(response), replacement[1200:])
+
+    def test_report_artifacts_on_the_media_disk_are_not_served(self):
+        artifact_root = os.path.join(self.media_root, '.report_artifacts')
+        os.makedirs(os.path.join(artifact_root, 'reports'))
+        with open(os.path.join(artifact_root, 'reports', 'users.xlsx'), 'wb') as fh:
+            fh.write(b'contacts')
+        with self.settings(REPORT_ARTIFACT_ROOT=artifact_root), self.assertRaises(Http404):
+            self.get('/media/.report_artifacts/reports/users.xlsx')
+
+    def test_missing_and_escaping_paths_404(self):
+        with self.assertRaises(Http404):
+            self.get('/media/missing.jpg')
+        with self.assertRaises(Http404):
+            self.get('/media/../settings.py')
+
+    def test_asgi_bodies_are_streamed(self):
+        factory = AsyncRequestFactory()
+        for headers, expected in (({}, self.payload), ({'Range': 'bytes=10-19'}, self.payload[10:20])):
+            with self.subTest(headers=headers):
+                response = self.middleware(factory.get('/media/photo.jpg', headers=headers))
+                self.assertTrue(response.is_async)
+                self.assertEqual(async_to_sync(async_body)(response), expected)
+                response.close()
+
+    def test_accel_redirect_mode(self):
+        with self.settings(MEDIA_SENDFILE='x-accel-redirect'):
+            response = self.get()
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/photo.jpg')
+        self.assertEqual(response.content, b'')
+
+
+class UnreadCounterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = make_user('owner')
+        self.borrower = make_user('borrower')
+        self.rental = make_rental(make_item(self.owner), self.borrower, date.today(), date.today())
+
+    def notify(self, user=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Notification.objects.create(
+                user=user or self.owner, rental=self.rental, type='rental_request', message='Hi'
+            )
+
+    def db_count(self, user):
+        return Notification.objects.filter(user=user, read=False).count()
+
+    def test_counter_follows_create_and_mark_read(self):
+        self.notify()
+        self.assertEqual(notifications.get_unread_count(self.owner.pk), 1)
+        second_notification = self.notify()
+        with self.assertNumQueries(0):
+            self.assertEqual(notifications.get_unread_count(self.owner.pk), 2)
+
+        self.client.force_login(self.owner)
+        self.client.get(reverse('notification_mark_read', args=[second_notification.pk]))
+        self.client.get(reverse('notification_mark_read', args=[second_notification.pk]))
+        self.assertEqual(notifications.get_unread_count(self.owner.pk), self.db_count(self.owner))
+
+    def test_rolled_back_notification_is_not_counted(self):
+        self.assertEqual(notifications.get_unread_count(self.owner.pk), 0)
+        with self.captureOnCommitCallbacks(execute=True), self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                Notification.objects.create(user=self.owner, rental=self.rental, type='rental_request', message='Hi')
+                raise RuntimeError
+        self.assertEqual(notifications.get_unread_count(self.owner.pk), 0)
+
+    def test_reconcile_fixes_drift(self):
+        self.notify()
+        self.notify(self.borrower)
+        cache.set(f'unread_notifications:{self.owner.pk}', 42)
+        notifications.reconcile_unread_counts()
+        self.assertEqual(notifications.get_unread_count(self.owner.pk), 1)
+        self.assertEqual(notifications.get_unread_count(self.borrower.pk), 1)
+
+    def test_count_is_lazy(self):
+        request = RequestFactory().get('/')
+        request.user = self.owner
+        with self.assertNumQueries(0):
+            context = unread_notifications_count(request)
+        self.notify()
+        self.assertEqual(context['unread_notifications_count'](), 1)
+
+    def test_badge_renders_from_cache(self):
+        self.notify()
+        self.client.force_login(self.owner)
+        self.client.get(reverse('notifications'))
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('notifications'))
+        self.assertContains(response, 'You have')
+        self.assertFalse([q for q in ctx.captured_queries if 'COUNT(*)' in q['sql']])
+
+
+class NotificationStreamTests(TestCase):
+    def setUp(self):
+        self.broker = events.InProcessBroker()
+        self.previous_broker = events.get_broker()
+        events.set_broker(self.broker)
+        self.addCleanup(events.set_broker, self.previous_broker)
+        self.owner = make_user('owner')
+        self.borrower = make_user('borrower')
+        self.rental = make_rental(make_item(self.owner), self.borrower, date.today(), date.today())
+
+    def notify(self, message='Hi'):
+        return Notification.objects.create(
+            user=self.owner, rental=self.rental, type='rental_request', message=message
+        )
+
+    async def test_publish_from_another_thread(self):
+        _, queue = self.broker.subscribe(self.owner.pk)
+        thread = threading.Thread(target=self.broker.publish, args=(self.owner.pk, {'id': 1}))
+        thread.start()
+        thread.join()
+        self.assertEqual(await asyncio.wait_for(queue.get(), 1), {'id': 1})
+
+    def test_new_notification_is_published_on_commit(self):
+        published = []
+        with mock.patch.object(self.broker, 'publish', side_effect=lambda *args: published.append(args)):
+            with self.captureOnCommitCallbacks(execute=True):
+                notification = self.notify()
+        self.assertEqual(published, [(self.owner.pk, events.notification_event(notification))])
+
+    async def test_stream_replays_then_follows_live_events(self):
+        missed = await Notification.objects.acreate(
+            user=self.owner, rental=self.rental, type='rental_request', message='Missed'
+        )
+        stream = events.stream_notifications(self.owner.pk, last_event_id=missed.pk - 1, heartbeat=1)
+        self.assertEqual(await anext(stream), 'retry: 5000\n\n')
+        replayed = await anext(stream)
+        self.assertIn(f'id: {missed.pk}\n', replayed)
+
+        # A duplicate of the replayed row is skipped, a new one is delivered
+        self.broker.publish(self.owner.pk, {'id': missed.pk, 'message': 'Missed'})
+        self.broker.publish(self.owner.pk, {'id': missed.pk + 1, 'message': 'Live'})
+        live = await anext(stream)
+        data = json.loads(live.split('data: ', 1)[1])
+        self.assertEqual(data['message'], 'Live')
+
+        self.assertEqual(await anext(stream), ': keepalive\n\n')
+        await stream.aclose()
+        self.assertEqual(self.broker.connection_count(), 0)
+
+    def test_stream_view_requires_login(self):
+        response = self.client.get(reverse('notification_stream'))
+        self.assertEqual(response.status_code, 302)
+
+    def test_wsgi_pages_do_not_open_a_stream(self):
+        self.client.force_login(self.owner)
+        self.assertEqual(self.client.get(reverse('notification_stream')).status_code, 204)
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, 'id="notifications-link"')
+        self.assertNotContains(response, 'data-stream-url')
+
+    async def test_stream_starts_after_the_newest_notification_on_connect(self):
+        async def frames(*args):
+            yield 'retry: 5000\n\n'
+
+        await self.async_client.aforce_login(self.owner)
+        url = reverse('notification_stream')
+        with mock.patch('pages.views.stream_notifications', side_effect=frames) as stream:
+            response = await self.async_client.get(url)
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            notification = await Notification.objects.acreate(
+                user=self.owner, rental=self.rental, type='rental_request', message='Hi'
+            )
+            await self.async_client.get(url)
+            await self.async_client.get(url, headers={'Last-Event-ID': '9'})
+        self.assertEqual(stream.call_args_list, [
+            mock.call(self.owner.pk, 0), mock.call(self.owner.pk, notification.pk), mock.call(self.owner.pk, 9),
+        ])
+
+    def test_pages_do_not_query_notifications_for_the_stream(self):
+        request = AsyncRequestFactory().get('/')
+        request.user = self.owner
+        with self.assertNumQueries(0):
+            self.assertEqual(notification_stream(request), {'notification_stream_enabled': True})
+
+
+class ExcelExportTests(TestCase):
+    def setUp(self):
+        self.staff = make_user('staff', is_staff=True)
+        self.owner = make_user('owner')
+        self.borrower = make_user('borrower')
+        item = make_item(self.owner, name='Drill')
+        make_rental(item, self.borrower, date.today(), date.today() + timedelta(days=1), status='returned')
+        self.client.force_login(self.staff)
+
+    def download(self, name, streaming=False):
+        response = self.client.get(reverse(name))
+        self.assertEqual(response.streaming, streaming)
+        self.assertEqual(response['Content-Type'], reports.EXCEL_CONTENT_TYPE)
+        content = b''.join(response.streaming_content) if streaming else response.content
+        return load_workbook(BytesIO(content))
+
+    def test_rentals_workbook_is_streamed(self):
+        # Reports too big for the report cache are streamed from a temporary file
+        with self.settings(REPORT_CACHE_MAX_BYTES=1024):
+            workbook = self.download('export_rentals_excel', streaming=True)
+        self.assertEqual(workbook.sheetnames, ['All Rentals', 'Most Borrowed'])
+        rows = list(workbook['All Rentals'].values)
+        self.assertEqual(list(rows[0]), reports.RENTAL_HEADERS)
+        self.assertEqual(rows[1][1:4], ('Drill', 'borrower', 'owner'))
+        self.assertTrue(workbook['All Rentals']['A1'].font.bold)
+        self.assertEqual(list(workbook['Most Borrowed'].values)[1][4:], (1, 10))
+
+    def test_items_and_users_workbooks(self):
+        items = list(self.download('export_items_excel')['Items Report'].values)
+        self.assertEqual(items[1][1], 'Drill')
+        users = list(self.download('export_users_excel')['User Activity'].values)
+        self.assertEqual(len(users), 4)
+
+
+class UserActivityCountTests(TestCase):
+    def test_counts_are_not_multiplied_by_joins(self):
+        owner = make_user('owner')
+        borrower = make_user('borrower')
+        drill = make_item(owner, name='Drill')
+        make_item(owner, name='Ladder')
+        tent = make_item(borrower, name='Tent')
+        for _ in range(3):
+            make_rental(drill, borrower, date.today(), date.today())
+        make_rental(tent, owner, date.today(), date.today())
+
+        counts = {user.username: (user.items_count, user.borrow_count, user.lend_count) for user in reports.user_activity()}
+        # A join over items, borrowings and lendings would report 2 x 1 x 3 = 6 for each of the owner's counts
+        self.assertEqual(counts, {'owner': (2, 1, 3), 'borrower': (1, 3, 1)})
+        self.assertEqual([user.username for user in reports.user_activity()], ['borrower', 'owner'])
+
+
+class ReportQueryCountTests(TestCase):
+    # Session and user lookups for the staff login, the report cache
+    # fingerprint, then the report's own queries
+    EXPECTED_QUERIES = {
+        'export_items_pdf': 2 + 1 + 2,
+        'export_items_excel': 2 + 1 + 1,
+        # Rollup reads: status totals, then ranked ids and their rows
+        'export_rentals_pdf': 2 + 1 + 3,
+        'export_rentals_excel': 2 + 1 + 2,
+        'export_users_pdf': 2 + 1 + 7,
+        'export_users_excel': 2 + 1 + 1,
+        # Plus the unread notification count for the navbar
+        'admin_reports': 2 + 11,
+    }
+
+    def setUp(self):
+        self.client.force_login(make_user('staff', is_staff=True))
+
+    def add_data(self, count):
+        for n in range(count):
+            owner = make_user(f'owner{count}-{n}')
+            borrower = make_user(f'borrower{count}-{n}')
+            item = make_item(owner, name=f'Item {n}')
+            for status in ('pending', 'borrowed', 'returned'):
+                make_rental(item, borrower, date.today(), date.today(), status=status)
+
+    def fetch(self, name):
+        cache.clear()
+        response = self.client.get(reverse(name))
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+    def test_query_count_does_not_grow_with_data(self):
+        for size in (1, 10):
+            self.add_data(size)
+            for name, expected in self.EXPECTED_QUERIES.items():
+                with self.subTest(name=name, size=size):
+                    with self.assertNumQueries(expected):
+                        self.assertEqual(self.fetch(name).status_code, 200)
+
+    def test_most_borrowed_revenue_counts_earning_rentals_only(self):
+        self.add_data(1)
+        item = reports.most_borrowed_items(1)[0]
+        self.assertEqual(item.rental_count, 3)
+        # Borrowed and returned rentals at 10.00 each; the pending one earns nothing
+        self.assertEqual(item.total_revenue, 20)
+
+
+class ReportJobTests(TestCase):
+    def setUp(self):
+        artifact_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, artifact_root, ignore_errors=True)
+        patcher = mock.patch.object(
+            ReportJob._meta.get_field('artifact'), 'storage', FileSystemStorage(location=artifact_root)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        override = self.settings(REPORT_JOB_WORKERS=0)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.staff = make_user('staff', is_staff=True)
+        make_item(make_user('owner'), name='Drill')
+        self.client.force_login(self.staff)
+
+    def test_job_runs_after_commit_and_serves_artifact(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('report_job_create', args=['items_pdf']), HTTP_ACCEPT='application/json'
+            )
+        self.assertEqual(response.status_code, 202)
+        status = self.client.get(response.json()['status_url']).json()
+        self.assertEqual((status['status'], status['progress']), ('done', 100))
+
+        download = self.client.get(status['download_url'])
+        self.assertEqual(download['Content-Type'], 'application/pdf')
+        self.assertTrue(b''.join(download.streaming_content).startswith(b'%PDF'))
+        self.assertContains(self.client.get(reverse('admin_reports')), 'Items Report (PDF)')
+
+    def test_only_one_worker_claims_a_job(self):
+        job = ReportJob.objects.create(kind='users_excel')
+        self.assertTrue(jobs.claim(job.pk))
+        self.assertFalse(jobs.claim(job.pk))
+        self.assertFalse(jobs.run_job(job.pk))
+
+    def test_failure_is_recorded(self):
+        job = ReportJob.objects.create(kind='items_excel')
+        broken = dict(reports.REPORTS, items_excel=('x.xlsx', reports.EXCEL_CONTENT_TYPE, mock.Mock(side_effect=ValueError('boom'))))
+        with mock.patch.object(reports, 'REPORTS', broken), self.assertLogs('pages.jobs', 'ERROR'):
+            jobs.run_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error), ('failed', 'ValueError: boom'))
+
+    def test_requeued_worker_cannot_overwrite_the_new_attempt(self):
+        job = ReportJob.objects.create(kind='items_excel')
+        first = jobs.claim(job.pk)
+        # The first worker is presumed lost and a second one takes over
+        jobs.requeue_stale(now=timezone.now() + jobs.STALE_AFTER * 2)
+        self.assertTrue(jobs.run_job(job.pk))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempt), ('done', first + 1))
+        artifact = job.artifact.name
+
+        # The lost worker finishing late discards its own output
+        with mock.patch.object(jobs, 'claim', return_value=first), self.assertLogs('pages.jobs', 'WARNING'):
+            ReportJob.objects.filter(pk=job.pk).update(status='running')
+            jobs.run_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.artifact.name, artifact)
+        self.assertEqual(len(job.artifact.storage.listdir(os.path.dirname(artifact))[1]), 1)
+
+    def test_expired_jobs_are_purged_with_their_artifacts(self):
+        kept, expired = (ReportJob.objects.create(kind='items_excel') for _ in range(2))
+        jobs.run_job(kept.pk)
+        jobs.run_job(expired.pk)
+        expired.refresh_from_db()
+        storage = expired.artifact.storage
+        ReportJob.objects.filter(pk=expired.pk).update(
+            finished_at=timezone.now() - jobs.ARTIFACT_RETENTION * 2
+        )
+
+        self.assertEqual(jobs.purge_expired(), 1)
+        self.assertEqual(list(ReportJob.objects.values_list('pk', flat=True)), [kept.pk])
+        self.assertFalse(storage.exists(expired.artifact.name))
+
+    def test_command_runs_queued_and_stale_jobs(self):
+        queued = ReportJob.objects.create(kind='rentals_excel')
+        stale = ReportJob.objects.create(
+            kind='rentals_pdf', status='running', started_at=timezone.now() - jobs.STALE_AFTER * 2
+        )
+        call_command('process_report_jobs', stdout=StringIO())
+        self.assertEqual(
+            set(ReportJob.objects.filter(pk__in=[queued.pk, stale.pk]).values_list('status', flat=True)), {'done'}
+        )
+
+
+class ReportCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(make_user('staff', is_staff=True))
+        self.owner = make_user('owner')
+        self.item = make_item(self.owner, name='Drill')
+
+    def test_unchanged_data_is_served_from_cache(self):
+        first = self.client.get(reverse('export_items_pdf'))
+        with mock.patch.object(reports, 'write_items_pdf') as writer:
+            with mock.patch.dict(reports.REPORTS, items_pdf=('items_report.pdf', 'application/pdf', writer)):
+                second = self.client.get(reverse('export_items_pdf'))
+        writer.assert_not_called()
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first['ETag'], second['ETag'])
+
+    def test_if_none_match_returns_304(self):
+        etag = self.client.get(reverse('export_users_excel'))['ETag']
+        response = self.client.get(reverse('export_users_excel'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_edits_and_bulk_inserts_change_the_etag(self):
+        etags = [self.client.get(reverse('export_items_excel'))['ETag']]
+        self.item.name = 'Hammer'
+        self.item.save()
+        etags.append(self.client.get(reverse('export_items_excel'))['ETag'])
+        Item.objects.bulk_create([Item(owner=self.owner, name='Saw', description='d', price='1.00')])
+        etags.append(self.client.get(reverse('export_items_excel'))['ETag'])
+        self.assertEqual(len(set(etags)), 3)
+
+    def test_edits_from_another_process_change_the_etag(self):
+        rental = make_rental(self.item, make_user('borrower'), date(2030, 1, 1), date(2030, 1, 2))
+        etag = self.client.get(reverse('export_rentals_pdf'))['ETag']
+        # Another process shares the database but not this process's cache
+        cache.clear()
+        Rental.objects.filter(pk=rental.pk).update(status='approved', updated_at=timezone.now())
+        self.assertNotEqual(self.client.get(reverse('export_rentals_pdf'))['ETag'], etag)
+
+    def test_deletes_change_the_etag(self):
+        make_item(self.owner, name='Saw')
+        etag = self.client.get(reverse('export_items_excel'))['ETag']
+        # Not the newest row, so only the tombstone moves
+        self.item.delete()
+        self.assertNotEqual(self.client.get(reverse('export_items_excel'))['ETag'], etag)
+
+    def test_profile_edits_change_the_etag(self):
+        etag = self.client.get(reverse('export_users_excel'))['ETag']
+        self.owner.hostel_name = 'North'
+        self.owner.save()
+        self.assertNotEqual(self.client.get(reverse('export_users_excel'))['ETag'], etag)
+
+    def test_login_does_not_invalidate(self):
+        etag = self.client.get(reverse('export_items_pdf'))['ETag']
+        self.client.login(username='owner', password='testpass123')
+        self.assertEqual(report_cache.data_fingerprint(), etag.strip('"').split('-', 1)[1])
+
+    async def test_uncached_reports_are_streamed_from_disk_under_asgi(self):
+        await self.async_client.aforce_login(await CustomUser.objects.aget(username='staff'))
+        with self.settings(REPORT_CACHE_MAX_BYTES=400):
+            response = await self.async_client.get(reverse('export_items_excel'))
+        self.assertTrue(response.is_async)
+        content = await async_body(response)
+        self.assertEqual(int(response['Content-Length']), len(content))
+        self.assertEqual(load_workbook(BytesIO(content)).sheetnames, ['Items Report'])
+        response.close()
+
+    def test_size_budget_evicts_oldest_and_stale_entries(self):
+        with self.settings(REPORT_CACHE_MAX_BYTES=400):
+            report_cache.store('items_pdf', 'a', b'x' * 100)
+            report_cache.store('users_pdf', 'a', b'x' * 100)
+            report_cache.store('items_pdf', 'b', b'x' * 100)
+            self.assertIsNone(report_cache.get('items_pdf', 'a'))
+            report_cache.store('rentals_pdf', 'a', b'x' * 100)
+            report_cache.store('users_excel', 'a', b'x' * 100)
+            self.assertIsNotNone(report_cache.get('users_pdf', 'a'))
+            # Over budget: the oldest entry goes
+            report_cache.store('items_excel', 'a', b'x' * 100)
+            self.assertIsNone(report_cache.get('users_pdf', 'a'))
+            self.assertIsNotNone(report_cache.get('items_pdf', 'b'))
+            self.assertFalse(report_cache.store('rentals_excel', 'a', b'x' * 101))
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        self.owner = make_user('owner')
+        self.borrower = make_user('borrower')
+        self.item = make_item(self.owner, name='Drill')
+
+    def snapshot(self):
+        return (
+            sorted(ItemDailyRollup.objects.filter(rentals__gt=0).values_list('day', 'item_id', 'rentals')),
+            sorted(UserDailyRollup.objects.exclude(borrowed=0, lent=0).values_list('day', 'user_id', 'borrowed', 'lent')),
+            sorted(StatusDailyRollup.objects.filter(rentals__gt=0).values_list('day', 'status', 'rentals')),
+        )
+
+    def test_rollups_follow_rental_lifecycle(self):
+        first = make_rental(self.item, self.borrower, date.today(), date.today())
+        second = make_rental(self.item, self.borrower, date.today(), date.today())
+        first.status = 'approved'
+        first.save()
+        first.status = 'borrowed'
+        first.save()
+        second.delete()
+
+        totals = rollups.status_totals()
+        self.assertEqual((totals['borrowed'], totals['pending'], totals['approved']), (1, 0, 0))
+        self.assertEqual([(i.pk, i.rental_count) for i in rollups.most_borrowed_items(5)], [(self.item.pk, 1)])
+        self.assertEqual([(u.pk, u.borrow_count) for u in rollups.top_borrowers(5)], [(self.borrower.pk, 1)])
+        self.assertEqual([(u.pk, u.lend_count) for u in rollups.top_lenders(5)], [(self.owner.pk, 1)])
+
+        # Incremental maintenance matches a rebuild from scratch
+        incremental = self.snapshot()
+        rollups.rebuild()
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_status_change_rolls_back_with_the_rental(self):
+        rental = make_rental(self.item, self.borrower, date.today(), date.today())
+        rental.status = 'approved'
+        with mock.patch.object(rollups, 'record_status_change', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                rental.save()
+        self.assertEqual(Rental.objects.get(pk=rental.pk).status, 'pending')
+        self.assertEqual(rollups.status_totals()['pending'], 1)
+
+    def test_rebuild_command_repairs_drift(self):
+        make_rental(self.item, self.borrower, date.today(), date.today(), status='returned')
+        StatusDailyRollup.objects.update(rentals=7)
+        call_command('rebuild_rollups', stdout=StringIO())
+        self.assertEqual(rollups.status_totals()['returned'], 1)
+
+    def test_dashboard_reads_rollups(self):
+        make_rental(self.item, self.borrower, date.today(), date.today(), status='borrowed')
+        self.client.force_login(make_user('staff', is_staff=True))
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('admin_reports'))
+        self.assertEqual(response.context['active_rentals'], 1)
+        self.assertEqual([item.pk for item in response.context['most_borrowed']], [self.item.pk])
+        self.assertFalse([q for q in ctx.captured_queries if 'FROM "pages_rental"' in q['sql'] and 'COUNT' in q['sql']])
+
+
+class RentalStreamExportTests(TestCase):
+    def setUp(self):
+        self.staff = make_user('staff', is_staff=True)
+        self.owner = make_user('owner')
+        self.other = make_user('other')
+        self.borrower = make_user('borrower')
+        self.drill = make_item(self.owner, name='Drill')
+        self.ladder = make_item(self.other, name='Ladder')
+        self.old = make_rental(self.drill, self.borrower, date.today(), date.today(), status='returned')
+        Rental.objects.filter(pk=self.old.pk).update(request_date=timezone.now() - timedelta(days=10))
+        self.recent = make_rental(self.drill, self.borrower, date.today(), date.today(), status='pending')
+        self.elsewhere = make_rental(self.ladder, self.borrower, date.today(), date.today(), status='pending')
+        self.client.force_login(self.staff)
+
+    def fetch(self, **params):
+        response = self.client.get(reverse('export_rentals_stream'), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def test_csv_with_filters(self):
+        response, content = self.fetch(start=date.today().isoformat(), lender=self.owner.pk)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        rows = list(csv.reader(content.decode().splitlines()))
+        self.assertEqual(rows[0], exports.COLUMNS)
+        self.assertEqual([(row[0], row[2], row[6]) for row in rows[1:]], [(str(self.recent.pk), 'Drill', 'owner')])
+
+    def test_ndjson_status_filter(self):
+        _, content = self.fetch(format='ndjson', status=['pending'])
+        records = [json.loads(line) for line in content.decode().splitlines()]
+        self.assertEqual([record['id'] for record in records], [self.recent.pk, self.elsewhere.pk])
+        self.assertEqual(records[0]['total_price'], '10.00')
+
+    def test_gzip_round_trip(self):
+        response, content = self.fetch(gzip='on', end=(date.today() - timedelta(days=5)).isoformat())
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('.csv.gz', response['Content-Disposition'])
+        rows = list(csv.reader(gzip.decompress(content).decode().splitlines()))
+        self.assertEqual([row[0] for row in rows[1:]], [str(self.old.pk)])
+
+    def test_header_is_sent_before_rows_are_read(self):
+        # The CSV header is available without touching the database
+        with CaptureQueriesContext(connection) as ctx:
+            first = next(exports.stream_rentals(exports.export_rentals()))
+        self.assertEqual(first, b'id,item_id,item,borrower_id,borrower,lender_id,lender,status,'
+                                b'start_date,end_date,total_price,request_date,approved_date,'
+                                b'borrowed_date,returned_date\r\n')
+        self.assertEqual(ctx.captured_queries, [])
+
+    async def test_asgi_sends_the_header_before_the_rows_are_read(self):
+        await self.async_client.aforce_login(self.staff)
+        finished = []
+        with mock.patch.object(exports, 'stream_rentals', tracked(exports.stream_rentals, finished)), \
+                mock.patch.object(exports, 'FLUSH_BYTES', 1):
+            response = await self.async_client.get(reverse('export_rentals_stream'), {'format': 'csv'})
+            self.assertTrue(response.is_async)
+            chunks = aiter(response.streaming_content)
+            header = await anext(chunks)
+            self.assertEqual(finished, [])
+            rows = [chunk async for chunk in chunks]
+        self.assertEqual(finished, [True])
+        self.assertTrue(header.startswith(b'id,item_id,'))
+        self.assertEqual(len(rows), 3)
+
+    def test_invalid_range_is_rejected(self):
+        response = self.client.get(reverse('export_rentals_stream'), {'start': '2024-02-01', 'end': '2024-01-01'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('__all__', response.json()['errors'])
+
+
+class PdfBuilderTests(TestCase):
+    def test_rows_are_split_into_segments_with_headers(self):
+        rows = ([str(n)] for n in range(7))
+        segments = list(pdf.table_segments(['N'], rows, col_widths=[inch], chunk_rows=3))
+        self.assertEqual([len(segment._cellvalues) for segment in segments], [4, 4, 2])
+        for segment in segments:
+            self.assertEqual(segment._cellvalues[0], ['N'])
+            self.assertEqual(segment.repeatRows, 1)
+
+    def test_segments_are_created_as_the_layout_reaches_them(self):
+        pulled = []
+
+        def rows():
+            for n in range(10):
+                pulled.append(n)
+                yield [str(n)]
+        run = pdf._TableRun(pdf.table_segments(['N'], rows(), col_widths=[inch], chunk_rows=3))
+        self.assertEqual(pulled, [])
+        first, rest = run.split(6 * inch, 9 * inch)
+        # The segment handed over, and the next one it peeked at
+        self.assertEqual(pulled, list(range(6)))
+        self.assertEqual(len(first._cellvalues), 4)
+        self.assertIsInstance(rest, pdf._TableRun)
+
+    def test_segment_is_cut_to_the_space_left(self):
+        segments = pdf.table_segments(['N'], ([str(n)] for n in range(100)), col_widths=[inch], chunk_rows=50)
+        parts = pdf._TableRun(segments).split(6 * inch, 2 * inch)
+        self.assertEqual([type(part) for part in parts], [LongTable, LongTable, pdf._TableRun])
+        self.assertLessEqual(parts[0].wrap(6 * inch, 2 * inch)[1], 2 * inch)
+        self.assertEqual(len(parts[0]._cellvalues) + len(parts[1]._cellvalues), 52)
+
+    def test_empty_table_keeps_its_header(self):
+        segments = list(pdf.table_segments(['N'], [], col_widths=[inch]))
+        self.assertEqual([segment._cellvalues for segment in segments], [[['N']]])
+
+    def test_styles_are_built_once(self):
+        self.assertIs(pdf.paragraph_styles(), pdf.paragraph_styles())
+        self.assertIs(pdf.table_style(12), pdf.table_style(12))
+
+    def test_items_pdf_spans_pages(self):
+        owner = make_user('owner')
+        Item.objects.bulk_create(
+            Item(owner=owner, name=f'Item {n}', description='A test item', price='10.00') for n in range(120)
+        )
+        for chunk_rows in (pdf.TABLE_CHUNK_ROWS, 7):
+            segments = partial(pdf.table_segments, chunk_rows=chunk_rows)
+            with self.subTest(chunk_rows=chunk_rows), mock.patch.object(pdf, 'table_segments', segments):
+                output = BytesIO()
+                reports.write_items_pdf(output)
+                content = output.getvalue()
+                self.assertTrue(content.startswith(b'%PDF'))
+                self.assertGreater(content.count(b'/Type /Page\n'), 1)
+
+
+class ReportBundleTests(TransactionTestCase):
+    # Bundles snapshot the database outside any transaction, so these tests commit
+    def setUp(self):
+        self.owner = make_user('owner')
+        self.borrower = make_user('borrower')
+        item = make_item(self.owner, name='Drill')
+        make_rental(item, self.borrower, date.today(), date.today(), status='returned')
+        self.client.force_login(make_user('staff', is_staff=True))
+
+    def download(self):
+        response = self.client.get(reverse('export_reports_bundle'))
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        return zipfile.ZipFile(BytesIO(b''.join(response.streaming_content)))
+
+    def test_bundle_contains_every_report(self):
+        directory = tempfile.mkdtemp()
+        with self.settings(REPORT_BUNDLE_WORKERS=0), mock.patch.object(bundle.tempfile, 'mkdtemp', return_value=directory):
+            archive = self.download()
+        self.assertEqual(
+            sorted(archive.namelist()), sorted(filename for filename, _, _ in reports.REPORTS.values())
+        )
+        self.assertTrue(archive.read('items_report.pdf').startswith(b'%PDF'))
+        self.assertEqual(load_workbook(BytesIO(archive.read('rentals_report.xlsx')))['All Rentals']['B2'].value, 'Drill')
+        # The working directory goes once the ZIP is sent
+        self.assertFalse(os.path.exists(directory))
+
+    def test_failed_report_is_listed_in_errors(self):
+        def fail(output):
+            raise ValueError('boom')
+        broken = {'users_pdf': ('users_activity_report.pdf', reports.PDF_CONTENT_TYPE, fail)}
+        with self.settings(REPORT_BUNDLE_WORKERS=0), mock.patch.dict(reports.REPORTS, broken):
+            with self.assertLogs('pages.bundle', 'ERROR'):
+                archive = self.download()
+        self.assertNotIn('users_activity_report.pdf', archive.namelist())
+        self.assertEqual(archive.read('errors.txt'), b'users_activity_report.pdf: ValueError: boom\n')
+
+    def test_inline_reports_read_the_snapshot_outside_a_transaction(self):
+        seen = []
+
+        def record(output):
+            seen.append((connection.settings_dict['NAME'], connection.in_atomic_block))
+            output.write(b'x')
+        with self.settings(REPORT_BUNDLE_WORKERS=0), \
+                mock.patch.dict(reports.REPORTS, users_pdf=('users_activity_report.pdf', reports.PDF_CONTENT_TYPE, record)):
+            self.download()
+        [(name, in_atomic_block)] = seen
+        self.assertEqual(os.path.basename(name), bundle.SNAPSHOT_NAME)
+        self.assertFalse(in_atomic_block)
+        self.assertNotEqual(connection.settings_dict['NAME'], name)
+
+    def test_inline_reports_are_sent_as_they_finish(self):
+        release, finished = threading.Event(), []
+
+        def slow(output):
+            release.wait(5)
+            output.write(b'slow')
+            finished.append(True)
+        with self.settings(REPORT_BUNDLE_WORKERS=0), \
+                mock.patch.dict(reports.REPORTS, users_pdf=('users_activity_report.pdf', reports.PDF_CONTENT_TYPE, slow)):
+            chunks = iter(self.client.get(reverse('export_reports_bundle')).streaming_content)
+            first = next(chunks)
+            self.assertEqual(finished, [])
+            release.set()
+            archive = zipfile.ZipFile(BytesIO(first + b''.join(chunks)))
+        self.assertEqual(len(archive.namelist()), len(reports.REPORTS))
+        self.assertEqual(archive.read('users_activity_report.pdf'), b'slow')
+
+    def test_snapshot_needs_autocommit(self):
+        with transaction.atomic(), self.assertRaises(TransactionManagementError):
+            bundle.snapshot_database(os.path.join(tempfile.gettempdir(), 'unused.sqlite3'))
+
+
+class ReportBundleSnapshotTests(TransactionTestCase):
+    # Snapshots are taken outside any transaction, so these tests commit
+    def setUp(self):
+        self.owner = make_user('owner')
+        make_item(self.owner, name='Drill')
+
+    def test_snapshot_is_frozen(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'snapshot.sqlite3')
+        bundle.snapshot_database(path)
+        make_item(self.owner, name='Ladder')
+
+        snapshot = sqlite3.connect(path)
+        self.addCleanup(snapshot.close)
+        self.assertEqual(snapshot.execute('SELECT name FROM pages_item').fetchall(), [('Drill',)])
+
+    def test_reports_are_built_in_worker_processes(self):
+        self.addCleanup(self.shutdown_pool)
+        self.client.force_login(make_user('staff', is_staff=True))
+        with self.settings(REPORT_BUNDLE_WORKERS=2):
+            response = self.client.get(reverse('export_reports_bundle'))
+            archive = zipfile.ZipFile(BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(len(archive.namelist()), len(reports.REPORTS))
+        items = load_workbook(BytesIO(archive.read('items_report.xlsx')))['Items Report']
+        self.assertEqual(items['B2'].value, 'Drill')
+
+    def shutdown_pool(self):
+        bundle._pool.shutdown()
+
+    def test_idle_pool_shuts_down(self):
+        pool = pools.IdleProcessPool('REPORT_BUNDLE_WORKERS')
+        self.addCleanup(pool.shutdown)
+        with self.settings(REPORT_BUNDLE_WORKERS=1, REPORT_POOL_IDLE_TIMEOUT=0.1):
+            self.assertFalse(pool.running)
+            self.assertNotEqual(pool.submit(os.getpid).result(), os.getpid())
+            self.assertTrue(pool.running)
+            for _ in range(100):
+                if not pool.running:
+                    break
+                time.sleep(0.05)
+        self.assertFalse(pool.running)
+
+
+@mock.patch.object(exports, 'DELTA_SAFETY_LAG', timedelta(0))
+class DeltaExportTests(TestCase):
+    def setUp(self):
+        self.owner = make_user('owner')
+        self.borrower = make_user('borrower')
+        self.item = make_item(self.owner, name='Drill')
+        self.old = make_rental(self.item, self.borrower, date.today(), date.today())
+        self.gone = make_rental(self.item, self.borrower, date.today(), date.today())
+        Rental.objects.update(updated_at=timezone.now() - timedelta(days=2))
+        self.since = timezone.now() - timedelta(days=1)
+        self.client.force_login(make_user('staff', is_staff=True))
+
+    def fetch(self, name='rentals', **params):
+        response = self.client.get(reverse('export_delta', args=[name]), params)
+        self.assertEqual(response.status_code, 200)
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(lines[-1], {'op': 'watermark', 'watermark': response['X-Delta-Watermark']})
+        return lines[:-1], response['X-Delta-Watermark']
+
+    def test_only_changes_since_the_watermark(self):
+        new = make_rental(self.item, self.borrower, date.today(), date.today())
+        self.old.status = 'approved'
+        self.old.save()
+        gone_pk = self.gone.pk
+        self.gone.delete()
+
+        lines, watermark = self.fetch(since=self.since.isoformat())
+        self.assertEqual(
+            [(line['op'], line.get('data', line).get('id')) for line in lines],
+            [('upsert', new.pk), ('upsert', self.old.pk), ('delete', gone_pk)],
+        )
+        self.assertEqual(lines[1]['data']['status'], 'approved')
+
+        # Nothing has changed since the new watermark
+        self.assertEqual(self.fetch(since=watermark)[0], [])
+
+    async def test_asgi_stream_sends_rows_before_the_export_finishes(self):
+        await self.async_client.aforce_login(await CustomUser.objects.aget(username='staff'))
+        new = await Rental.objects.acreate(
+            item=self.item, borrower=self.borrower, lender=self.owner,
+            start_date=date.today(), end_date=date.today(),
+        )
+        finished = []
+        with mock.patch.object(exports, 'stream_delta', tracked(exports.stream_delta, finished)):
+            response = await self.async_client.get(
+                reverse('export_delta', args=['rentals']), {'since': self.since.isoformat()}
+            )
+            self.assertTrue(response.is_async)
+            chunks = aiter(response.streaming_content)
+            first = await anext(chunks)
+            self.assertEqual(finished, [])
+            rest = [chunk async for chunk in chunks]
+        self.assertEqual(finished, [True])
+        lines = [json.loads(line) for line in b''.join([first, *rest]).decode().splitlines()]
+        self.assertEqual([line['op'] for line in lines], ['upsert', 'watermark'])
+        self.assertEqual(lines[0]['data']['id'], new.pk)
+
+    def test_full_export_without_watermark(self):
+        lines, _ = self.fetch()
+        self.assertEqual({line['data']['id'] for line in lines}, {self.old.pk, self.gone.pk})
+
+    def test_item_and_notification_changes(self):
+        Item.objects.filter(pk=self.item.pk).update(updated_at=timezone.now() - timedelta(days=2))
+        notification = Notification.objects.create(user=self.owner, rental=self.old, type='rental_request', message='Hi')
+        self.assertEqual(self.fetch('items', since=self.since.isoformat())[0], [])
+        lines, _ = self.fetch('notifications', since=self.since.isoformat())
+        self.assertEqual([line['data']['id'] for line in lines], [notification.pk])
+
+    def test_invalid_requests(self):
+        response = self.client.get(reverse('export_delta', args=['rentals']), {'since': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(reverse('export_delta', args=['users'])).status_code, 404)
+
+    def test_watermark_older_than_the_retention_needs_a_full_export(self):
+        since = timezone.now() - timedelta(days=31)
+        with self.settings(TOMBSTONE_RETENTION_DAYS=30):
+            response = self.client.get(reverse('export_delta', args=['rentals']), {'since': since.isoformat()})
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('a full export is required', response.json()['errors']['since'][0])
+            with self.assertRaisesMessage(CommandError, 'a full export is required'):
+                call_command('export_delta', 'rentals', since=since.isoformat(), stdout=StringIO(), stderr=StringIO())
+
+    def test_purge_drops_only_tombstones_past_the_retention(self):
+        old_pk, gone_pk = self.old.pk, self.gone.pk
+        self.old.delete()
+        self.gone.delete()
+        Tombstone.objects.filter(object_id=old_pk).update(deleted_at=timezone.now() - timedelta(days=31))
+        with self.settings(TOMBSTONE_RETENTION_DAYS=30):
+            self.assertEqual(exports.purge_tombstones(), 1)
+        self.assertEqual(list(Tombstone.objects.values_list('object_id', flat=True)), [gone_pk])
+
+    def test_command_keeps_the_watermark_in_a_state_file(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        state_file = os.path.join(directory, 'rentals.watermark')
+
+        def run():
+            out = StringIO()
+            call_command('export_delta', 'rentals', state_file=state_file, stdout=out, stderr=StringIO())
+            return [json.loads(line) for line in out.getvalue().splitlines()]
+
+        self.assertEqual(len(run()), 3)
+        with open(state_file) as f:
+            watermark = f.read().strip()
+        new = make_rental(self.item, self.borrower, date.today(), date.today())
+        lines = run()
+        self.assertEqual([line['data']['id'] for line in lines[:-1]], [new.pk])
+        self.assertGreaterEqual(lines[-1]['watermark'], watermark)
+
+
+class BookingTests(TestCase):
+    def setUp(self):
+        self.owner = make_user('owner')
+        self.alice = make_user('alice')
+        self.bob = make_user('bob')
+        self.item = make_item(self.owner, name='Drill')
+        self.today = date.today()
+
+    def test_request_rejects_dates_already_booked(self):
+        make_rental(self.item, self.alice, self.today, self.today + timedelta(days=3), status='approved')
+        with self.assertRaisesMessage(booking.BookingError, 'already booked'):
+            booking.request_rental(self.item.pk, self.bob, self.today + timedelta(days=3), self.today + timedelta(days=5))
+        rental = booking.request_rental(self.item.pk, self.bob, self.today + timedelta(days=4), self.today + timedelta(days=5))
+        self.assertEqual(rental.status, 'pending')
+        self.assertTrue(Notification.objects.filter(rental=rental, user=self.owner, type='rental_request').exists())
+
+    def test_accept_rejects_overlap_with_approved_rental(self):
+        first = booking.request_rental(self.item.pk, self.alice, self.today, self.today + timedelta(days=2))
+        second = booking.request_rental(self.item.pk, self.bob, self.today + timedelta(days=1), self.today + timedelta(days=1))
+        booking.accept_rental(first.pk, self.owner)
+        with self.assertRaisesMessage(booking.BookingError, 'overlap'):
+            booking.accept_rental(second.pk, self.owner)
+        self.assertEqual(Rental.objects.get(pk=second.pk).status, 'pending')
+        booking.reject_rental(second.pk, self.owner)
+        with self.assertRaisesMessage(booking.BookingError, 'already been processed'):
+            booking.accept_rental(second.pk, self.owner)
+
+    def test_only_the_lender_decides(self):
+        rental = booking.request_rental(self.item.pk, self.alice, self.today, self.today)
+        with self.assertRaisesMessage(booking.BookingError, 'permission'):
+            booking.accept_rental(rental.pk, self.bob)
+
+    def test_accept_view_reports_conflicts(self):
+        make_rental(self.item, self.alice, self.today, self.today, status='approved')
+        pending = make_rental(self.item, self.bob, self.today, self.today)
+        self.client.force_login(self.owner)
+        response = self.client.get(reverse('rental_accept', args=[pending.pk]), follow=True)
+        self.assertEqual(
+            [str(message) for message in response.context['messages']],
+            ['Those dates overlap a rental you have already approved.'],
+        )
+        self.assertEqual(Rental.objects.get(pk=pending.pk).status, 'pending')
+
+
+class BulkDecisionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = make_user('owner')
+        self.alice = make_user('alice')
+        self.bob = make_user('bob')
+        self.drill = make_item(self.owner, name='Drill')
+        self.ladder = make_item(self.owner, name='Ladder')
+        self.today = date.today()
+
+    def requests(self, count, item=None):
+        return [
+            make_rental(item or self.ladder, self.alice, self.today + timedelta(days=2 * n), self.today + timedelta(days=2 * n))
+            for n in range(count)
+        ]
+
+    def test_accept_skips_clashes_and_other_lenders(self):
+        make_rental(self.drill, self.bob, self.today, self.today, status='approved')
+        clash = make_rental(self.drill, self.alice, self.today, self.today + timedelta(days=1))
+        first = make_rental(self.ladder, self.alice, self.today, self.today + timedelta(days=1))
+        second = make_rental(self.ladder, self.bob, self.today + timedelta(days=1), self.today + timedelta(days=2))
+        foreign = make_rental(make_item(self.bob, name='Tent'), self.alice, self.today, self.today)
+        notifications.get_unread_count(self.alice.pk)
+
+        broker = mock.Mock()
+        with mock.patch.object(events, 'get_broker', return_value=broker), \
+                self.captureOnCommitCallbacks(execute=True):
+            approved, clashing = booking.accept_rentals([clash.pk, first.pk, second.pk, foreign.pk], self.owner)
+
+        self.assertEqual([r.pk for r in approved], [first.pk])
+        self.assertEqual([r.pk for r in clashing], [clash.pk, second.pk])
+        statuses = dict(Rental.objects.values_list('pk', 'status'))
+        self.assertEqual(
+            [statuses[r.pk] for r in (clash, first, second, foreign)],
+            ['pending', 'approved', 'pending', 'pending'],
+        )
+        self.assertIsNotNone(Rental.objects.get(pk=first.pk).approved_date)
+        notification = Notification.objects.get(type='request_approved')
+        self.assertEqual((notification.user_id, notification.rental_id), (self.alice.pk, first.pk))
+        self.assertEqual(notifications.get_unread_count(self.alice.pk), 1)
+        broker.publish.assert_called_once_with(self.alice.pk, events.notification_event(notification))
+
+    def test_reject_keeps_rollups_and_counters_in_step(self):
+        rentals = self.requests(3)
+        notifications.get_unread_count(self.alice.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            rejected = booking.reject_rentals([r.pk for r in rentals], self.owner)
+        self.assertEqual(len(rejected), 3)
+        self.assertEqual(booking.reject_rentals([r.pk for r in rentals], self.owner), [])
+
+        self.assertEqual(Rental.objects.filter(status='rejected').count(), 3)
+        self.assertEqual(notifications.get_unread_count(self.alice.pk), 3)
+        self.assertEqual(rollups.status_totals()['rejected'], 3)
+        incremental = RollupTests.snapshot(self)
+        rollups.rebuild()
+        self.assertEqual(RollupTests.snapshot(self), incremental)
+
+    def test_rentals_decided_meanwhile_are_not_recorded_twice(self):
+        rentals = self.requests(3)
+        booking.reject_rental(rentals[1].pk, self.owner)
+        notifications.get_unread_count(self.alice.pk)
+
+        # As if the lock were skipped and rentals[1] read while still pending
+        with mock.patch.object(booking, '_lock_pending', return_value=rentals), \
+                self.captureOnCommitCallbacks(execute=True):
+            rejected = booking.reject_rentals([r.pk for r in rentals], self.owner)
+
+        self.assertEqual([r.pk for r in rejected], [rentals[0].pk, rentals[2].pk])
+        self.assertEqual(Notification.objects.filter(type='request_rejected').count(), 3)
+        self.assertEqual(notifications.get_unread_count(self.alice.pk), 3)
+        self.assertEqual(rollups.status_totals()['rejected'], 3)
+        incremental = RollupTests.snapshot(self)
+        rollups.rebuild()
+        self.assertEqual(RollupTests.snapshot(self), incremental)
+
+    def test_query_count_does_not_grow_with_the_batch(self):
+        few, many = self.requests(2), self.requests(8, item=self.drill)
+        # The first approval of the day also creates its rollup row
+        booking.accept_rentals([make_rental(make_item(self.owner), self.bob, self.today, self.today).pk], self.owner)
+        with CaptureQueriesContext(connection) as small:
+            booking.accept_rentals([r.pk for r in few], self.owner)
+        with CaptureQueriesContext(connection) as large:
+            booking.accept_rentals([r.pk for r in many], self.owner)
+        self.assertEqual(len(large), len(small))
+
+    def test_view_reports_outcome(self):
+        rentals = self.requests(2)
+        self.client.force_login(self.owner)
+        response = self.client.post(reverse('rental_bulk_decision'), {
+            'action': 'reject',
+            'rental_ids': [r.pk for r in rentals] + [rentals[0].pk + 100],
+            'next': reverse('notifications'),
+        }, follow=True)
+        self.assertEqual(response.redirect_chain[-1][0], reverse('notifications'))
+        self.assertEqual(
+            [str(message) for message in response.context['messages']],
+            ['You have rejected 2 rental requests.', '1 request had already been processed and was skipped.'],
+        )
+        self.assertEqual(self.client.get(reverse('rental_bulk_decision')).status_code, 405)
+
+class LifecycleSchedulerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = make_user('owner')
+        self.borrower = make_user('borrower')
+        self.item = make_item(self.owner, name='Drill')
+        self.today = date.today()
+
+    def rental(self, start, end, status):
+        return make_rental(self.item, self.borrower, self.today + timedelta(days=start), self.today + timedelta(days=end), status)
+
+    def test_due_rentals_start_and_get_one_reminder(self):
+        starting = self.rental(0, 5, 'approved')
+        later = self.rental(3, 4, 'approved')
+        due_tomorrow = self.rental(-3, 1, 'borrowed')
+        overdue = self.rental(-5, -2, 'borrowed')
+        not_due = self.rental(-1, 6, 'borrowed')
+        notifications.get_unread_count(self.borrower.pk)
+
+        with mock.patch.object(lifecycle, 'BATCH_SIZE', 1), self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(lifecycle.run_due(), {'started': 1, 'reminded': 2, 'purged': 0})
+            self.assertEqual(lifecycle.run_due(), {'started': 0, 'reminded': 0, 'purged': 0})
+
+        starting.refresh_from_db()
+        self.assertEqual(starting.status, 'borrowed')
+        self.assertIsNotNone(starting.borrowed_date)
+        self.assertEqual(Rental.objects.get(pk=later.pk).status, 'approved')
+        self.assertEqual(
+            sorted(Notification.objects.filter(type='reminder').values_list('rental_id', flat=True)),
+            [due_tomorrow.pk, overdue.pk],
+        )
+        self.assertIn('was due back', Notification.objects.get(type='reminder', rental=overdue).message)
+        self.assertFalse(Notification.objects.filter(rental=not_due).exists())
+        self.assertEqual(notifications.get_unread_count(self.borrower.pk), 3)
+
+        incremental = RollupTests.snapshot(self)
+        rollups.rebuild()
+        self.assertEqual(RollupTests.snapshot(self), incremental)
+
+    def test_rental_cancelled_after_it_was_read_is_not_started(self):
+        starting = self.rental(0, 3, 'approved')
+        cancelled = self.rental(0, 2, 'approved')
+        in_batches = lifecycle._in_batches
+
+        def cancel_then_handle(queryset, field, handle):
+            def handle_after_cancel(batch):
+                # Another request cancels one of the rows already read
+                rental = Rental.objects.get(pk=cancelled.pk)
+                rental.status = 'cancelled'
+                rental.save()
+                return handle(batch)
+            return in_batches(queryset, field, handle_after_cancel)
+
+        with mock.patch.object(lifecycle, '_in_batches', side_effect=cancel_then_handle), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(lifecycle.start_due_rentals(), 1)
+
+        self.assertEqual(Rental.objects.get(pk=cancelled.pk).status, 'cancelled')
+        self.assertEqual(
+            list(Notification.objects.filter(type='item_borrowed').values_list('rental_id', flat=True)), [starting.pk]
+        )
+        incremental = RollupTests.snapshot(self)
+        rollups.rebuild()
+        self.assertEqual(RollupTests.snapshot(self), incremental)
+
+    def test_failed_batch_is_retried(self):
+        rental = self.rental(0, 0, 'approved')
+        with mock.patch.object(notifications, 'create_many', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                lifecycle.run_due()
+        self.assertEqual(Rental.objects.get(pk=rental.pk).status, 'approved')
+        self.assertEqual(rollups.status_totals()['approved'], 1)
+
+        out = StringIO()
+        previous_broker = events.get_broker()
+        events.set_broker(mock.Mock())
+        self.addCleanup(events.set_broker, previous_broker)
+        with self.settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}):
+            call_command('run_scheduler', stdout=out)
+        self.assertIn('Started 1 rentals, sent 1 return reminders and purged 0 tombstones.', out.getvalue())
+        self.assertEqual(Rental.objects.get(pk=rental.pk).status, 'borrowed')
+
+    def test_command_refuses_per_process_cache(self):
+        rental = self.rental(0, 0, 'approved')
+        previous_broker = events.get_broker()
+        events.set_broker(mock.Mock())
+        self.addCleanup(events.set_broker, previous_broker)
+        with self.assertRaisesMessage(CommandError, 'SCHEDULER_INTERVAL'):
+            call_command('run_scheduler', stdout=StringIO())
+        self.assertEqual(Rental.objects.get(pk=rental.pk).status, 'approved')
+
+    def test_web_process_scheduler_runs_on_an_interval(self):
+        ran, holds = threading.Event(), []
+
+        def hold_lease(holder, ttl):
+            # Another process holds the lease for the first two turns
+            holds.append(holder)
+            return len(holds) > 2
+        # Stubbed: the thread's own connection would wait on this test's transaction
+        with mock.patch.object(lifecycle, '_scheduler', None), \
+                mock.patch.object(lifecycle, 'hold_lease', side_effect=hold_lease), \
+                mock.patch.object(lifecycle, 'release_lease') as release, \
+                mock.patch.object(lifecycle, 'run_due', side_effect=ran.set) as run_due:
+            stop = lifecycle.start_scheduler(0.01)
+            [thread] = [thread for thread in threading.enumerate() if thread.name == 'rental-scheduler']
+            self.assertIs(lifecycle.start_scheduler(0.01), stop)
+            self.assertTrue(ran.wait(5))
+            stop.set()
+            thread.join(5)
+        self.assertEqual(run_due.call_count, len(holds) - 2)
+        release.assert_called_once_with(holds[0])
+        self.assertIsNone(lifecycle.start_scheduler(0))
+
+    def test_only_one_process_holds_the_scheduler_lease(self):
+        ttl = timedelta(minutes=3)
+        now = timezone.now()
+        self.assertTrue(lifecycle.hold_lease('web-1', ttl, now))
+        self.assertFalse(lifecycle.hold_lease('web-2', ttl, now))
+        self.assertTrue(lifecycle.hold_lease('web-1', ttl, now + timedelta(minutes=1)))
+        self.assertFalse(lifecycle.hold_lease('web-2', ttl, now + timedelta(minutes=3)))
+        # A holder that stops renewing loses the lease once it expires
+        self.assertTrue(lifecycle.hold_lease('web-2', ttl, now + timedelta(minutes=5)))
+        lifecycle.release_lease('web-2')
+        self.assertTrue(lifecycle.hold_lease('web-1', ttl))
+
+    def test_command_skips_while_another_process_holds_the_lease(self):
+        rental = self.rental(0, 0, 'approved')
+        lifecycle.hold_lease('web-1', timedelta(minutes=3))
+        previous_broker = events.get_broker()
+        events.set_broker(mock.Mock())
+        self.addCleanup(events.set_broker, previous_broker)
+        out = StringIO()
+        with self.settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}):
+            call_command('run_scheduler', stdout=out)
+        self.assertIn('Another process holds the scheduler lease', out.getvalue())
+        self.assertEqual(Rental.objects.get(pk=rental.pk).status, 'approved')
+
+
+class PricingTests(TestCase):
+    def setUp(self):
+        self.owner = make_user('owner')
+        self.borrower = make_user('borrower')
+        self.daily = make_item(self.owner, name='Drill', price=Decimal('10.00'), per_day=True)
+        self.flat = make_item(self.owner, name='Ladder', price=Decimal('25.00'))
+        self.today = date.today()
+
+    def test_total_is_quoted_once(self):
+        rental = make_rental(self.daily, self.borrower, self.today, self.today + timedelta(days=2))
+        self.assertEqual(rental.total_price, Decimal('30.00'))
+        Item.objects.filter(pk=self.daily.pk).update(price='12.00')
+
+        rental = Rental.objects.get(pk=rental.pk)
+        rental.status = 'approved'
+        with CaptureQueriesContext(connection) as ctx:
+            rental.save()
+        self.assertFalse([q for q in ctx.captured_queries if 'FROM "pages_item"' in q['sql']])
+        self.assertEqual(Rental.objects.get(pk=rental.pk).total_price, Decimal('30.00'))
+
+        rental.end_date = self.today
+        rental.save()
+        self.assertEqual(Rental.objects.get(pk=rental.pk).total_price, Decimal('12.00'))
+
+    def test_quote_many_loads_items_once(self):
+        end = self.today + timedelta(days=3)
+        with self.assertNumQueries(1):
+            totals = pricing.quote_many([
+                (self.daily.pk, self.today, end),
+                (self.flat.pk, self.today, end),
+                (self.daily.pk, self.today, self.today),
+                (self.flat.pk + 100, self.today, end),
+            ])
+        self.assertEqual(totals, [Decimal('40.00'), Decimal('25.00'), Decimal('10.00'), None])
+        with self.assertNumQueries(0):
+            self.assertEqual(pricing.quote_many([(self.daily, self.today, end)]), [Decimal('40.00')])
+
+    def test_quote_view(self):
+        self.client.force_login(self.borrower)
+        url = reverse('rental_quote')
+        start, end = self.today.isoformat(), (self.today + timedelta(days=1)).isoformat()
+        response = self.client.get(url, {'item': self.daily.pk, 'start': [start, start], 'end': [start, end]})
+        self.assertEqual([(q['days'], q['total']) for q in response.json()['quotes']], [(1, '10.00'), (2, '20.00')])
+
+        self.assertEqual(self.client.get(url, {'item': self.daily.pk, 'start': end, 'end': start}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'item': [self.daily.pk, self.flat.pk], 'start': start, 'end': end}).status_code, 400)
+
+class DashboardTests(TestCase):
+    def setUp(self):
+        self.owner = make_user('owner')
+        self.borrower = make_user('borrower')
+        self.item = make_item(self.owner, name='Drill')
+        self.today = date.today()
+
+    def add(self, status, count):
+        Rental.objects.bulk_create(
+            Rental(item=self.item, borrower=self.borrower, lender=self.owner, status=status,
+                   start_date=self.today, end_date=self.today, total_price=Decimal('10.00'))
+            for _ in range(count)
+        )
+
+    def dashboard_queries(self, user, url):
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        return response, [q for q in ctx.captured_queries if 'FROM "pages_rental"' in q['sql']]
+
+    def test_query_count_does_not_grow_with_history(self):
+        for status in ('pending', 'approved', 'borrowed', 'returned', 'rejected'):
+            self.add(status, 2)
+        _, few = self.dashboard_queries(self.borrower, reverse('user_items'))
+        self.add('returned', 50)
+        self.add('rejected', 50)
+        response, many = self.dashboard_queries(self.borrower, reverse('user_items'))
+        self.assertEqual(len(many), len(few))
+        self.assertEqual(len(many), 4)
+        self.assertEqual(response.context['counts']['returned'], 52)
+        self.assertEqual(len(response.context['completed_rentals']), dashboards.HISTORY_PAGE_SIZE)
+
+        _, lender = self.dashboard_queries(self.owner, reverse('user_lended_items'))
+        self.assertEqual(len(lender), 4)
+
+    def test_history_pages_are_independent(self):
+        self.add('returned', dashboards.HISTORY_PAGE_SIZE + 5)
+        self.add('rejected', dashboards.HISTORY_PAGE_SIZE + 1)
+        self.client.force_login(self.owner)
+        first = self.client.get(reverse('user_lended_items'))
+        cursor = first.context['completed_next']
+        self.assertIsNotNone(cursor)
+
+        second = self.client.get(reverse('user_lended_items'), {'returned': cursor})
+        seen = [r.pk for r in first.context['completed_lendings']] + [r.pk for r in second.context['completed_lendings']]
+        self.assertEqual(seen, list(Rental.objects.filter(status='returned').order_by('-request_date', '-pk').values_list('pk', flat=True)))
+        self.assertIsNone(second.context['completed_next'])
+        self.assertEqual(len(second.context['rejected_lendings']), dashboards.HISTORY_PAGE_SIZE)
+        self.assertContains(second, f'?returned={cursor}&amp;rejected=')
+
+        broken = self.client.get(reverse('user_lended_items'), {'returned': 'not-a-cursor'})
+        self.assertEqual(len(broken.context['completed_lendings']), dashboards.HISTORY_PAGE_SIZE)
+
+class BookingStressTests(TransactionTestCase):
+    """Many threads booking and approving the same item at once never double-book it."""
+
+    THREADS = 16
+    REQUESTS = 200
+
+    def setUp(self):
+        self.owner = make_user('owner')
+        self.borrowers = CustomUser.objects.bulk_create(
+            CustomUser(username=f'borrower{n}', hostel_name='H', room_number='101', phone_number='000')
+            for n in range(self.REQUESTS)
+        )
+        self.item = make_item(self.owner, name='Drill')
+
+        # The in-memory test database answers a second writer with "table is
+        # locked" instead of waiting for it, so run on a file copy like the
+        # real database
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.db_path = os.path.join(directory, 'stress.sqlite3')
+        bundle.snapshot_database(self.db_path)
+        original = connections['default']
+        self.settings_dict = {**original.settings_dict, 'NAME': self.db_path}
+        self.wrapper_class = type(original)
+        connections['default'] = self.file_connection()
+        self.addCleanup(connections.__setitem__, 'default', original)
+        self.addCleanup(lambda: connections['default'].close())
+
+    def file_connection(self):
+        return self.wrapper_class(self.settings_dict, 'default')
+
+    def run_concurrently(self, calls):
+        errors = []
+        lock = threading.Lock()
+        pending = list(calls)
+
+        def worker():
+            connections['default'] = self.file_connection()
+            try:
+                while True:
+                    with lock:
+                        if not pending:
+                            return
+                        call = pending.pop()
+                    try:
+                        call()
+                    except booking.BookingError:
+                        pass
+                    except Exception as exc:
+                        errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def assert_no_double_booking(self):
+        booked = set()
+        for start, end in Rental.objects.filter(item=self.item).bookings().values_list('start_date', 'end_date'):
+            days = {start + timedelta(days=n) for n in range((end - start).days + 1)}
+            self.assertFalse(booked & days)
+            booked |= days
+
+    def test_concurrent_requests_and_approvals(self):
+        today = date.today()
+        # Overlapping windows of one to three days across the next two weeks
+        windows = [(today + timedelta(days=n % 14), today + timedelta(days=n % 14 + n % 3)) for n in range(self.REQUESTS)]
+        self.run_concurrently(
+            lambda borrower=borrower, window=window: booking.request_rental(self.item.pk, borrower, *window)
+            for borrower, window in zip(self.borrowers, windows)
+        )
+        self.assertEqual(Rental.objects.filter(item=self.item).count(), self.REQUESTS)
+
+        pending = list(Rental.objects.filter(item=self.item).values_list('pk', flat=True))
+        # Every request is accepted from two "tabs" at once
+        self.run_concurrently(
+            lambda pk=pk: booking.accept_rental(pk, self.owner) for pk in pending * 2
+        )
+        self.assertTrue(Rental.objects.filter(item=self.item).bookings().exists())
+        self.assert_no_double_booking()
+        # One approval notification per approved rental
+        self.assertEqual(
+            Notification.objects.filter(type='request_approved').count(),
+            Rental.objects.filter(item=self.item).bookings().count(),
+        )
@@ -11,12 +11,21 @@ urlpatterns = [
     path('reports/rentals/excel/', views.export_rentals_report_excel, name='export_rentals_excel'),
     path('reports/users/pdf/', views.export_users_report_pdf, name='export_users_pdf'),
     path('reports/users/excel/', views.export_users_report_excel, name='export_users_excel'),
+    path('reports/rentals/export/', views.export_rentals_stream_view, name='export_rentals_stream'),
+    path('reports/bundle/', views.export_reports_bundle_view, name='export_reports_bundle'),
+    path('reports/delta/<str:name>/', views.export_delta_view, name='export_delta'),
+    path('reports/jobs/<int:pk>/', views.report_job_status_view, name='report_job_status'),
+    path('reports/jobs/<int:pk>/download/', views.report_job_download_view, name='report_job_download'),
+    path('reports/jobs/new/<str:kind>/', views.report_job_create_view, name='report_job_create'),
     
     path('item/<int:pk>/rent/', views.rental_request_view, name='rental_request'),
     path('notifications/', views.notifications_list_view, name='notifications'),
+    path('notifications/stream/', views.notification_stream_view, name='notification_stream'),
     path('notifications/<int:pk>/read/', views.notification_mark_read_view, name='notification_mark_read'),
     path('rental/<int:pk>/accept/', views.rental_request_accept_view, name='rental_accept'),
     path('rental/<int:pk>/reject/', views.rental_request_reject_view, name='rental_reject'),
+    path('rental/bulk-decision/', views.rental_bulk_decision_view, name='rental_bulk_decision'),
+    path('rental/quote/', views.rental_quote_view, name='rental_quote'),
     path('', views.landing_view, name='landing'),
     path('home/', views.home_page_view, name='home'),
     path('item/<int:pk>/', views.item_detail_view, name='item_detail'),
@@ -24,6 +33,7 @@ urlpatterns = [
     path('item/<int:pk>/edit/', views.update_item_view, name='item_update'),
     path('item/<int:pk>/delete/', views.delete_item_view, name='item_delete'),
     path('items/', views.item_list_view, name='item_list'),
+    path('items/feed/', views.item_feed_view, name='item_feed'),
     path('register/', views.register_view, name='register'),
     path('login/', views.login_view, name='login'),
     path('logout/', views.logout_view, name='logout'),
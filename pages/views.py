@@ -3,30 +3,34 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, authenticate, logout, update_session_auth_hash
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import PasswordChangeForm
-from django.db.models import Q, Count
 from django.utils import timezone
 from django.core.exceptions import PermissionDenied
+from django.core.handlers.asgi import ASGIRequest
 from django.contrib import messages
-from django.http import HttpResponse
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.template.defaultfilters import pluralize
+from django.urls import reverse
+from django.utils.http import url_has_allowed_host_and_scheme
+from django.views.decorators.http import require_POST
 from django.contrib.admin.views.decorators import staff_member_required
 
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.lib.enums import TA_CENTER, TA_LEFT
-
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, PatternFill
-from openpyxl.utils import get_column_letter
-
-from .models import Item, Rental, Notification, CustomUser
+from . import booking, bundle, dashboards, exports, jobs, pricing, report_cache, reports, rollups
+from .booking import BookingError
+from .events import stream_notifications
+from .models import Item, Rental, Notification, CustomUser, ReportJob
+from .notifications import decrement_unread
+from .pagination import InvalidCursor
+from .search import search_page
+from .streaming import file_response, streaming_response
 from .forms import (
     CustomUserCreationForm,
     CustomAuthenticationForm,
+    DeltaExportForm,
     ItemForm,
     ItemSearchForm,
+    RentalExportForm,
+    RentalQuoteForm,
     RentalRequestForm,
     UserProfileEditForm
 )
@@ -65,56 +69,60 @@ def forgot_password_view(request):
     """Display forgot password page with admin contact information"""
     return render(request, 'forgot_password.html')
 
-from django.contrib.auth.decorators import login_required
+def _search_cleaned_data(form):
+    """Search parameters from a bound ItemSearchForm; invalid input means no filters."""
+    return form.cleaned_data if form.is_valid() else {}
 
-from django.db.models import Q
-from .forms import ItemSearchForm
-from django.utils.timezone import datetime
+def _next_page_query(request, next_cursor):
+    """Query string for the next page, keeping the current filters."""
+    if not next_cursor:
+        return ''
+    params = request.GET.copy()
+    params['cursor'] = next_cursor
+    return params.urlencode()
 
 @login_required(login_url='login')
 def home_page_view(request):
     form = ItemSearchForm(request.GET)
-    items = Item.objects.all().order_by('-date_posted')
-
-    if form.is_valid():
-        # Search by keyword
-        if search_query := form.cleaned_data.get('search'):
-            items = items.filter(
-                Q(name__icontains=search_query) |
-                Q(description__icontains=search_query)
-            )
-
-        # Filter by category
-        if category := form.cleaned_data.get('category'):
-            items = items.filter(category=category)
-
-        # Filter by availability
-        if form.cleaned_data.get('availability'):
-            items = items.filter(is_available=True)
-
-        # Sort items
-        if sort_by := form.cleaned_data.get('sort_by'):
-            if sort_by == 'price_asc':
-                items = items.order_by('price')
-            elif sort_by == 'price_desc':
-                items = items.order_by('-price')
-            elif sort_by == 'date_desc':
-                items = items.order_by('-date_posted')
-            elif sort_by == 'date_asc':
-                items = items.order_by('date_posted')
-    else:
-        # Default sorting by newest first
-        items = items.order_by('-date_posted')
+    cleaned_data = _search_cleaned_data(form)
+
+    # Newest first unless another sort was chosen; an invalid cursor restarts at page one
+    try:
+        page, next_cursor = search_page(cleaned_data, request.GET.get('cursor'))
+    except InvalidCursor:
+        page, next_cursor = search_page(cleaned_data)
 
     context = {
-        'all_items': items,
-        'form': form
+        'all_items': page,
+        'form': form,
+        'next_page_query': _next_page_query(request, next_cursor),
     }
     return render(request, 'index.html', context)
 
+@login_required(login_url='login')
+def item_feed_view(request):
+    """JSON feed with the next page of home cards for infinite scroll"""
+    form = ItemSearchForm(request.GET)
+
+    try:
+        page, next_cursor = search_page(_search_cleaned_data(form), request.GET.get('cursor'))
+    except InvalidCursor:
+        return JsonResponse({'error': 'Invalid cursor.'}, status=400)
+
+    next_url = None
+    if next_cursor:
+        next_url = f"{reverse('item_feed')}?{_next_page_query(request, next_cursor)}"
+
+    return JsonResponse({
+        'html': render_to_string('item_cards.html', {'items': page}, request=request),
+        'count': len(page),
+        'next_cursor': next_cursor,
+        'next_url': next_url,
+    })
+
 @login_required(login_url='login')
 def item_detail_view(request, pk):
-    item = Item.objects.get(pk=pk) # Get one item by its primary key (pk)
+    item = Item.objects.with_rental_status().select_related('owner').get(pk=pk) # Get one item by its primary key (pk)
     context = {
         'item': item,
     }
@@ -125,44 +133,17 @@ def item_detail_view(request, pk):
 @login_required(login_url='login')
 def item_list_view(request):
     form = ItemSearchForm(request.GET)
-    items = Item.objects.all()
-
-    if form.is_valid():
-        # Search by keyword
-        if search_query := form.cleaned_data.get('search'):
-            items = items.filter(
-                Q(name__icontains=search_query) |
-                Q(description__icontains=search_query)
-            )
-
-        # Filter by category
-        if category := form.cleaned_data.get('category'):
-            items = items.filter(category=category)
-
-        # Filter by availability
-        if form.cleaned_data.get('availability'):
-            items = items.filter(is_available=True)
-
-        # Filter by date range
-        if date_from := form.cleaned_data.get('date_from'):
-            items = items.filter(date_posted__gte=datetime.combine(date_from, datetime.min.time()))
-        if date_to := form.cleaned_data.get('date_to'):
-            items = items.filter(date_posted__lte=datetime.combine(date_to, datetime.max.time()))
-
-        # Sort items
-        if sort_by := form.cleaned_data.get('sort_by'):
-            if sort_by == 'price_asc':
-                items = items.order_by('price')
-            elif sort_by == 'price_desc':
-                items = items.order_by('-price')
-            elif sort_by == 'date_desc':
-                items = items.order_by('-date_posted')
-            elif sort_by == 'date_asc':
-                items = items.order_by('date_posted')
+    cleaned_data = _search_cleaned_data(form)
+
+    try:
+        page, next_cursor = search_page(cleaned_data, request.GET.get('cursor'))
+    except InvalidCursor:
+        page, next_cursor = search_page(cleaned_data)
 
     context = {
-        'items': items,
-        'form': form
+        'items': page,
+        'form': form,
+        'next_page_query': _next_page_query(request, next_cursor),
     }
     return render(request, 'item_list.html', context)
 
@@ -229,7 +210,7 @@ def rental_request_view(request, pk):
     existing_rental = Rental.objects.filter(
         item=item,
         borrower=request.user,
-        status__in=['pending', 'approved', 'borrowed']
+        status__in=Rental.OPEN_STATUSES
     ).first()
     
     if existing_rental:
@@ -239,20 +220,18 @@ def rental_request_view(request, pk):
     if request.method == 'POST':
         form = RentalRequestForm(request.POST)
         if form.is_valid():
-            rental = form.save(commit=False)
-            rental.item = item
-            rental.borrower = request.user
-            rental.lender = item.owner
-            rental.status = 'pending'
-            rental.save()
-
-            # Create notification for the item owner
-            Notification.objects.create(
-                user=item.owner,
-                rental=rental,
-                type='rental_request',
-                message=f"{request.user.username} wants to rent your {item.name}."
-            )
+            # The checks above are repeated under the item's lock
+            try:
+                booking.request_rental(
+                    item.pk,
+                    request.user,
+                    form.cleaned_data['start_date'],
+                    form.cleaned_data['end_date'],
+                    notes=form.cleaned_data['notes'],
+                )
+            except BookingError as exc:
+                messages.error(request, str(exc))
+                return redirect('item_detail', pk=pk)
 
             messages.success(request, "Your rental request has been sent to the owner.")
             return redirect('item_detail', pk=pk)
@@ -323,44 +302,36 @@ def edit_profile_view(request):
 @login_required(login_url='login')
 def my_rented_items_view(request):
     """View items the user is currently borrowing or has borrowed"""
-    # Get all rentals where user is the borrower
-    my_rentals = Rental.objects.filter(borrower=request.user).select_related('item', 'lender').order_by('-request_date')
-    
-    # Separate by status
-    active_rentals = my_rentals.filter(status='borrowed')
-    pending_rentals = my_rentals.filter(status='pending')
-    approved_rentals = my_rentals.filter(status='approved')
-    completed_rentals = my_rentals.filter(status='returned')
-    rejected_rentals = my_rentals.filter(status='rejected')
+    # Counts, open rentals and one page of each history list, in four queries
+    dashboard = dashboards.dashboard(Rental.objects.filter(borrower=request.user), ['item', 'lender'], request.GET)
     
     context = {
-        'active_rentals': active_rentals,
-        'pending_rentals': pending_rentals,
-        'approved_rentals': approved_rentals,
-        'completed_rentals': completed_rentals,
-        'rejected_rentals': rejected_rentals,
+        'counts': dashboard['counts'],
+        'active_rentals': dashboard['open']['borrowed'],
+        'pending_rentals': dashboard['open']['pending'],
+        'approved_rentals': dashboard['open']['approved'],
+        'completed_rentals': dashboard['history']['returned'],
+        'completed_next': dashboard['next_cursors']['returned'],
+        'rejected_rentals': dashboard['history']['rejected'],
+        'rejected_next': dashboard['next_cursors']['rejected'],
     }
     return render(request, 'my_rented_items.html', context)
 
 @login_required(login_url='login')
 def my_lended_items_view(request):
     """View items the user has lent out to others"""
-    # Get all rentals where user is the lender
-    my_lendings = Rental.objects.filter(lender=request.user).select_related('item', 'borrower').order_by('-request_date')
-    
-    # Separate by status
-    pending_requests = my_lendings.filter(status='pending')
-    active_lendings = my_lendings.filter(status='borrowed')
-    approved_lendings = my_lendings.filter(status='approved')
-    completed_lendings = my_lendings.filter(status='returned')
-    rejected_lendings = my_lendings.filter(status='rejected')
+    # Counts, open rentals and one page of each history list, in four queries
+    dashboard = dashboards.dashboard(Rental.objects.filter(lender=request.user), ['item', 'borrower'], request.GET)
     
     context = {
-        'pending_requests': pending_requests,
-        'active_lendings': active_lendings,
-        'approved_lendings': approved_lendings,
-        'completed_lendings': completed_lendings,
-        'rejected_lendings': rejected_lendings,
+        'counts': dashboard['counts'],
+        'pending_requests': dashboard['open']['pending'],
+        'active_lendings': dashboard['open']['borrowed'],
+        'approved_lendings': dashboard['open']['approved'],
+        'completed_lendings': dashboard['history']['returned'],
+        'completed_next': dashboard['next_cursors']['returned'],
+        'rejected_lendings': dashboard['history']['rejected'],
+        'rejected_next': dashboard['next_cursors']['rejected'],
     }
     return render(request, 'my_lended_items.html', context)
 
@@ -369,26 +340,24 @@ def admin_reports_dashboard(request):
     """Admin dashboard showing report statistics"""
     total_items = Item.objects.count()
     total_users = CustomUser.objects.count()
-    total_rentals = Rental.objects.count()
-    active_rentals = Rental.objects.filter(status='borrowed').count()
-    pending_requests = Rental.objects.filter(status='pending').count()
+    # Rental figures come from the daily rollups, not the rental history
+    status_totals = rollups.status_totals()
+    total_rentals = sum(status_totals.values())
+    active_rentals = status_totals['borrowed']
+    pending_requests = status_totals['pending']
     
     # Most borrowed items
-    most_borrowed = Item.objects.annotate(
-        rental_count=Count('rentals')
-    ).order_by('-rental_count')[:10]
+    most_borrowed = rollups.most_borrowed_items(10)
     
     # Recent activity
     recent_rentals = Rental.objects.order_by('-request_date')[:10]
     
     # User activity stats
-    active_borrowers = CustomUser.objects.annotate(
-        borrow_count=Count('borrowed_items')
-    ).filter(borrow_count__gt=0).order_by('-borrow_count')[:10]
+    active_borrowers = rollups.top_borrowers(10)
+    active_lenders = rollups.top_lenders(10)
     
-    active_lenders = CustomUser.objects.annotate(
-        lend_count=Count('lent_items')
-    ).filter(lend_count__gt=0).order_by('-lend_count')[:10]
+    # Background report jobs
+    recent_jobs = ReportJob.objects.select_related('requested_by')[:10]
     
     context = {
         'total_items': total_items,
@@ -400,432 +369,167 @@ def admin_reports_dashboard(request):
         'recent_rentals': recent_rentals,
         'active_borrowers': active_borrowers,
         'active_lenders': active_lenders,
+        'recent_jobs': recent_jobs,
+        'report_kinds': ReportJob.KIND_CHOICES,
     }
     return render(request, 'admin_reports.html', context)
 
 @staff_member_required
 def export_items_report_pdf(request):
     """Generate PDF report of all items"""
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = 'attachment; filename="items_report.pdf"'
-    
-    doc = SimpleDocTemplate(response, pagesize=letter)
-    elements = []
-    styles = getSampleStyleSheet()
-    
-    # Title
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        textColor=colors.HexColor('#4F46E5'),
-        spaceAfter=30,
-        alignment=TA_CENTER
-    )
-    title = Paragraph("BroRent - Items Report", title_style)
-    elements.append(title)
-    elements.append(Spacer(1, 0.2*inch))
-    
-    # Summary stats
-    total_items = Item.objects.count()
-    available_items = Item.objects.filter(is_available=True).count()
-    summary_text = f"Total Items: {total_items} | Available: {available_items} | Unavailable: {total_items - available_items}"
-    summary = Paragraph(summary_text, styles['Normal'])
-    elements.append(summary)
-    elements.append(Spacer(1, 0.3*inch))
-    
-    # Items table
-    items = Item.objects.all().order_by('-date_posted')
-    data = [['ID', 'Name', 'Owner', 'Category', 'Price', 'Status']]
-    
-    for item in items:
-        status = 'Available' if item.is_available else 'Unavailable'
-        price_str = f"${item.price}/day" if item.per_day else f"${item.price}"
-        data.append([
-            str(item.pk),
-            item.name[:30],
-            item.owner.username,
-            item.get_category_display(),
-            price_str,
-            status
-        ])
-    
-    table = Table(data, colWidths=[0.5*inch, 2*inch, 1.2*inch, 1.2*inch, 1*inch, 1*inch])
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#4F46E5')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 1), (-1, -1), 9),
-    ]))
-    
-    elements.append(table)
-    doc.build(elements)
-    return response
+    return report_cache.report_response(request, 'items_pdf')
 
 @staff_member_required
 def export_items_report_excel(request):
     """Generate Excel report of all items"""
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-    )
-    response['Content-Disposition'] = 'attachment; filename="items_report.xlsx"'
-    
-    workbook = Workbook()
-    worksheet = workbook.active
-    worksheet.title = 'Items Report'
-    
-    # Header style
-    header_fill = PatternFill(start_color='4F46E5', end_color='4F46E5', fill_type='solid')
-    header_font = Font(bold=True, color='FFFFFF', size=12)
-    
-    # Headers
-    headers = ['ID', 'Name', 'Description', 'Owner', 'Category', 'Price', 'Per Day', 'Status', 'Date Posted']
-    for col_num, header in enumerate(headers, 1):
-        cell = worksheet.cell(row=1, column=col_num)
-        cell.value = header
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = Alignment(horizontal='center', vertical='center')
-    
-    # Data
-    items = Item.objects.all().order_by('-date_posted')
-    for row_num, item in enumerate(items, 2):
-        worksheet.cell(row=row_num, column=1, value=item.pk)
-        worksheet.cell(row=row_num, column=2, value=item.name)
-        worksheet.cell(row=row_num, column=3, value=item.description)
-        worksheet.cell(row=row_num, column=4, value=item.owner.username)
-        worksheet.cell(row=row_num, column=5, value=item.get_category_display())
-        worksheet.cell(row=row_num, column=6, value=float(item.price))
-        worksheet.cell(row=row_num, column=7, value='Yes' if item.per_day else 'No')
-        worksheet.cell(row=row_num, column=8, value='Available' if item.is_available else 'Unavailable')
-        worksheet.cell(row=row_num, column=9, value=item.date_posted.strftime('%Y-%m-%d %H:%M'))
-    
-    # Adjust column widths
-    for col in range(1, len(headers) + 1):
-        worksheet.column_dimensions[get_column_letter(col)].width = 15
-    
-    workbook.save(response)
-    return response
+    return report_cache.report_response(request, 'items_excel')
 
 @staff_member_required
 def export_rentals_report_pdf(request):
     """Generate PDF report of most borrowed items"""
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = 'attachment; filename="rentals_report.pdf"'
-    
-    doc = SimpleDocTemplate(response, pagesize=letter)
-    elements = []
-    styles = getSampleStyleSheet()
-    
-    # Title
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        textColor=colors.HexColor('#4F46E5'),
-        spaceAfter=30,
-        alignment=TA_CENTER
-    )
-    title = Paragraph("BroRent - Rental Activity Report", title_style)
-    elements.append(title)
-    elements.append(Spacer(1, 0.2*inch))
-    
-    # Summary stats
-    total_rentals = Rental.objects.count()
-    active_rentals = Rental.objects.filter(status='borrowed').count()
-    completed_rentals = Rental.objects.filter(status='returned').count()
-    summary_text = f"Total Rentals: {total_rentals} | Active: {active_rentals} | Completed: {completed_rentals}"
-    summary = Paragraph(summary_text, styles['Normal'])
-    elements.append(summary)
-    elements.append(Spacer(1, 0.3*inch))
-    
-    # Most borrowed items
-    subtitle = Paragraph("Most Borrowed Items", styles['Heading2'])
-    elements.append(subtitle)
-    elements.append(Spacer(1, 0.1*inch))
-    
-    most_borrowed = Item.objects.annotate(
-        rental_count=Count('rentals')
-    ).order_by('-rental_count')[:15]
-    
-    data = [['Rank', 'Item Name', 'Owner', 'Times Borrowed', 'Category']]
-    for idx, item in enumerate(most_borrowed, 1):
-        data.append([
-            str(idx),
-            item.name[:30],
-            item.owner.username,
-            str(item.rental_count),
-            item.get_category_display()
-        ])
-    
-    table = Table(data, colWidths=[0.6*inch, 2.5*inch, 1.2*inch, 1.2*inch, 1.3*inch])
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#4F46E5')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 11),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 1), (-1, -1), 9),
-    ]))
-    
-    elements.append(table)
-    doc.build(elements)
-    return response
+    return report_cache.report_response(request, 'rentals_pdf')
 
 @staff_member_required
 def export_rentals_report_excel(request):
     """Generate Excel report of rental activity"""
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-    )
-    response['Content-Disposition'] = 'attachment; filename="rentals_report.xlsx"'
-    
-    workbook = Workbook()
-    
-    # Sheet 1: All Rentals
-    worksheet1 = workbook.active
-    worksheet1.title = 'All Rentals'
-    
-    header_fill = PatternFill(start_color='4F46E5', end_color='4F46E5', fill_type='solid')
-    header_font = Font(bold=True, color='FFFFFF', size=12)
-    
-    headers1 = ['ID', 'Item', 'Borrower', 'Lender', 'Status', 'Start Date', 'End Date', 'Total Price', 'Request Date']
-    for col_num, header in enumerate(headers1, 1):
-        cell = worksheet1.cell(row=1, column=col_num)
-        cell.value = header
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = Alignment(horizontal='center', vertical='center')
-    
-    rentals = Rental.objects.all().order_by('-request_date')
-    for row_num, rental in enumerate(rentals, 2):
-        worksheet1.cell(row=row_num, column=1, value=rental.pk)
-        worksheet1.cell(row=row_num, column=2, value=rental.item.name)
-        worksheet1.cell(row=row_num, column=3, value=rental.borrower.username)
-        worksheet1.cell(row=row_num, column=4, value=rental.lender.username)
-        worksheet1.cell(row=row_num, column=5, value=rental.get_status_display())
-        worksheet1.cell(row=row_num, column=6, value=rental.start_date.strftime('%Y-%m-%d'))
-        worksheet1.cell(row=row_num, column=7, value=rental.end_date.strftime('%Y-%m-%d'))
-        worksheet1.cell(row=row_num, column=8, value=float(rental.total_price) if rental.total_price else 0)
-        worksheet1.cell(row=row_num, column=9, value=rental.request_date.strftime('%Y-%m-%d %H:%M'))
-    
-    for col in range(1, len(headers1) + 1):
-        worksheet1.column_dimensions[get_column_letter(col)].width = 15
-    
-    # Sheet 2: Most Borrowed Items
-    worksheet2 = workbook.create_sheet(title='Most Borrowed')
-    
-    headers2 = ['Rank', 'Item Name', 'Owner', 'Category', 'Times Borrowed', 'Total Revenue']
-    for col_num, header in enumerate(headers2, 1):
-        cell = worksheet2.cell(row=1, column=col_num)
-        cell.value = header
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = Alignment(horizontal='center', vertical='center')
-    
-    most_borrowed = Item.objects.annotate(
-        rental_count=Count('rentals')
-    ).order_by('-rental_count')[:20]
-    
-    for row_num, item in enumerate(most_borrowed, 2):
-        total_revenue = sum(
-            float(r.total_price) if r.total_price else 0 
-            for r in item.rentals.filter(status__in=['borrowed', 'returned'])
-        )
-        worksheet2.cell(row=row_num, column=1, value=row_num - 1)
-        worksheet2.cell(row=row_num, column=2, value=item.name)
-        worksheet2.cell(row=row_num, column=3, value=item.owner.username)
-        worksheet2.cell(row=row_num, column=4, value=item.get_category_display())
-        worksheet2.cell(row=row_num, column=5, value=item.rental_count)
-        worksheet2.cell(row=row_num, column=6, value=total_revenue)
-    
-    for col in range(1, len(headers2) + 1):
-        worksheet2.column_dimensions[get_column_letter(col)].width = 18
-    
-    workbook.save(response)
-    return response
+    return report_cache.report_response(request, 'rentals_excel')
 
 @staff_member_required
 def export_users_report_pdf(request):
     """Generate PDF report of user activity"""
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = 'attachment; filename="users_activity_report.pdf"'
-    
-    doc = SimpleDocTemplate(response, pagesize=letter)
-    elements = []
-    styles = getSampleStyleSheet()
-    
-    # Title
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        textColor=colors.HexColor('#4F46E5'),
-        spaceAfter=30,
-        alignment=TA_CENTER
-    )
-    title = Paragraph("BroRent - User Activity Report", title_style)
-    elements.append(title)
-    elements.append(Spacer(1, 0.2*inch))
-    
-    # Summary
-    total_users = CustomUser.objects.count()
-    active_borrowers = CustomUser.objects.annotate(
-        borrow_count=Count('borrowed_items')
-    ).filter(borrow_count__gt=0).count()
-    
-    active_lenders = CustomUser.objects.annotate(
-        lend_count=Count('lent_items')
-    ).filter(lend_count__gt=0).count()
-    
-    summary_text = f"Total Users: {total_users} | Active Borrowers: {active_borrowers} | Active Lenders: {active_lenders}"
-    summary = Paragraph(summary_text, styles['Normal'])
-    elements.append(summary)
-    elements.append(Spacer(1, 0.3*inch))
-    
-    # Top borrowers
-    subtitle1 = Paragraph("Top Borrowers", styles['Heading2'])
-    elements.append(subtitle1)
-    elements.append(Spacer(1, 0.1*inch))
-    
-    top_borrowers = CustomUser.objects.annotate(
-        borrow_count=Count('borrowed_items')
-    ).filter(borrow_count__gt=0).order_by('-borrow_count')[:10]
-    
-    data1 = [['Rank', 'Username', 'Hostel', 'Items Borrowed', 'Phone']]
-    for idx, user in enumerate(top_borrowers, 1):
-        data1.append([
-            str(idx),
-            user.username,
-            user.hostel_name,
-            str(user.borrow_count),
-            user.phone_number
-        ])
-    
-    table1 = Table(data1, colWidths=[0.6*inch, 1.5*inch, 1.5*inch, 1.2*inch, 1.5*inch])
-    table1.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#4F46E5')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 11),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 1), (-1, -1), 9),
-    ]))
-    elements.append(table1)
-    elements.append(Spacer(1, 0.3*inch))
-    
-    # Top lenders
-    subtitle2 = Paragraph("Top Lenders", styles['Heading2'])
-    elements.append(subtitle2)
-    elements.append(Spacer(1, 0.1*inch))
-    
-    top_lenders = CustomUser.objects.annotate(
-        lend_count=Count('lent_items'),
-        items_listed=Count('item')
-    ).filter(lend_count__gt=0).order_by('-lend_count')[:10]
-    
-    data2 = [['Rank', 'Username', 'Hostel', 'Times Lent', 'Items Listed']]
-    for idx, user in enumerate(top_lenders, 1):
-        data2.append([
-            str(idx),
-            user.username,
-            user.hostel_name,
-            str(user.lend_count),
-            str(user.items_listed)
-        ])
-    
-    table2 = Table(data2, colWidths=[0.6*inch, 1.5*inch, 1.5*inch, 1.2*inch, 1.2*inch])
-    table2.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#4F46E5')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 11),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 1), (-1, -1), 9),
-    ]))
-    elements.append(table2)
-    
-    doc.build(elements)
-    return response
+    return report_cache.report_response(request, 'users_pdf')
 
 @staff_member_required
 def export_users_report_excel(request):
     """Generate Excel report of user activity"""
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    return report_cache.report_response(request, 'users_excel')
+
+@staff_member_required
+def export_rentals_stream_view(request):
+    """Stream rentals as CSV or NDJSON, filtered by request date, status and lender"""
+    form = RentalExportForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    
+    data = form.cleaned_data
+    rentals = exports.export_rentals(
+        start=data['start'], end=data['end'], statuses=data['status'], lender=data['lender']
     )
-    response['Content-Disposition'] = 'attachment; filename="users_activity_report.xlsx"'
-    
-    workbook = Workbook()
-    worksheet = workbook.active
-    worksheet.title = 'User Activity'
-    
-    header_fill = PatternFill(start_color='4F46E5', end_color='4F46E5', fill_type='solid')
-    header_font = Font(bold=True, color='FFFFFF', size=12)
-    
-    headers = ['ID', 'Username', 'Hostel', 'Room', 'Phone', 'Items Listed', 'Times Borrowed', 'Times Lent', 'Date Joined']
-    for col_num, header in enumerate(headers, 1):
-        cell = worksheet.cell(row=1, column=col_num)
-        cell.value = header
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = Alignment(horizontal='center', vertical='center')
-    
-    users = CustomUser.objects.annotate(
-        items_count=Count('item'),
-        borrow_count=Count('borrowed_items'),
-        lend_count=Count('lent_items')
-    ).order_by('-borrow_count', '-lend_count')
-    
-    for row_num, user in enumerate(users, 2):
-        worksheet.cell(row=row_num, column=1, value=user.pk)
-        worksheet.cell(row=row_num, column=2, value=user.username)
-        worksheet.cell(row=row_num, column=3, value=user.hostel_name)
-        worksheet.cell(row=row_num, column=4, value=user.room_number)
-        worksheet.cell(row=row_num, column=5, value=user.phone_number)
-        worksheet.cell(row=row_num, column=6, value=user.items_count)
-        worksheet.cell(row=row_num, column=7, value=user.borrow_count)
-        worksheet.cell(row=row_num, column=8, value=user.lend_count)
-        worksheet.cell(row=row_num, column=9, value=user.date_joined.strftime('%Y-%m-%d'))
-    
-    for col in range(1, len(headers) + 1):
-        worksheet.column_dimensions[get_column_letter(col)].width = 15
+    fmt = data['format']
+    filename = f"rentals_{timezone.now():%Y%m%d_%H%M%S}.{fmt}"
+    if data['gzip']:
+        filename += '.gz'
+        content_type = 'application/gzip'
+    else:
+        content_type = exports.CONTENT_TYPES[fmt]
     
-    workbook.save(response)
+    response = streaming_response(request, exports.stream_rentals(rentals, fmt, gzip=data['gzip']), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    # Keep proxies from buffering or re-compressing the stream
+    response['X-Accel-Buffering'] = 'no'
+    response['Cache-Control'] = 'no-store'
     return response
 
+@staff_member_required
+def export_delta_view(request, name):
+    """Stream rows changed since a watermark as NDJSON, ending with the next watermark"""
+    if name not in exports.DELTA_MODELS:
+        raise Http404("Unknown export")
+    form = DeltaExportForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    
+    since = form.cleaned_data['since']
+    until = exports.delta_until(since)
+    use_gzip = form.cleaned_data['gzip']
+    content_type = 'application/gzip' if use_gzip else exports.CONTENT_TYPES['ndjson']
+    response = streaming_response(request, exports.stream_delta(name, since, until, gzip=use_gzip), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{name}_delta.ndjson{".gz" if use_gzip else ""}"'
+    response['X-Delta-Watermark'] = until.isoformat()
+    response['X-Accel-Buffering'] = 'no'
+    response['Cache-Control'] = 'no-store'
+    return response
+
+@staff_member_required
+def export_reports_bundle_view(request):
+    """Download all six reports as one ZIP, built in parallel from one snapshot"""
+    response = streaming_response(request, bundle.export_bundle(), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="brorent_reports_{timezone.now():%Y%m%d_%H%M%S}.zip"'
+    response['X-Accel-Buffering'] = 'no'
+    response['Cache-Control'] = 'no-store'
+    return response
+
+def _report_job_payload(job):
+    return {
+        'id': job.pk,
+        'kind': job.kind,
+        'kind_display': job.get_kind_display(),
+        'status': job.status,
+        'progress': job.progress,
+        'error': job.error,
+        'status_url': reverse('report_job_status', args=[job.pk]),
+        'download_url': reverse('report_job_download', args=[job.pk]) if job.status == 'done' else None,
+    }
+
+@staff_member_required
+@require_POST
+def report_job_create_view(request, kind):
+    """Queue a report for background generation"""
+    if kind not in reports.REPORTS:
+        raise Http404("Unknown report")
+    job = jobs.enqueue(kind, request.user)
+    if request.accepts('text/html'):
+        messages.success(request, f"{job.get_kind_display()} is being generated. It will appear under Recent Report Jobs.")
+        return redirect('admin_reports')
+    return JsonResponse(_report_job_payload(job), status=202)
+
+@staff_member_required
+def report_job_status_view(request, pk):
+    job = get_object_or_404(ReportJob, pk=pk)
+    return JsonResponse(_report_job_payload(job))
+
+@staff_member_required
+def report_job_download_view(request, pk):
+    job = get_object_or_404(ReportJob, pk=pk, status='done')
+    filename, content_type, _ = reports.REPORTS[job.kind]
+    return file_response(request, job.artifact.open('rb'), as_attachment=True, filename=filename, content_type=content_type)
+
 @login_required(login_url='login')
 def notifications_list_view(request):
     notifications = Notification.objects.filter(user=request.user).order_by('-created_at')
     context = {
-        'notifications': notifications
+        'notifications': notifications,
+        'has_pending_requests': Rental.objects.filter(lender=request.user, status='pending').exists(),
     }
     return render(request, 'notifications.html', context)
 
+@login_required(login_url='login')
+async def notification_stream_view(request):
+    """Server-sent events stream of new notifications (serve through ASGI)"""
+    if not isinstance(request, ASGIRequest):
+        # An endless stream would hold a WSGI worker thread for good;
+        # 204 tells EventSource not to reconnect
+        return HttpResponse(status=204)
+    user = await request.auser()
+    # Reconnects resume from Last-Event-ID. A first connect starts from the
+    # newest notification now; anything created after this read is replayed
+    last_event_id = request.headers.get('Last-Event-ID', '')
+    if last_event_id.isdigit():
+        after = int(last_event_id)
+    else:
+        after = await Notification.objects.filter(user_id=user.pk).order_by('-pk').values_list('pk', flat=True).afirst() or 0
+    response = StreamingHttpResponse(stream_notifications(user.pk, after), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 @login_required(login_url='login')
 def notification_mark_read_view(request, pk):
     notification = get_object_or_404(Notification, pk=pk, user=request.user)
-    if not notification.read:
-        notification.read = True
-        notification.save()
+    # Conditional update so concurrent clicks only decrement the counter once
+    if not notification.read and Notification.objects.filter(pk=notification.pk, read=False).update(read=True, updated_at=timezone.now()):
+        decrement_unread(request.user.pk)
     next_url = request.GET.get('next')
     if next_url:
         return redirect(next_url)
@@ -834,60 +538,79 @@ def notification_mark_read_view(request, pk):
 @login_required(login_url='login')
 def rental_request_accept_view(request, pk):
     """Accept a rental request"""
-    rental = get_object_or_404(Rental, pk=pk)
-    
-    # Check if the current user is the lender (item owner)
-    if request.user != rental.lender:
-        messages.error(request, "You don't have permission to accept this request.")
+    get_object_or_404(Rental, pk=pk)
+    try:
+        rental = booking.accept_rental(pk, request.user)
+    except BookingError as exc:
+        messages.error(request, str(exc))
         return redirect('notifications')
     
-    # Check if the rental is still pending
-    if rental.status != 'pending':
-        messages.error(request, "This rental request has already been processed.")
-        return redirect('notifications')
-    
-    # Accept the rental request
-    rental.status = 'approved'
-    rental.approved_date = timezone.now()
-    rental.save()
-    
-    # Create notification for the borrower
-    Notification.objects.create(
-        user=rental.borrower,
-        rental=rental,
-        type='request_approved',
-        message=f"Your rental request for {rental.item.name} has been approved!"
-    )
-    
     messages.success(request, f"You have approved the rental request for {rental.item.name}.")
     return redirect('notifications')
 
 @login_required(login_url='login')
 def rental_request_reject_view(request, pk):
     """Reject a rental request"""
-    rental = get_object_or_404(Rental, pk=pk)
-    
-    # Check if the current user is the lender (item owner)
-    if request.user != rental.lender:
-        messages.error(request, "You don't have permission to reject this request.")
-        return redirect('notifications')
-    
-    # Check if the rental is still pending
-    if rental.status != 'pending':
-        messages.error(request, "This rental request has already been processed.")
+    get_object_or_404(Rental, pk=pk)
+    try:
+        rental = booking.reject_rental(pk, request.user)
+    except BookingError as exc:
+        messages.error(request, str(exc))
         return redirect('notifications')
     
-    # Reject the rental request
-    rental.status = 'rejected'
-    rental.save()
-    
-    # Create notification for the borrower
-    Notification.objects.create(
-        user=rental.borrower,
-        rental=rental,
-        type='request_rejected',
-        message=f"Your rental request for {rental.item.name} has been rejected."
-    )
-    
     messages.success(request, f"You have rejected the rental request for {rental.item.name}.")
-    return redirect('notifications')
\ No newline at end of file
+    return redirect('notifications')
+
+@login_required(login_url='login')
+@require_POST
+def rental_bulk_decision_view(request):
+    """Accept or reject the selected rental requests at once"""
+    action = request.POST.get('action')
+    rental_ids = [pk for pk in request.POST.getlist('rental_ids') if pk.isdigit()]
+    next_url = request.POST.get('next')
+    if not next_url or not url_has_allowed_host_and_scheme(next_url, {request.get_host()}, request.is_secure()):
+        next_url = reverse('user_lended_items')
+    if action not in ('accept', 'reject') or not rental_ids:
+        messages.error(request, "Select at least one request, then choose Accept or Reject.")
+        return redirect(next_url)
+    
+    if action == 'accept':
+        approved, clashing = booking.accept_rentals(rental_ids, request.user)
+        decided = approved + clashing
+        if approved:
+            messages.success(request, f"You have approved {len(approved)} rental request{pluralize(len(approved))}.")
+        if clashing:
+            names = ', '.join(rental.item.name for rental in clashing)
+            messages.error(request, f"Not approved because the dates overlap a rental you have already approved: {names}.")
+    else:
+        decided = booking.reject_rentals(rental_ids, request.user)
+        if decided:
+            messages.success(request, f"You have rejected {len(decided)} rental request{pluralize(len(decided))}.")
+    skipped = len(set(rental_ids)) - len(decided)
+    if skipped:
+        messages.warning(request, f"{skipped} request{pluralize(skipped)} had already been processed and {pluralize(skipped, 'was,were')} skipped.")
+    return redirect(next_url)
+
+@login_required(login_url='login')
+def rental_quote_view(request):
+    """Price one or more rental windows, e.g. for the request form's running total"""
+    try:
+        quote_forms = RentalQuoteForm.for_query(request.GET)
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    errors = {index: form.errors for index, form in enumerate(quote_forms) if not form.is_valid()}
+    if errors:
+        return JsonResponse({'errors': errors}, status=400)
+    
+    quotes = [(form.cleaned_data['item'], form.cleaned_data['start'], form.cleaned_data['end']) for form in quote_forms]
+    totals = pricing.quote_many(quotes)
+    return JsonResponse({'quotes': [
+        {
+            'item': item,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'days': pricing.rental_days(start, end),
+            'total': None if total is None else str(total),
+        }
+        for (item, start, end), total in zip(quotes, totals)
+    ]})
\ No newline at end of file
@@ -0,0 +1,180 @@
+"""
+Peak memory of the rentals Excel export as the rental count grows.
+
+Builds a throwaway database (the development db.sqlite3 is never touched),
+seeds it with rentals, and measures the traced Python heap while the
+rentals workbook is written to a file. It then downloads the same report
+end to end: a staff GET through Django's ASGI handler, as uvicorn serves
+it in production, with the body counted and dropped as it is sent. That
+covers the report cache, the spooled file and the streamed response.
+
+Usage:
+    python scripts/benchmark_excel_exports.py                # 1k, 10k, 100k, 1M
+    python scripts/benchmark_excel_exports.py 1000 20000     # custom sizes
+    python scripts/benchmark_excel_exports.py --compare      # also the old in-memory workbook
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'my_site.settings')
+import django
+django.setup()
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.test import Client
+from django.urls import reverse
+from openpyxl import Workbook
+
+from pages import reports
+from pages.models import CustomUser, Item, Rental
+from throwaway_db import throwaway_database
+
+BATCH_SIZE = 5000
+# The in-memory comparison is skipped above this size; it takes minutes and gigabytes
+COMPARE_LIMIT = 100_000
+
+
+def seed(total):
+    """Top the database up to ``total`` rentals spread over 200 users and 1000 items."""
+    if not CustomUser.objects.exists():
+        CustomUser.objects.bulk_create(
+            CustomUser(username=f'bench{i}', hostel_name='H', room_number=str(i), phone_number='0')
+            for i in range(200)
+        )
+        users = list(CustomUser.objects.all())
+        Item.objects.bulk_create(
+            Item(name=f'Item {i}', description='Benchmark item', price=Decimal('10.00'),
+                 owner=users[i % len(users)], category='others')
+            for i in range(1000)
+        )
+    users = list(CustomUser.objects.values_list('pk', flat=True))
+    items = list(Item.objects.values_list('pk', 'owner_id'))
+    statuses = [choice for choice, _ in Rental.STATUS_CHOICES]
+
+    existing = Rental.objects.count()
+    start = date(2024, 1, 1)
+    for offset in range(existing, total, BATCH_SIZE):
+        batch = []
+        for n in range(offset, min(offset + BATCH_SIZE, total)):
+            item_id, owner_id = items[n % len(items)]
+            day = start + timedelta(days=n % 600)
+            batch.append(Rental(
+                item_id=item_id, lender_id=owner_id, borrower_id=users[(n * 7) % len(users)],
+                status=statuses[n % len(statuses)], start_date=day, end_date=day + timedelta(days=2),
+                total_price=Decimal('30.00'),
+            ))
+        Rental.objects.bulk_create(batch)
+
+
+def streaming_export():
+    with tempfile.TemporaryFile() as output:
+        reports.write_rentals_excel(output)
+        return output.tell()
+
+
+def in_memory_export():
+    # What the export did before: a regular workbook holding every cell
+    workbook = Workbook()
+    worksheet = workbook.active
+    worksheet.append(reports.RENTAL_HEADERS)
+    for row in reports.rental_rows():
+        worksheet.append(row)
+    with tempfile.TemporaryFile() as output:
+        workbook.save(output)
+        return output.tell()
+
+
+async def asgi_get(path, session_key):
+    """GET ``path`` through the ASGI handler; returns (bytes sent, seconds to the first byte)."""
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+        'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+        'headers': [(b'host', b'localhost'), (b'cookie', f'{settings.SESSION_COOKIE_NAME}={session_key}'.encode())],
+        'server': ('localhost', 80), 'client': ('127.0.0.1', 50000),
+    }
+    requested = False
+    connected = asyncio.Event()
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        # The client stays connected until the response is complete
+        await connected.wait()
+
+    sent, first_byte = 0, None
+    started = time.perf_counter()
+
+    async def send(message):
+        nonlocal sent, first_byte
+        if message['type'] == 'http.response.start' and message['status'] != 200:
+            raise RuntimeError(f"GET {path} answered {message['status']}")
+        if message['type'] == 'http.response.body' and message.get('body'):
+            if first_byte is None:
+                first_byte = time.perf_counter() - started
+            sent += len(message['body'])
+
+    await ASGIHandler()(scope, receive, send)
+    return sent, first_byte
+
+
+def http_export(session_key):
+    # A fresh render each time, as after any change to the data
+    cache.clear()
+    return asyncio.run(asgi_get(reverse('export_rentals_excel'), session_key))
+
+
+def staff_session():
+    staff = CustomUser.objects.create_user('bench-staff', is_staff=True, hostel_name='H', room_number='0', phone_number='0')
+    client = Client()
+    client.force_login(staff)
+    return client.cookies[settings.SESSION_COOKIE_NAME].value
+
+
+def measure(export, *args):
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = export(*args)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, elapsed, result
+
+
+def main(argv):
+    compare = '--compare' in argv
+    sizes = [int(arg) for arg in argv if arg.isdigit()] or [1_000, 10_000, 100_000, 1_000_000]
+
+    with throwaway_database():
+        session_key = None
+        print(
+            f"{'rentals':>10}  {'file MB':>8}  {'peak MB':>8}  {'seconds':>8}  {'in-memory peak MB':>18}"
+            f"  {'sent MB':>8}  {'HTTP peak MB':>12}  {'first byte s':>12}  {'HTTP s':>8}"
+        )
+        for total in sorted(sizes):
+            seed(total)
+            # After the first seed, which only adds users to an empty table
+            session_key = session_key or staff_session()
+            peak, elapsed, size = measure(streaming_export)
+            legacy = '-'
+            if compare and total <= COMPARE_LIMIT:
+                legacy = f'{measure(in_memory_export)[0] / 2**20:.1f}'
+            http_peak, http_elapsed, (sent, first_byte) = measure(http_export, session_key)
+            print(
+                f'{total:>10}  {size / 2**20:>8.1f}  {peak / 2**20:>8.1f}  {elapsed:>8.1f}  {legacy:>18}'
+                f'  {sent / 2**20:>8.1f}  {http_peak / 2**20:>12.1f}  {first_byte:>12.1f}  {http_elapsed:>8.1f}'
+            )
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,104 @@
+"""
+Time and peak memory of the items PDF report as the item count grows.
+
+Builds a throwaway database (the development db.sqlite3 is never touched),
+seeds it with items, and measures wall time and the traced Python heap
+while the items PDF is written to a file. The two are taken on separate
+runs.
+
+Usage:
+    python scripts/benchmark_pdf_reports.py                # 10k, 50k, 100k
+    python scripts/benchmark_pdf_reports.py 1000 20000     # custom sizes
+    python scripts/benchmark_pdf_reports.py --compare      # also the old single-table layout
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'my_site.settings')
+import django
+django.setup()
+
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, Table
+
+from pages import pdf, reports
+from pages.models import CustomUser, Item
+from throwaway_db import throwaway_database
+
+BATCH_SIZE = 5000
+# The single-table comparison is skipped above this size; its layout time grows much faster than linearly
+COMPARE_LIMIT = 10_000
+COL_WIDTHS = [0.5*inch, 2*inch, 1.2*inch, 1.2*inch, 1*inch, 1*inch]
+
+
+def seed(total):
+    """Top the database up to ``total`` items spread over 200 owners."""
+    if not CustomUser.objects.exists():
+        CustomUser.objects.bulk_create(
+            CustomUser(username=f'bench{i}', hostel_name='H', room_number=str(i), phone_number='0')
+            for i in range(200)
+        )
+    users = list(CustomUser.objects.values_list('pk', flat=True))
+    categories = [choice for choice, _ in Item.CATEGORY_CHOICES]
+
+    existing = Item.objects.count()
+    for offset in range(existing, total, BATCH_SIZE):
+        Item.objects.bulk_create(
+            Item(name=f'Item {n}', description='Benchmark item', price=Decimal('10.00'),
+                 owner_id=users[n % len(users)], category=categories[n % len(categories)],
+                 per_day=n % 2 == 0, is_available=n % 3 != 0)
+            for n in range(offset, min(offset + BATCH_SIZE, total))
+        )
+
+
+def chunked_export():
+    with tempfile.TemporaryFile() as output:
+        reports.write_items_pdf(output)
+        return output.tell()
+
+
+def single_table_export():
+    # What the export did before: one Table holding every item
+    with tempfile.TemporaryFile() as output:
+        doc = SimpleDocTemplate(output, pagesize=letter)
+        data = [reports.ITEM_PDF_HEADERS] + list(reports.item_pdf_rows())
+        doc.build([Table(data, colWidths=COL_WIDTHS, style=pdf.table_style(12))])
+        return output.tell()
+
+
+def measure(export):
+    # Timed on its own: tracing allocations slows reportlab down several times over
+    started = time.perf_counter()
+    size = export()
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    export()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, elapsed, size
+
+
+def main(argv):
+    compare = '--compare' in argv
+    sizes = [int(arg) for arg in argv if arg.isdigit()] or [10_000, 50_000, 100_000]
+
+    with throwaway_database():
+        print(f"{'items':>10}  {'file MB':>8}  {'peak MB':>8}  {'seconds':>8}  {'single-table seconds':>21}")
+        for total in sorted(sizes):
+            seed(total)
+            peak, elapsed, size = measure(chunked_export)
+            legacy = '-'
+            if compare and total <= COMPARE_LIMIT:
+                legacy_peak, legacy_elapsed, _ = measure(single_table_export)
+                legacy = f'{legacy_elapsed:.1f} ({legacy_peak / 2**20:.0f} MB)'
+            print(f'{total:>10}  {size / 2**20:>8.1f}  {peak / 2**20:>8.1f}  {elapsed:>8.1f}  {legacy:>21}')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
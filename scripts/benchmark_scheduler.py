@@ -0,0 +1,87 @@
+"""
+Rental scheduler throughput: how long ``lifecycle.run_due()`` takes to start
+and remind a large backlog of due rentals, and how long a rerun with
+nothing left to do takes.
+
+Builds a throwaway database (the development db.sqlite3 is never touched),
+with half the rentals approved and starting today and half borrowed and
+due back tomorrow, spread over many borrowers and items.
+
+Usage:
+    python scripts/benchmark_scheduler.py              # 10k and 100k due rentals
+    python scripts/benchmark_scheduler.py 50000        # custom sizes
+"""
+import os
+import sys
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'my_site.settings')
+import django
+django.setup()
+
+from django.utils import timezone
+
+from pages import lifecycle, rollups
+from pages.models import CustomUser, Item, Notification, Rental, StatusDailyRollup
+from throwaway_db import throwaway_database
+
+USERS = 1000
+ITEMS = 2000
+
+
+def seed(size):
+    """Replace all rentals with ``size`` due ones."""
+    if not CustomUser.objects.exists():
+        CustomUser.objects.bulk_create(
+            CustomUser(username=f'bench{i}', hostel_name='H', room_number=str(i), phone_number='0')
+            for i in range(USERS)
+        )
+        users = list(CustomUser.objects.values_list('pk', flat=True))
+        Item.objects.bulk_create(
+            Item(name=f'Item {n}', description='Benchmark item', price=Decimal('10.00'), owner_id=users[n % USERS])
+            for n in range(ITEMS)
+        )
+    Notification.objects.all().delete()
+    Rental.objects.all().delete()
+    StatusDailyRollup.objects.all().delete()
+
+    users = list(CustomUser.objects.values_list('pk', flat=True))
+    items = list(Item.objects.values_list('pk', 'owner_id'))
+    today = timezone.localdate()
+    Rental.objects.bulk_create(
+        (
+            Rental(
+                item_id=items[n % ITEMS][0], lender_id=items[n % ITEMS][1], borrower_id=users[(n * 7) % USERS],
+                status='approved' if n % 2 else 'borrowed',
+                start_date=today if n % 2 else today - timedelta(days=3),
+                end_date=today + timedelta(days=5 if n % 2 else 1),
+                total_price=Decimal('10.00'),
+            )
+            for n in range(size)
+        ),
+        batch_size=5000,
+    )
+    rollups.rebuild()
+
+
+def main(argv):
+    sizes = [int(arg) for arg in argv if arg.isdigit()] or [10_000, 100_000]
+
+    with throwaway_database():
+        print(f"{'due':>8}  {'started':>8}  {'reminded':>8}  {'run s':>7}  {'rerun s':>7}")
+        for size in sorted(sizes):
+            seed(size)
+            started = time.perf_counter()
+            done = lifecycle.run_due()
+            elapsed = time.perf_counter() - started
+            started = time.perf_counter()
+            lifecycle.run_due()
+            rerun = time.perf_counter() - started
+            print(f"{size:>8}  {done['started']:>8}  {done['reminded']:>8}  {elapsed:>7.2f}  {rerun:>7.3f}")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,98 @@
+"""
+Users activity report query: per-user subquery counts against the old
+three-way join, on a database where a few users own many items and rentals.
+
+Builds a throwaway database (the development db.sqlite3 is never touched),
+gives every heavy user the same number of items, borrowings and lendings,
+and times both forms of ``reports.user_activity()``. The join multiplies
+items x borrowings x lendings per user, so it also reports inflated counts.
+
+Usage:
+    python scripts/benchmark_user_report.py              # 50, 100, 200 rentals per heavy user
+    python scripts/benchmark_user_report.py 20 400       # custom sizes
+"""
+import os
+import sys
+import time
+from datetime import date
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'my_site.settings')
+import django
+django.setup()
+
+from django.db.models import Count
+
+from pages import reports
+from pages.models import CustomUser, Item, Rental
+from throwaway_db import throwaway_database
+
+HEAVY_USERS = 10
+LIGHT_USERS = 1000
+ITEMS_PER_USER = 20
+
+
+def seed(rentals_per_user):
+    """Top every heavy user up to ``rentals_per_user`` borrowings and as many lendings."""
+    if not CustomUser.objects.exists():
+        CustomUser.objects.bulk_create(
+            CustomUser(username=f'bench{i}', hostel_name='H', room_number=str(i), phone_number='0')
+            for i in range(HEAVY_USERS + LIGHT_USERS)
+        )
+        heavy = list(CustomUser.objects.order_by('pk')[:HEAVY_USERS])
+        Item.objects.bulk_create(
+            Item(name=f'Item {n}', description='Benchmark item', price=Decimal('10.00'), owner=user)
+            for user in heavy
+            for n in range(ITEMS_PER_USER)
+        )
+    heavy = list(CustomUser.objects.order_by('pk').values_list('pk', flat=True)[:HEAVY_USERS])
+    items = {}
+    for pk, owner_id in Item.objects.values_list('pk', 'owner_id'):
+        items.setdefault(owner_id, []).append(pk)
+
+    existing = Rental.objects.count() // HEAVY_USERS
+    day = date(2024, 1, 1)
+    batch = []
+    for n in range(existing, rentals_per_user):
+        for index, lender in enumerate(heavy):
+            # Each heavy user lends to the next one, so each also borrows the same amount
+            borrower = heavy[(index + 1) % len(heavy)]
+            batch.append(Rental(
+                item_id=items[lender][n % ITEMS_PER_USER], lender_id=lender, borrower_id=borrower,
+                start_date=day, end_date=day, total_price=Decimal('10.00'),
+            ))
+    Rental.objects.bulk_create(batch, batch_size=5000)
+
+
+def joined_activity():
+    # What the report did before: three counts over one joined query
+    return CustomUser.objects.annotate(
+        items_count=Count('item'),
+        borrow_count=Count('borrowed_items'),
+        lend_count=Count('lent_items')
+    ).order_by('-borrow_count', '-lend_count')
+
+
+def measure(queryset):
+    started = time.perf_counter()
+    users = list(queryset)
+    elapsed = time.perf_counter() - started
+    top = users[0]
+    return elapsed, (top.items_count, top.borrow_count, top.lend_count)
+
+
+def main(argv):
+    sizes = [int(arg) for arg in argv if arg.isdigit()] or [50, 100, 200]
+
+    with throwaway_database():
+        print(f"{'rentals/user':>12}  {'subquery s':>10}  {'counts':>15}  {'join s':>8}  {'join counts':>20}")
+        for size in sorted(sizes):
+            seed(size)
+            elapsed, counts = measure(reports.user_activity())
+            joined_elapsed, joined_counts = measure(joined_activity())
+            print(f'{size:>12}  {elapsed:>10.3f}  {str(counts):>15}  {joined_elapsed:>8.2f}  {str(joined_counts):>20}')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,26 @@
+"""
+Throwaway database for the benchmark scripts.
+
+``throwaway_database()`` creates a fresh SQLite database with every
+migration applied in a temporary directory, points the default connection
+at it, and destroys it again on exit, so the development db.sqlite3 is
+never touched. Use it after ``django.setup()``.
+"""
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from django.db import connection
+
+
+@contextmanager
+def throwaway_database():
+    db_dir = tempfile.mkdtemp()
+    connection.settings_dict['TEST']['NAME'] = os.path.join(db_dir, 'bench.sqlite3')
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        shutil.rmtree(db_dir, ignore_errors=True)